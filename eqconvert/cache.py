@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import os.path
+import hashlib
+import pickle
+import zlib
+import tempfile
+import sqlite3
+import time
+import threading
+
+#default location of cached event lists
+CACHEDIR = os.path.join(os.path.expanduser('~'),'.eqconvert','cache')
+#default maximum total size of cache files (bytes)
+MAXSIZE = 2*1024**3
+#increment this whenever the structure of parsed events changes, to invalidate old cache files
+CACHE_VERSION = 1
+CACHE_EXT = '.pkz'
+BLOCKSIZE = 1024**2
+#default SQLite file of ComCat magnitude lookups
+MAGCACHE = os.path.join(os.path.expanduser('~'),'.eqconvert','comcat_magnitudes.db')
+#default SQLite file of CWB station lookups
+STATIONCACHE = os.path.join(os.path.expanduser('~'),'.eqconvert','stations.db')
+#kinds of station lookups stored in a StationCache
+STATION_KINDS = ['nscl','epochs','location']
+#default maximum age (seconds) of cached station lookups that found nothing
+NEGATIVE_TTL = 86400
+#parser arguments that do not change the parsed events, and so are not part of CatalogCache keys
+NEUTRAL_ARGS = ['stationworkers','chunksize']
+
+class CatalogCache(object):
+    """Persistent on-disk cache of parsed event lists.
+
+    Event lists are stored as compressed pickle files, named by a hash of the input file path, 
+    size, modification time and contents (plus the parser and its arguments), so that a changed 
+    input file is always re-parsed.  When the total size of the cache exceeds maxsize, the 
+    least recently used files are removed.
+
+    Parser arguments that change the parsed events are part of the key.  Objects (magnitude 
+    caches, ComCat exports, station inventories) are represented by the string returned by 
+    their get_cache_key() method, which describes their files and settings, and other values 
+    by repr().
+    """
+    def __init__(self,cachedir=None,maxsize=MAXSIZE):
+        """Create a cache object.
+
+        :param cachedir:
+          Folder where cache files are stored (created if necessary), or None to use CACHEDIR.
+        :param maxsize:
+          Maximum total size of cache files in bytes.
+        """
+        if cachedir is None:
+            cachedir = CACHEDIR
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+
+    def get_events(self,module,filename,contributor=None,catalog=None,**kwargs):
+        """Return events from cache, or parse input file and cache the results.
+
+        :param module:
+          eqconvert format module (ndk, mloc, iscgem) used to parse the file.
+        :param filename:
+          Input data file.
+        :param contributor:
+          Source network of whoever is parsing this file.
+        :param catalog:
+          Source network of whoever created the data.
+        :param kwargs:
+          Additional keyword arguments for module.get_events(), which are part of the cache key 
+          unless they are in NEUTRAL_ARGS.
+        :returns:
+          List of event dictionaries (see module.get_events()).
+        """
+        key = self.get_key(module.__name__,filename,contributor,catalog,parser_args=kwargs)
+        events = self.load(key)
+        if events is None:
+            events = module.get_events(filename,contributor=contributor,catalog=catalog,**kwargs)
+            self.save(key,events)
+        return events
+
+    def get_key(self,parser,filename,contributor,catalog,parser_args=None):
+        """Return the cache key for an input file.
+
+        :param parser:
+          Name of parser (module name).
+        :param filename:
+          Input data file.
+        :param contributor:
+          Contributor passed to parser.
+        :param catalog:
+          Catalog passed to parser.
+        :param parser_args:
+          Dictionary of additional keyword arguments passed to parser, or None.
+        :returns:
+          Hexadecimal string key.
+        """
+        stat = os.stat(filename)
+        content = hashlib.sha1()
+        with open(filename,'rb') as f:
+            while True:
+                block = f.read(BLOCKSIZE)
+                if not block:
+                    break
+                content.update(block)
+        keystr = '%i|%s|%s|%i|%r|%s|%s|%s' % (CACHE_VERSION,parser,os.path.abspath(filename),
+                                              stat.st_size,stat.st_mtime,content.hexdigest(),
+                                              contributor,catalog)
+        if parser_args:
+            for name in sorted(parser_args.keys()):
+                if name not in NEUTRAL_ARGS:
+                    keystr += '|%s=%s' % (name,_get_arg_key(parser_args[name]))
+        return hashlib.sha1(keystr.encode('utf-8')).hexdigest()
+
+    def load(self,key):
+        """Load event list from cache.
+
+        :param key:
+          Key returned by get_key().
+        :returns:
+          List of event dictionaries, or None if key is not in cache.
+        """
+        fname = os.path.join(self.cachedir,key+CACHE_EXT)
+        try:
+            f = open(fname,'rb')
+            data = f.read()
+            f.close()
+            events = pickle.loads(zlib.decompress(data))
+        except Exception:
+            return None
+        #update modification time, which marks this as most recently used
+        os.utime(fname,None)
+        return events
+
+    def save(self,key,events):
+        """Save event list to cache, evicting least recently used files if cache is too large.
+
+        :param key:
+          Key returned by get_key().
+        :param events:
+          List of event dictionaries.
+        """
+        data = zlib.compress(pickle.dumps(events,protocol=pickle.HIGHEST_PROTOCOL))
+        if len(data) > self.maxsize:
+            return
+        #write to a temporary file first so that other processes never see a partial file
+        handle,tmpname = tempfile.mkstemp(dir=self.cachedir)
+        f = os.fdopen(handle,'wb')
+        f.write(data)
+        f.close()
+        os.replace(tmpname,os.path.join(self.cachedir,key+CACHE_EXT))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used files until the total size of the cache is below maxsize.
+        """
+        files = []
+        totalsize = 0
+        for fname in os.listdir(self.cachedir):
+            if not fname.endswith(CACHE_EXT):
+                continue
+            fullname = os.path.join(self.cachedir,fname)
+            try:
+                stat = os.stat(fullname)
+            except OSError:
+                continue
+            files.append((stat.st_mtime,stat.st_size,fullname))
+            totalsize += stat.st_size
+        for mtime,size,fullname in sorted(files):
+            if totalsize <= self.maxsize:
+                break
+            try:
+                os.remove(fullname)
+            except OSError:
+                pass
+            totalsize -= size
+
+    def clear(self):
+        """Remove all files from the cache.
+        """
+        for fname in os.listdir(self.cachedir):
+            if fname.endswith(CACHE_EXT):
+                os.remove(os.path.join(self.cachedir,fname))
+
+class MagnitudeCache(object):
+    """Persistent SQLite cache of ComCat preferred magnitude lookups.
+
+    Lookup results (including "no match" results) are stored by the search parameters: origin 
+    time rounded to the second, latitude and longitude rounded to 4 decimal places, search radius 
+    and search time window.  Results older than ttl seconds are ignored.  In offline mode, callers 
+    should use only cached results and never search ComCat.
+    """
+    def __init__(self,dbfile=None,ttl=None,offline=False):
+        """Create a cache object.
+
+        :param dbfile:
+          SQLite database file (created if necessary), or None to use MAGCACHE.
+        :param ttl:
+          Maximum age of cached results in seconds, or None if results never expire.
+        :param offline:
+          Boolean indicating that ComCat should never be searched.
+        """
+        if dbfile is None:
+            dbfile = MAGCACHE
+        self.dbfile = dbfile
+        self.ttl = ttl
+        self.offline = offline
+        self.connection = None
+        dbdir = os.path.dirname(os.path.abspath(dbfile))
+        if not os.path.isdir(dbdir):
+            os.makedirs(dbdir)
+        self._connect()
+
+    def __getstate__(self):
+        #SQLite connections cannot be pickled, so worker processes open their own
+        state = self.__dict__.copy()
+        state['connection'] = None
+        return state
+
+    def get_cache_key(self):
+        """Return a string identifying this cache and its settings, used in CatalogCache keys.
+        """
+        return 'MagnitudeCache(%s,ttl=%r,offline=%r)' % (os.path.abspath(self.dbfile),self.ttl,self.offline)
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.dbfile,timeout=60)
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS magnitudes
+                                       (time TEXT, lat TEXT, lon TEXT, radius REAL, window REAL,
+                                        prefmag REAL, prefsource TEXT, preftype TEXT, created REAL,
+                                        PRIMARY KEY (time,lat,lon,radius,window))''')
+            self.connection.commit()
+        return self.connection
+
+    def get(self,key):
+        """Return cached lookup result.
+
+        :param key:
+          Tuple of (time string,latitude string,longitude string,radius,time window).
+        :returns:
+          Tuple of (magnitude value,magnitude source,magnitude type), which may be all None if 
+          the search found no match, or None if key is not in cache or has expired.
+        """
+        cursor = self._connect().execute('''SELECT prefmag,prefsource,preftype,created FROM magnitudes
+                                             WHERE time=? AND lat=? AND lon=? AND radius=? AND window=?''',key)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        if self.ttl is not None and row[3] + self.ttl < time.time():
+            return None
+        return tuple(row[0:3])
+
+    def put(self,key,result):
+        """Save lookup result to cache.
+
+        :param key:
+          Tuple of (time string,latitude string,longitude string,radius,time window).
+        :param result:
+          Tuple of (magnitude value,magnitude source,magnitude type), which may be all None.
+        """
+        connection = self._connect()
+        connection.execute('INSERT OR REPLACE INTO magnitudes VALUES (?,?,?,?,?,?,?,?,?)',
+                           tuple(key)+tuple(result)+(time.time(),))
+        connection.commit()
+
+    def clear(self):
+        """Remove all results from the cache.
+        """
+        connection = self._connect()
+        connection.execute('DELETE FROM magnitudes')
+        connection.commit()
+
+    def close(self):
+        """Close the database connection.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+class StationCache(object):
+    """Persistent SQLite cache of CWB station lookups (see eqconvert.stationdb.StationTranslator).
+
+    Each result is stored as a string, by the kind of lookup (one of STATION_KINDS: 'nscl' for 
+    NSCL codes of station/phase types, 'epochs' for station epochs, 'location' for stations found 
+    by location), a key, and the station code, so that all results for a station can be removed.  
+    Results older than ttl seconds are ignored, as are results of lookups that found nothing 
+    (which may be found after the station metadata is updated) older than negative_ttl seconds.  
+    The cache can be shared by threads and processes.
+    """
+    def __init__(self,dbfile=None,ttl=None,negative_ttl=NEGATIVE_TTL):
+        """Create a cache object.
+
+        :param dbfile:
+          SQLite database file (created if necessary), or None to use STATIONCACHE.
+        :param ttl:
+          Maximum age of cached results in seconds, or None if results never expire.
+        :param negative_ttl:
+          Maximum age in seconds of cached results of lookups that found nothing, or None to 
+          use ttl.
+        """
+        if dbfile is None:
+            dbfile = STATIONCACHE
+        self.dbfile = dbfile
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.connection = None
+        self.lock = threading.Lock()
+        dbdir = os.path.dirname(os.path.abspath(dbfile))
+        if not os.path.isdir(dbdir):
+            os.makedirs(dbdir)
+        self._connect()
+
+    def __getstate__(self):
+        #SQLite connections and locks cannot be pickled, so worker processes make their own
+        state = self.__dict__.copy()
+        state['connection'] = None
+        state['lock'] = None
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.dbfile,timeout=60,check_same_thread=False)
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS stations
+                                       (kind TEXT, key TEXT, station TEXT, value TEXT, created REAL,
+                                        found INTEGER DEFAULT 1, PRIMARY KEY (kind,key))''')
+            #caches made before negative results were marked only have found results
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(stations)')]
+            if 'found' not in columns:
+                self.connection.execute('ALTER TABLE stations ADD COLUMN found INTEGER DEFAULT 1')
+            self.connection.commit()
+        return self.connection
+
+    def get(self,kind,key):
+        """Return cached lookup result.
+
+        :param kind:
+          Kind of lookup (one of STATION_KINDS).
+        :param key:
+          Lookup key string.
+        :returns:
+          Result string, or None if key is not in cache or has expired.
+        """
+        with self.lock:
+            cursor = self._connect().execute('SELECT value,created,found FROM stations WHERE kind=? AND key=?',
+                                             (kind,key))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        value,created,found = row
+        ttl = self.ttl
+        if not found and self.negative_ttl is not None:
+            ttl = self.negative_ttl
+        if ttl is not None and created + ttl < time.time():
+            return None
+        return value
+
+    def put(self,kind,key,station,value,found=True):
+        """Save lookup result to cache.
+
+        :param kind:
+          Kind of lookup (one of STATION_KINDS).
+        :param key:
+          Lookup key string.
+        :param station:
+          Station code the lookup was made for.
+        :param value:
+          Result string.
+        :param found:
+          False if the lookup found nothing (so that the result expires after negative_ttl seconds).
+        """
+        with self.lock:
+            connection = self._connect()
+            connection.execute('INSERT OR REPLACE INTO stations VALUES (?,?,?,?,?,?)',
+                               (kind,key,station,value,time.time(),int(found)))
+            connection.commit()
+
+    def clear(self,station=None,kind=None,age=None):
+        """Remove results from the cache.
+
+        :param station:
+          Station code whose results should be removed, or None for all stations.
+        :param kind:
+          Kind of lookup (one of STATION_KINDS) to remove, or None for all kinds.
+        :param age:
+          Only remove results older than this many seconds, or None to remove results of any age.
+        :returns:
+          Number of results removed.
+        """
+        conditions = []
+        values = []
+        if station is not None:
+            conditions.append('station=?')
+            values.append(station)
+        if kind is not None:
+            conditions.append('kind=?')
+            values.append(kind)
+        if age is not None:
+            conditions.append('created<?')
+            values.append(time.time()-age)
+        query = 'DELETE FROM stations'
+        if len(conditions):
+            query += ' WHERE ' + ' AND '.join(conditions)
+        with self.lock:
+            connection = self._connect()
+            cursor = connection.execute(query,values)
+            connection.commit()
+        return cursor.rowcount
+
+    def count(self):
+        """Return a dictionary of the number of cached results of each kind.
+        """
+        with self.lock:
+            rows = self._connect().execute('SELECT kind,COUNT(*) FROM stations GROUP BY kind').fetchall()
+        return dict(rows)
+
+    def close(self):
+        """Close the database connection.
+        """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+def get_file_key(filename):
+    """Return a string identifying a file and its version (size and modification time), used in CatalogCache keys.
+
+    :param filename:
+      Any file.
+    :returns:
+      String containing absolute path, size and modification time of file.
+    """
+    stat = os.stat(filename)
+    return '%s,size=%i,mtime=%r' % (os.path.abspath(filename),stat.st_size,stat.st_mtime)
+
+def _get_arg_key(value):
+    """Internal function to return the string representing a parser argument in CatalogCache keys.
+    """
+    if hasattr(value,'get_cache_key'):
+        return value.get_cache_key()
+    return repr(value)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import json
+import os.path
+
+#third party imports
+import numpy as np
+import pandas as pd
+
+#local imports
+from .cache import get_file_key
+
+EARTH_RADIUS = 6371.0 #km
+GEOJSON_EXTS = ['.json','.geojson']
+
+class ComCatIndex(object):
+    """Time sorted, columnar index of a ComCat event export, searched in place of the ComCat FDSN event service.
+
+    Events are held in NumPy arrays sorted by origin time, so a search is a binary search on time
+    followed by a distance check of the (few) events inside the time window.  Exports can be in
+    GeoJSON format (as returned by a ComCat search with format=geojson) or CSV format (format=csv).
+    GeoJSON exports take the magnitude source from the first entry of the "sources" property, as
+    ComCat searches do.  CSV exports have no "sources" column, so the "net" column is used instead.
+    """
+    def __init__(self,filename):
+        """Load a ComCat export file.
+
+        :param filename:
+          GeoJSON (.json/.geojson) or CSV ComCat export file.
+        """
+        self.filename = filename
+        ext = os.path.splitext(filename)[1].lower()
+        if ext in GEOJSON_EXTS:
+            times,lats,lons,mags,magtypes,sources = _read_geojson(filename)
+        else:
+            times,lats,lons,mags,magtypes,sources = _read_csv(filename)
+        isort = np.argsort(times,kind='mergesort')
+        self.times = times[isort]
+        self.lats = lats[isort]
+        self.lons = lons[isort]
+        self.mags = mags[isort]
+        self.magtypes = magtypes[isort]
+        self.sources = sources[isort]
+
+    def __len__(self):
+        return len(self.times)
+
+    def get_cache_key(self):
+        """Return a string identifying this export file, used in CatalogCache keys.
+        """
+        return 'ComCatIndex(%s)' % get_file_key(self.filename)
+
+    def search(self,starttime,endtime,lat,lon,radius):
+        """Return the events inside a time window and within a distance of a point.
+
+        :param starttime:
+          Start of time window, in milliseconds since the epoch (inclusive).
+        :param endtime:
+          End of time window, in milliseconds since the epoch (inclusive).
+        :param lat:
+          Latitude of search center.
+        :param lon:
+          Longitude of search center.
+        :param radius:
+          Search radius (km).
+        :returns:
+          List of matching events as GeoJSON feature dictionaries, in the same form as those
+          returned by a ComCat search (properties time, mag, magType and sources, and coordinates).
+        """
+        i1 = np.searchsorted(self.times,starttime,side='left')
+        i2 = np.searchsorted(self.times,endtime,side='right')
+        if i1 == i2:
+            return []
+        dist = _get_distances(lat,lon,self.lats[i1:i2],self.lons[i1:i2])
+        features = []
+        for i in np.nonzero(dist <= radius)[0]+i1:
+            features.append({'type':'Feature',
+                             'properties':{'time':int(self.times[i]),
+                                           'mag':_get_value(self.mags[i]),
+                                           'magType':self.magtypes[i],
+                                           'sources':',%s,' % self.sources[i]},
+                             'geometry':{'type':'Point',
+                                         'coordinates':[float(self.lons[i]),float(self.lats[i])]}})
+        return features
+
+def _read_geojson(filename):
+    """Internal function to return column arrays from a GeoJSON ComCat export.
+    """
+    with open(filename,'rt') as f:
+        jdict = json.load(f)
+    features = jdict.get('features',[])
+    nevents = len(features)
+    times = np.zeros(nevents,dtype=np.int64)
+    lats = np.zeros(nevents)
+    lons = np.zeros(nevents)
+    mags = np.zeros(nevents)
+    magtypes = np.empty(nevents,dtype=object)
+    sources = np.empty(nevents,dtype=object)
+    for i,feature in enumerate(features):
+        properties = feature['properties']
+        lons[i],lats[i] = feature['geometry']['coordinates'][0:2]
+        times[i] = properties['time']
+        mags[i] = np.nan if properties['mag'] is None else properties['mag']
+        magtypes[i] = properties['magType']
+        sources[i] = properties['sources'].split(',')[1]
+    return (times,lats,lons,mags,magtypes,sources)
+
+def _read_csv(filename):
+    """Internal function to return column arrays from a CSV ComCat export.
+    """
+    df = pd.read_csv(filename,usecols=['time','latitude','longitude','mag','magType','net'],
+                     dtype={'magType':object,'net':object})
+    times = pd.to_datetime(df['time'],utc=True).values.astype('datetime64[ms]').astype(np.int64)
+    magtypes = df['magType'].values.astype(object)
+    magtypes[pd.isnull(magtypes)] = None
+    return (times,df['latitude'].values.astype(np.float64),df['longitude'].values.astype(np.float64),
+            df['mag'].values.astype(np.float64),magtypes,df['net'].values.astype(object))
+
+def _get_distances(lat,lon,lats,lons):
+    """Internal function to return the great circle distances (km) between a point and arrays of points.
+    """
+    lat,lon = np.radians(lat),np.radians(lon)
+    lats,lons = np.radians(lats),np.radians(lons)
+    a = np.sin((lats-lat)/2)**2 + np.cos(lat)*np.cos(lats)*np.sin((lons-lon)/2)**2
+    return 2*EARTH_RADIUS*np.arcsin(np.minimum(1.0,np.sqrt(a)))
+
+def _get_value(mag):
+    """Internal function to return a magnitude as a Python float, or None if it is missing.
+    """
+    if np.isnan(mag):
+        return None
+    return float(mag)
@@ -23,6 +23,7 @@ from neicio.tag import Tag
 
 #constants
 TIMEFMT = '%Y-%m-%dT%H:%M:%S'
+SERIALIZERS = ['tag','string']
 
 def write_quakeml(xmlstr,eventid,outfolder,filetype=None):
     """Write a QuakeML string to a file, return name of file.
@@ -63,6 +64,89 @@ def write_quakeml(xmlstr,eventid,outfolder,filetype=None):
     f.close()
     return fname
 
+def write_quakeml_documents(events,outfolder,basename,maxevents=None):
+    """Stream any number of events into one or more multi-event QuakeML files, return names of files.
+
+    Each event is rendered (using the string serializer) and written to disk as soon as it is 
+    pulled from the input sequence, so events can be supplied by a generator and memory use 
+    does not depend on the number of events.
+
+    Given the following inputs:
+    outfolder = '/home/user/quakeml'
+    basename = 'gcmt'
+    
+    the program will write all events to:
+    /home/user/quakeml/gcmt.xml
+
+    Given the following inputs:
+    outfolder = '/home/user/quakeml'
+    basename = 'gcmt'
+    maxevents = 1000
+
+    the program will write the first 1000 events to /home/user/quakeml/gcmt_0001.xml, the 
+    next 1000 to /home/user/quakeml/gcmt_0002.xml, and so on.
+
+    :param events:
+      Sequence (or iterator) of event dictionaries (see create_quakeml()).
+    :param outfolder:
+      Folder where QuakeML files should be written.
+    :param basename:
+      File name (without extension) of output files, also used as the eventParameters ID.
+    :param maxevents:
+      Maximum number of events to write to each file, or None to write all events to one file.
+    :returns:
+      Tuple of (list of output file names, number of events written).
+    """
+    rendered = ((event['contributor'],render_event(event)) for event in events)
+    return _write_rendered_documents(rendered,outfolder,basename,maxevents=maxevents)
+
+def _write_rendered_documents(rendered,outfolder,basename,maxevents=None):
+    """Internal function to stream already rendered event elements into multi-event QuakeML files.
+
+    :param rendered:
+      Sequence (or iterator) of (contributor,event element string) tuples.
+    :param outfolder:
+      Folder where QuakeML files should be written.
+    :param basename:
+      File name (without extension) of output files, also used as the eventParameters ID.
+    :param maxevents:
+      Maximum number of events to write to each file, or None to write all events to one file.
+    :returns:
+      Tuple of (list of output file names, number of events written).
+    """
+    fnames = []
+    nevents = 0
+    f = None
+    ndocevents = 0
+    try:
+        for contributor,xmlstr in rendered:
+            if f is not None and maxevents is not None and ndocevents >= maxevents:
+                _end_quakeml_document(f)
+                f = None
+            if f is None:
+                if maxevents is None:
+                    docid = basename
+                else:
+                    docid = '%s_%04i' % (basename,len(fnames)+1)
+                fname = os.path.join(outfolder,'%s.xml' % docid)
+                f = open(fname,'wt')
+                f.write(QUAKEML_START)
+                f.write(EVENTPARAMS_START % (contributor,docid))
+                fnames.append(fname)
+                ndocevents = 0
+            f.write(xmlstr)
+            ndocevents += 1
+            nevents += 1
+    finally:
+        if f is not None:
+            _end_quakeml_document(f)
+    return (fnames,nevents)
+
+def _end_quakeml_document(f):
+    f.write(EVENTPARAMS_END)
+    f.write(QUAKEML_END)
+    f.close()
+
 def write_csv(event):
     """Given an earthquake event dictionary, return a CSV string containing ID, time, lat, lon, depth, magnitude.
 
@@ -120,7 +204,7 @@ def write_csv(event):
                                                                             mag=mag)
     return csvstr
 
-def create_quakeml(event):
+def create_quakeml(event,serializer='tag'):
     """Given an earthquake event dictionary, return an XML string containing QuakeML representing that earthquake information.
 
     :param event:
@@ -151,7 +235,7 @@ def create_quakeml(event):
            - mindist Minimum distance.
          - evalmode Evaluation mode ('manual','automatic') [OPTIONAL]
          - evalstatus Evaluation status ('preliminary','confirmed','reviewed','final','rejected') [OPTIONAL]
-         - phases Sequence of phase dictionaries, containing: [OPTIONAL]
+         - phases Sequence of phase dictionaries, or an eqconvert.phases.PhaseTable, containing: [OPTIONAL]
              - id Unique string (usually a timestamp).
              - name Phase name.
              - distance Distance of station to epicenter.
@@ -215,20 +299,19 @@ def create_quakeml(event):
          - mantle Dictionary of mantle wave information containing: [OPTIONAL]
            - numchannels Number of mantle wave channels. [MANDATORY]
            - numstations Number of mantle wave stations. [MANDATORY]
+    :param serializer:
+      One of 'tag' (build a neicio Tag tree and render it) or 'string' (write QuakeML fragments 
+      directly into a string buffer), which is much faster.  Both produce equivalent QuakeML (the 
+      same elements, attributes and values), but the text may differ in details such as attribute 
+      order and how empty elements are written, so compare parsed documents rather than strings.
     :returns:
       QuakeML string.
     """
-    event_required = set(['id','catalog','contributor','origins','magnitudes'])
-    origin_required = set(['time','lat','lon','depth','preferred'])
-    mag_required = set(['value','type','preferred'])
-    focal_required = set(['np1','np2','taxis','naxis','paxis','method'])
-    moment_required = set(['m0','mrr','mpp','mtt','mrt','mtp','mrp'])
-    
-    event_keys = set(list(event.keys()))
-    if not event_required <= event_keys:
-        raise Exception('Missing required event keys: %s' %  (event_required & event_keys))
-
-    origin_required = set(['time','lat','lon','depth','preferred'])
+    if serializer not in SERIALIZERS:
+        raise Exception('Unknown QuakeML serializer "%s", must be one of %s' % (serializer,str(SERIALIZERS)))
+    preforg,prefmag = _validate_event(event)
+    if serializer == 'string':
+        return _render_quakeml(event,preforg,prefmag)
     
     quakeml_tag = Tag('q:quakeml',attributes={'xmlns':"http://quakeml.org/xmlns/bed/1.2",
                                                'xmlns:catalog':"http://anss.org/xmlns/catalog/0.1",
@@ -242,52 +325,20 @@ def create_quakeml(event):
                                         'publicID':"quakeml:%s.anss.org/event/%s" % (event['catalog'],event['id'])})
 
     #magnitude stuff
-    prefmag = None
     for magnitude in event['magnitudes']:
-        if prefmag is not None and magnitude['preferred']:
-            raise Exception('Cannot specify multiple preferred magnitudes!')
-            
-        if magnitude['preferred']:
-            prefmag = 'quakeml:us.anss.org/magnitude/%s/%s' % (magnitude['author'],magnitude['type'])
-        #check for missing keys
-        mag_keys = set(list(magnitude.keys()))
-        if not mag_required <= mag_keys:
-            raise Exception('Missing required magnitude keys: %s' %  (mag_required & mag_keys))
-        
         magnitude_tag = _create_mag_tag(magnitude,event['id'])
         event_tag.addChild(magnitude_tag)
 
     #deal with origins
-    preforg = None
     for origin in event['origins']:
-        if preforg is not None and origin['preferred']:
-            raise Exception('Cannot specify multiple preferred origins!')
-            
-        if origin['preferred']:
-            preforg = 'quakeml:us.anss.org/origin/%s' % (origin['id'])
-        #check for missing keys
-        origin_keys = set(list(origin.keys()))
-        if not origin_required <= origin_keys:
-            raise Exception('Missing required origin keys: %s' %  (origin_required & origin_keys))
-        
         event_tag = _update_event_tag(origin,event,event_tag)
 
     #now deal with focal mechanism and moment tensor, if present
     if 'focal' in event:
-        #check for missing keys
-        focal = event['focal']
-        focal_keys = set(list(focal.keys()))
-        if not focal_required <= focal_keys:
-            raise Exception('Missing required focal mechanism keys: %s' %  (focal_required & focal_keys))
-        focal_tag = _create_focal_tag(focal,event)
+        focal_tag = _create_focal_tag(event['focal'],event)
 
     if 'moment' in event:
-        #check for missing keys
-        moment = event['moment']
-        moment_keys = set(list(moment.keys()))
-        if not moment_required <= moment_keys:
-            raise Exception('Missing required moment tensor keys: %s' %  (moment_required & moment_keys))
-        moment_tag = _create_moment_tag(moment,event)
+        moment_tag = _create_moment_tag(event['moment'],event)
         focal_tag.addChild(moment_tag)
 
     if 'focal' in event or 'moment' in event:
@@ -316,6 +367,21 @@ def create_quakeml(event):
     
     return xmlstr
 
+def render_event(event):
+    """Given an earthquake event dictionary, return a string containing only the QuakeML event element.
+
+    This is used to build QuakeML documents containing many events (see write_quakeml_documents()).
+
+    :param event:
+      Event dictionary (see create_quakeml()).
+    :returns:
+      String containing QuakeML <event> element.
+    """
+    preforg,prefmag = _validate_event(event)
+    parts = []
+    _write_event(parts,event,preforg,prefmag)
+    return _strip_whitespace(''.join(parts))
+
 def xml_pprint(xmlstr):
     xml = minidom.parseString(xmlstr)
     pretty_xml_as_string = xml.toprettyxml(indent="  ")
@@ -324,6 +390,62 @@ def xml_pprint(xmlstr):
             continue
         print(line)
 
+def _validate_event(event):
+    """Internal function to check event dictionary for required keys.
+
+    :param event:
+      Event dictionary (see create_quakeml()).
+    :returns:
+      Tuple of (preferred origin ID, preferred magnitude ID), either of which may be None.
+    """
+    event_required = set(['id','catalog','contributor','origins','magnitudes'])
+    origin_required = set(['time','lat','lon','depth','preferred'])
+    mag_required = set(['value','type','preferred'])
+    focal_required = set(['np1','np2','taxis','naxis','paxis','method'])
+    moment_required = set(['m0','mrr','mpp','mtt','mrt','mtp','mrp'])
+    
+    event_keys = set(list(event.keys()))
+    if not event_required <= event_keys:
+        raise Exception('Missing required event keys: %s' %  (event_required & event_keys))
+
+    prefmag = None
+    for magnitude in event['magnitudes']:
+        if prefmag is not None and magnitude['preferred']:
+            raise Exception('Cannot specify multiple preferred magnitudes!')
+            
+        if magnitude['preferred']:
+            prefmag = _get_magnitude_id(magnitude)
+        #check for missing keys
+        mag_keys = set(list(magnitude.keys()))
+        if not mag_required <= mag_keys:
+            raise Exception('Missing required magnitude keys: %s' %  (mag_required & mag_keys))
+
+    preforg = None
+    for origin in event['origins']:
+        if preforg is not None and origin['preferred']:
+            raise Exception('Cannot specify multiple preferred origins!')
+            
+        if origin['preferred']:
+            preforg = 'quakeml:us.anss.org/origin/%s' % (origin['id'])
+        #check for missing keys
+        origin_keys = set(list(origin.keys()))
+        if not origin_required <= origin_keys:
+            raise Exception('Missing required origin keys: %s' %  (origin_required & origin_keys))
+
+    if 'focal' in event:
+        focal_keys = set(list(event['focal'].keys()))
+        if not focal_required <= focal_keys:
+            raise Exception('Missing required focal mechanism keys: %s' %  (focal_required & focal_keys))
+
+    if 'moment' in event:
+        if 'focal' not in event:
+            raise Exception('Moment tensor information must be accompanied by a focal mechanism.')
+        moment_keys = set(list(event['moment'].keys()))
+        if not moment_required <= moment_keys:
+            raise Exception('Missing required moment tensor keys: %s' %  (moment_required & moment_keys))
+
+    return (preforg,prefmag)
+
 def _get_magnitude_id(magnitude):
     prefmag = 'quakeml:us.anss.org/magnitude/%s/%s' % (magnitude['author'],magnitude['type'])
     return prefmag
@@ -518,7 +640,7 @@ def _create_quality_tag(origin):
     return quality_tag
 
 def _create_arrival_tag(phase,event):
-    """Internal function to create arrival tag.
+    """Internal function to create arrival tag from a phase dictionary or PhaseTable view.
     """
     #picktime = phase['id'].strftime('%s')+'.'+phase['id'].strftime('%f')
     arrid = 'quakeml:us.anss.org/arrival/%s/us_%s' % (event['id'],phase['id'])
@@ -539,7 +661,7 @@ def _create_arrival_tag(phase,event):
     return arrival_tag
 
 def _create_pick_tag(phase,event):
-    """Internal function to create pick tag.
+    """Internal function to create pick tag from a phase dictionary or PhaseTable view.
     """
     #picktime = phase['id'].strftime('%s')+'.'+phase['id'].strftime('%f')
     pickid = 'quakeml:us.anss.org/pick/%s/us_%s' % (event['id'],phase['id'])
@@ -618,3 +740,167 @@ def _update_event_tag(origin,event,event_tag):
     return event_tag
 
 
+
+
+# String serializer.  The functions below write exactly the same QuakeML as the Tag functions above
+# (after tabs and newlines have been stripped from the Tag output), but do so by appending 
+# pre-built XML fragments to a list of strings, which is joined once at the end.  If you change 
+# the structure of the QuakeML created by one set of functions, change the other set to match!
+
+QUAKEML_START = '<q:quakeml xmlns="http://quakeml.org/xmlns/bed/1.2" xmlns:catalog="http://anss.org/xmlns/catalog/0.1" xmlns:q="http://quakeml.org/xmlns/quakeml/1.2">'
+QUAKEML_END = '</q:quakeml>'
+EVENTPARAMS_START = '<eventParameters publicID="quakeml:%s.anss.org/eventParameters/%s">'
+EVENTPARAMS_END = '</eventParameters>'
+EVENT_START = '<event catalog:eventid="%s" catalog:eventsource="%s" catalog:dataid="%s%s" catalog:datasource="%s" publicID="quakeml:%s.anss.org/event/%s">'
+EVENT_END = '</event>'
+MAGNITUDE_FMT = '<magnitude publicID="%s"><mag><value>%.2f</value></mag><type>%s</type>'
+ORIGIN_START = '<origin publicID="quakeml:us.anss.org/origin/%s">'
+ELLIPSE_FMT = ('<OriginUncertainty><confidenceEllipsoid><semiMajorAxisLength>%.2f</semiMajorAxisLength>'
+               '<semiMinorAxisLength>%.2f</semiMinorAxisLength><majorAxisAzimuth>%.2f</majorAxisAzimuth>'
+               '</confidenceEllipsoid></OriginUncertainty>')
+QUALITY_FMT = ('<quality><usedPhaseCount>%s</usedPhaseCount><usedStationCount>%s</usedStationCount>'
+               '<standardError>%s</standardError><azimuthalGap>%s</azimuthalGap>'
+               '<minimumDistance>%s</minimumDistance></quality>')
+ARRIVAL_FMT = ('<arrival publicID="quakeml:us.anss.org/arrival/%s/us_%s">'
+               '<pickID>quakeml:us.anss.org/pick/%s/us_%s</pickID><phase>%s</phase>'
+               '<azimuth>%.2f</azimuth><distance>%.2f</distance><timeResidual>%.2f</timeResidual>'
+               '<timeWeight>%.2f</timeWeight></arrival>')
+PICK_START = '<pick publicID="quakeml:us.anss.org/pick/%s/us_%s"><time><value>%s</value></time><waveformID'
+PICK_END = '></waveformID><phaseHint>%s</phaseHint><evaluationMode>manual</evaluationMode></pick>'
+WAVEFORM_CODES = ('networkCode','stationCode','channelCode','locationCode')
+FOCAL_START = '<focalMechanism publicID="quakeml:us.anss.org/focalmechanism/%s/%s">'
+NODAL_FMT = ('<nodalPlanes>'
+             '<nodalPlane1><strike><value>%.0f</value></strike><dip><value>%.0f</value></dip><rake><value>%.0f</value></rake></nodalPlane1>'
+             '<nodalPlane2><strike><value>%.0f</value></strike><dip><value>%.0f</value></dip><rake><value>%.0f</value></rake></nodalPlane2>'
+             '</nodalPlanes>')
+AXES_FMT = ('<principalAxes>'
+            '<tAxis><plunge><value>%.0f</value></plunge><azimuth><value>%.0f</value></azimuth></tAxis>'
+            '<nAxis><plunge><value>%.0f</value></plunge><azimuth><value>%.0f</value></azimuth></nAxis>'
+            '<pAxis><plunge><value>%.0f</value></plunge><azimuth><value>%.0f</value></azimuth></pAxis>'
+            '</principalAxes>')
+FOCAL_END = '</focalMechanism>'
+EVALUATION_FMT = '<evaluationMode>manual</evaluationMode><evaluationStatus>%s</evaluationStatus>'
+ORIGIN_FIELDS = (('time','time','%s'),
+                 ('lat','latitude','%.4f'),
+                 ('lon','longitude','%.4f'),
+                 ('depth','depth','%.1f'))
+
+def _render_quakeml(event,preforg,prefmag):
+    """Internal function to render a complete (validated) event as a QuakeML string.
+    """
+    parts = [QUAKEML_START,EVENTPARAMS_START % (event['contributor'],event['id'])]
+    _write_event(parts,event,preforg,prefmag)
+    parts.append(EVENTPARAMS_END)
+    parts.append(QUAKEML_END)
+    return _strip_whitespace(''.join(parts))
+
+def _strip_whitespace(xmlstr):
+    """Internal function to remove tabs and newlines, as is done to the output of the Tag renderer.
+
+    The fragments never contain either, so this only has to do work when data values do.
+    """
+    if '\t' in xmlstr or '\n' in xmlstr:
+        xmlstr = xmlstr.replace('\t','').replace('\n','')
+    return xmlstr
+
+def _write_event(parts,event,preforg,prefmag):
+    """Internal function to append the event element (and everything inside it) to a list of strings.
+    """
+    eid = event['id']
+    catalog = event['catalog']
+    parts.append(EVENT_START % (eid,catalog,catalog,eid,event['contributor'],catalog,eid))
+    for magnitude in event['magnitudes']:
+        _write_magnitude(parts,magnitude)
+    for origin in event['origins']:
+        _write_origin(parts,origin,event)
+    if 'focal' in event:
+        _write_focal(parts,event)
+    if preforg is not None:
+        parts.append('<preferredOriginID>%s</preferredOriginID>' % preforg)
+    if prefmag is not None:
+        parts.append('<preferredMagnitudeID>%s</preferredMagnitudeID>' % prefmag)
+    parts.append(EVENT_END)
+
+def _write_magnitude(parts,magnitude):
+    """Internal function to append magnitude element to a list of strings.
+    """
+    parts.append(MAGNITUDE_FMT % (_get_magnitude_id(magnitude),magnitude['value'],magnitude['type']))
+    if 'author' in magnitude:
+        parts.append('<creationInfo><author>%s</author></creationInfo>' % magnitude['author'])
+    parts.append('</magnitude>')
+
+def _write_origin(parts,origin,event):
+    """Internal function to append origin element to a list of strings.
+
+    Picks belong to the event, so they are written before the origin that references them.
+    """
+    if 'phases' in origin:
+        for phase in origin['phases']:
+            _write_pick(parts,phase,event['id'])
+    parts.append(ORIGIN_START % origin['id'])
+    for shortname,longname,fmt in ORIGIN_FIELDS:
+        field = origin[shortname]
+        if isinstance(field,dict):
+            value = field['value']
+        else:
+            value = field
+        if isinstance(value,datetime):
+            value = value.strftime('%Y-%m-%dT%H:%M:%SZ')
+        parts.append('<%s><value>%s</value>' % (longname,fmt % value))
+        if isinstance(field,dict):
+            if 'lower' in field:
+                parts.append('<lowerUncertainty>%.2f</lowerUncertainty><upperUncertainty>%.2f</upperUncertainty>' % 
+                             (field['lower'],field['upper']))
+            else:
+                parts.append('<uncertainty>%.2f</uncertainty>' % field['uncertainty'])
+        parts.append('</%s>' % longname)
+    if 'ellipse' in origin:
+        ellipse = origin['ellipse']
+        parts.append(ELLIPSE_FMT % (ellipse['major'],ellipse['minor'],ellipse['azimuth']))
+    if 'quality' in origin:
+        quality = origin['quality']
+        parts.append(QUALITY_FMT % (quality['numphases'],quality['numstations'],quality['stderr'],
+                                    quality['azgap'],quality['mindist']))
+    if 'phases' in origin:
+        eid = event['id']
+        for phase in origin['phases']:
+            pid = phase['id']
+            parts.append(ARRIVAL_FMT % (eid,pid,eid,pid,phase['name'],phase['azimuth'],
+                                        phase['distance'],phase['residual'],phase['weight']))
+    parts.append('</origin>')
+
+def _write_pick(parts,phase,eventid):
+    """Internal function to append pick element to a list of strings.
+    """
+    parts.append(PICK_START % (eventid,phase['id'],phase['time'].strftime(TIMEFMT+'Z')))
+    network,station,channel,location = phase['station'].split('.')
+    for attname,code in zip(WAVEFORM_CODES,(network,station,channel,location)):
+        if code.replace('-','').strip() != '':
+            parts.append(' %s="%s"' % (attname,code))
+    parts.append(PICK_END % phase['name'])
+
+def _write_focal(parts,event):
+    """Internal function to append focalMechanism element (including momentTensor) to a list of strings.
+    """
+    focal = event['focal']
+    parts.append(FOCAL_START % (event['id'],focal['method']))
+    np1 = focal['np1']
+    np2 = focal['np2']
+    parts.append(NODAL_FMT % (np1['strike'],np1['dip'],np1['rake'],
+                              np2['strike'],np2['dip'],np2['rake']))
+    taxis = focal['taxis']
+    naxis = focal['naxis']
+    paxis = focal['paxis']
+    parts.append(AXES_FMT % (taxis['plunge'],taxis['azimuth'],
+                             naxis['plunge'],naxis['azimuth'],
+                             paxis['plunge'],paxis['azimuth']))
+    parts.append(EVALUATION_FMT % focal.get('evalstatus','reviewed'))
+    if 'moment' in event:
+        moment = event['moment']
+        parts.append('<momentTensor publicID="quakeml:us.anss.org/momenttensor/%s/%s">' % (event['id'],moment['method']))
+        if 'doublecouple' in moment:
+            parts.append('<doubleCouple>%.3f</doubleCouple>' % moment['doublecouple'])
+        if 'clvd' in moment:
+            parts.append('<clvd>%.3f</clvd>' % moment['clvd'])
+        parts.append('</momentTensor>')
+    parts.append(FOCAL_END)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import importlib
+from collections import OrderedDict
+
+#entry point group where other packages can register catalog format modules
+ENTRY_POINT_GROUP = 'eqconvert.formats'
+
+#catalog format name -> name of the module that parses it
+FORMATS = OrderedDict([('iscgem','eqconvert.iscgem'),
+                       ('ndk','eqconvert.ndk'),
+                       ('mloc','eqconvert.mloc')])
+
+def register_format(name,modulename):
+    """Register a catalog format parser.
+
+    Parser modules must provide get_events() and iter_events() functions taking the same
+    arguments as those of the eqconvert format modules (filename,contributor=None,catalog=None).
+    The module is not imported until get_parser() is called for the format.
+
+    :param name:
+      Format name, as given on the convertcat command line.
+    :param modulename:
+      Fully qualified name of the module that parses the format.
+    """
+    FORMATS[name] = modulename
+
+def get_format_names(plugins=True):
+    """Return the names of the supported catalog formats.
+
+    :param plugins:
+      Include formats registered by other packages in the ENTRY_POINT_GROUP entry point group.
+    :returns:
+      List of format names, eqconvert formats first.
+    """
+    names = list(FORMATS.keys())
+    if plugins:
+        names += sorted([name for name in _get_entry_points() if name not in FORMATS])
+    return names
+
+def has_format(name):
+    """Return True if a catalog format is supported.
+
+    Entry point plugins are only searched for formats that are not eqconvert formats.
+
+    :param name:
+      Format name.
+    :returns:
+      True if get_parser() can return a parser for the format.
+    """
+    return name in FORMATS or name in _get_entry_points()
+
+def get_parser(name):
+    """Import and return the module that parses a catalog format.
+
+    Only the module for the requested format is imported, so that the (sometimes large)
+    dependencies of the other formats do not have to be loaded.
+
+    :param name:
+      Format name (see get_format_names()).
+    :returns:
+      Parser module, with get_events() and iter_events() functions.
+    """
+    if name not in FORMATS:
+        entry_points = _get_entry_points()
+        if name not in entry_points:
+            raise Exception('Unsupported catalog format "%s". Supported formats are: %s' % (name,
+                                                                                           ', '.join(get_format_names())))
+        register_format(name,entry_points[name])
+    return importlib.import_module(FORMATS[name])
+
+def _get_entry_points():
+    """Internal function to return a dictionary of format name -> module name for the entry point plugins.
+    """
+    #importlib.metadata is only needed (and only imported) when looking for plugins
+    try:
+        from importlib import metadata
+    except ImportError:
+        return {}
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points,'select'):
+        group = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        group = entry_points.get(ENTRY_POINT_GROUP,[])
+    return dict([(entry_point.name,entry_point.value.split(':')[0]) for entry_point in group])
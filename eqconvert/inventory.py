@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import math
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from datetime import datetime
+
+#local imports
+from .cache import get_file_key
+
+#end time of channels that are still open
+OPEN_END = datetime(2599,12,31,23,59,59)
+CELLSIZE = 1.0 #size (degrees) of spatial index cells
+TIMEFMT = '%Y-%m-%dT%H:%M:%S'
+
+class StationInventory(object):
+    """In-memory station/channel inventory, used to look up stations without contacting a CWB server.
+
+    Inventories can be read from FDSN web service text files (channel or station level) or StationXML
+    files.  Stations are held in a grid of CELLSIZE degree cells for location searches, and channels
+    (network, station, location, channel, start time, end time) in a table indexed by station code.
+    Blank location codes are stored as '--', as they are written by the CWB server.
+    """
+    def __init__(self,filename):
+        """Load an inventory file.
+
+        :param filename:
+          FDSN text (starting with a "#Network|Station|..." header) or StationXML file.
+        """
+        self.filename = filename
+        self.stations = OrderedDict() #(network,station) -> (lat,lon)
+        self.channels = {} #station -> list of (network,station,location,channel,start,end)
+        self.grid = {} #(lat cell,lon cell) -> list of (network,station)
+        with open(filename,'rt') as f:
+            header = f.readline()
+        if header.startswith('#') and header.find('|') > -1:
+            self._read_text(filename)
+        else:
+            self._read_xml(filename)
+        for (network,station),(lat,lon) in self.stations.items():
+            self.grid.setdefault(_get_cell(lat,lon),[]).append((network,station))
+
+    def get_cache_key(self):
+        """Return a string identifying this inventory file, used in CatalogCache keys.
+        """
+        return 'StationInventory(%s)' % get_file_key(self.filename)
+
+    def find_stations(self,lat,lon,radius):
+        """Return the stations within a distance of a point.
+
+        :param lat:
+          Latitude of search center.
+        :param lon:
+          Longitude of search center.
+        :param radius:
+          Search radius (degrees).
+        :returns:
+          List of (network,station) tuples, sorted by network and station code.
+        """
+        ilat1,ilon1 = _get_cell(lat-radius,lon)
+        ilat2,ilon2 = _get_cell(lat+radius,lon)
+        coslat = math.cos(math.radians(min(89.0,max(abs(lat-radius),abs(lat+radius)))))
+        ncells = int(math.ceil(radius/(coslat*CELLSIZE)))
+        ncells = min(ncells,int(180/CELLSIZE))
+        matches = []
+        for ilat in range(ilat1,ilat2+1):
+            for ilon in set([_wrap_cell(ilon1+i) for i in range(-ncells,ncells+1)]):
+                for network,station in self.grid.get((ilat,ilon),[]):
+                    slat,slon = self.stations[(network,station)]
+                    if _get_distance(lat,lon,slat,slon) <= radius:
+                        matches.append((network,station))
+        return sorted(matches)
+
+    def get_channels(self,station,network=None,time=None):
+        """Return the channels of a station.
+
+        :param station:
+          Station code.
+        :param network:
+          Network code, or None for all networks.
+        :param time:
+          Datetime when channels must be open, or None for all channel epochs.
+        :returns:
+          List of (network,station,location,channel,start,end) tuples, in inventory order.
+        """
+        channels = []
+        for channel in self.channels.get(station,[]):
+            if network is not None and channel[0] != network:
+                continue
+            if time is not None and (time < channel[4] or time > channel[5]):
+                continue
+            channels.append(channel)
+        return channels
+
+    def _add_channel(self,network,station,location,channel,lat,lon,start,end):
+        if location.strip() == '':
+            location = '--'
+        if (network,station) not in self.stations:
+            self.stations[(network,station)] = (lat,lon)
+        self.channels.setdefault(station,[]).append((network,station,location,channel,start,end))
+
+    def _read_text(self,filename):
+        with open(filename,'rt') as f:
+            columns = [c.strip().lower() for c in f.readline().lstrip('#').split('|')]
+            for line in f:
+                if line.startswith('#') or not line.strip():
+                    continue
+                row = dict(zip(columns,[p.strip() for p in line.split('|')]))
+                network = row['network']
+                station = row['station']
+                lat = float(row['latitude'])
+                lon = float(row['longitude'])
+                start = _get_time(row.get('starttime',''),datetime(1900,1,1))
+                end = _get_time(row.get('endtime',''),OPEN_END)
+                if 'channel' not in row:
+                    if (network,station) not in self.stations:
+                        self.stations[(network,station)] = (lat,lon)
+                    continue
+                self._add_channel(network,station,row['location'],row['channel'],lat,lon,start,end)
+
+    def _read_xml(self,filename):
+        root = ET.parse(filename).getroot()
+        for network in _get_children(root,'Network'):
+            for station in _get_children(network,'Station'):
+                lat = float(_get_child(station,'Latitude').text)
+                lon = float(_get_child(station,'Longitude').text)
+                channels = _get_children(station,'Channel')
+                if not len(channels):
+                    if (network.get('code'),station.get('code')) not in self.stations:
+                        self.stations[(network.get('code'),station.get('code'))] = (lat,lon)
+                for channel in channels:
+                    start = _get_time(channel.get('startDate',''),datetime(1900,1,1))
+                    end = _get_time(channel.get('endDate',''),OPEN_END)
+                    self._add_channel(network.get('code'),station.get('code'),channel.get('locationCode',''),
+                                      channel.get('code'),lat,lon,start,end)
+
+def _get_children(element,tag):
+    return [child for child in element if child.tag.split('}')[-1] == tag]
+
+def _get_child(element,tag):
+    return _get_children(element,tag)[0]
+
+def _get_time(timestr,default):
+    timestr = timestr.strip()
+    if not timestr:
+        return default
+    return datetime.strptime(timestr[0:19],TIMEFMT)
+
+def _get_cell(lat,lon):
+    return (int(math.floor(lat/CELLSIZE)),_wrap_cell(int(math.floor(lon/CELLSIZE))))
+
+def _wrap_cell(ilon):
+    ncells = int(360/CELLSIZE)
+    return (ilon + ncells//2) % ncells - ncells//2
+
+def _get_distance(lat1,lon1,lat2,lon2):
+    """Internal function to return the great circle distance (degrees) between two points.
+    """
+    lat1,lon1,lat2,lon2 = [math.radians(x) for x in (lat1,lon1,lat2,lon2)]
+    a = math.sin((lat2-lat1)/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin((lon2-lon1)/2)**2
+    return math.degrees(2*math.asin(min(1.0,math.sqrt(a))))
@@ -1,28 +1,132 @@
+import numpy as np
 import pandas as pd
 
-def get_events(filename,contributor=None,catalog=None):
+#local imports
+from .tensor import decompose,MT_COMPONENTS
+
+#number of CSV rows read into memory at a time
+CHUNKSIZE = 10000
+
+COLUMNS = ['date','lat','lon','smajax','sminax','strike','epicenter_quality',
+           'depth','depth_uncertainty','depth_quality',
+           'mw','mw_unc','mw_quality','mw_source','moment','factor','moment_author',
+           'mpp','mpr','mrr','mrt','mtp','mtt','eventid']
+#CSV column of each moment tensor component (ISC-GEM calls Mrp "mpr")
+MT_COLUMNS = {'mrr':'mrr','mtt':'mtt','mpp':'mpp','mrt':'mrt','mrp':'mpr','mtp':'mtp'}
+
+def get_events(filename,contributor=None,catalog=None,chunksize=None):
+    return list(iter_events(filename,contributor=contributor,catalog=catalog,chunksize=chunksize))
+
+def iter_events(filename,contributor=None,catalog=None,chunksize=None):
+    """Parse ISC-GEM CSV file and yield a dictionary for each event (row).
+
+    The CSV file is read chunksize rows at a time, and only the events of one chunk are held in 
+    memory, so memory use depends on the chunk size rather than the size of the file.  Events are 
+    yielded in file order, and are the same whatever the chunk size.
+
+    :param filename:
+      ISC-GEM CSV file.
+    :param contributor:
+      Contributor string (default 'us').
+    :param catalog:
+      Catalog string (not used, ISC-GEM events are always in the 'iscgem' catalog).
+    :param chunksize:
+      Number of CSV rows read at a time, or None to use CHUNKSIZE.
+    :returns:
+      Generator yielding event dictionaries.
+    """
     if contributor is None:
         contributor = 'us'
-    columns=['date','lat','lon','smajax','sminax','strike','epicenter_quality',
-             'depth','depth_uncertainty','depth_quality',
-             'mw','mw_unc','mw_quality','mw_source','moment','factor','moment_author',
-             'mpp','mpr','mrr','mrt','mtp','mtt','eventid']
-    df = pd.read_csv(filename,comment='#',names=columns,parse_dates=[0])
+    if chunksize is None:
+        chunksize = CHUNKSIZE
+    if chunksize < 1:
+        raise Exception('ISC-GEM chunk size must be at least 1, not %i' % chunksize)
+    reader = pd.read_csv(filename,comment='#',names=COLUMNS,parse_dates=[0],chunksize=chunksize)
+    for df in reader:
+        for event in _get_chunk_events(df,contributor):
+            yield event
+
+def _get_chunk_events(df,contributor):
+    """Internal function to build event dictionaries from a chunk of the ISC-GEM CSV file.
+
+    Each column is converted (to datetimes, stripped strings, or lists of Python numbers) once, 
+    rather than once per row.  Moment tensors (in newton-meters, scaled by 10**factor) are 
+    decomposed for all rows with a complete tensor at once (see eqconvert.tensor.decompose()), and 
+    added to those events with the focal mechanism of their best double couple.  The scalar moment 
+    is the catalog's (moment*10**factor), or that of the tensor if the catalog has none.
+
+    :param df:
+      DataFrame of ISC-GEM rows, with COLUMNS columns.
+    :param contributor:
+      Contributor string.
+    :returns:
+      List of event dictionaries.
+    """
+    ids = df['eventid'].astype(str).tolist()
+    times = list(df['date'].dt.to_pydatetime())
+    authors = df['moment_author'].str.strip().tolist()
+    moments = _get_moments(df)
+    columns = zip(ids,times,df['lat'].tolist(),df['lon'].tolist(),df['smajax'].tolist(),df['sminax'].tolist(),
+                  df['depth'].tolist(),df['depth_uncertainty'].tolist(),df['mw'].tolist(),authors)
     events = []
-    for index,row in df.iterrows():
+    for eventid,time,lat,lon,smajax,sminax,depth,depth_uncertainty,mw,author in columns:
         event = {}
-        event['id'] = str(row['eventid'])
+        event['id'] = eventid
         event['catalog'] = 'iscgem'
         event['contributor'] = contributor
         event['origins'] = [{'preferred':True,
                             'id':'iscgem',
                             'evalmode':'manual',
                             'evalstatus':'reviewed',
-                            'ellipse':{'major':row['smajax'],'minor':row['sminax'],'azimuth':0.0},
-                            'time':row['date'].to_datetime(),
-                            'lat':row['lat'],
-                            'lon':row['lon'],
-                            'depth':{'value':row['depth'],'uncertainty':row['depth_uncertainty']}}]
-        event['magnitudes'] = [{'preferred':True,'type':'Mw','value':row['mw'],'author':row['moment_author'].strip()}]
-        events.append(event.copy())
+                            'ellipse':{'major':smajax,'minor':sminax,'azimuth':0.0},
+                            'time':time,
+                            'lat':lat,
+                            'lon':lon,
+                            'depth':{'value':depth,'uncertainty':depth_uncertainty}}]
+        event['magnitudes'] = [{'preferred':True,'type':'Mw','value':mw,'author':author}]
+        events.append(event)
+    for i,moment,focal in moments:
+        events[i]['moment'] = moment
+        events[i]['focal'] = focal
     return events
+
+def _get_moments(df):
+    """Internal function to build moment tensor and focal mechanism dictionaries for a chunk of the ISC-GEM CSV file.
+
+    :param df:
+      DataFrame of ISC-GEM rows, with COLUMNS columns.
+    :returns:
+      List of (row index,moment dictionary,focal mechanism dictionary) tuples for the rows that have 
+      a complete moment tensor.
+    """
+    #the tensor components are given in units of 10**factor newton-meters
+    scale = np.power(10.0,df['factor'].to_numpy(dtype=np.float64))
+    components = [df[MT_COLUMNS[comp]].to_numpy(dtype=np.float64)*scale for comp in MT_COMPONENTS]
+    rows = np.flatnonzero(np.isfinite(np.column_stack(components)).all(axis=1))
+    if not len(rows):
+        return []
+    components = [component[rows] for component in components]
+    results = decompose(*components)
+    components = [component.tolist() for component in components]
+    #use the catalog scalar moment where there is one, rather than the one computed from the tensor
+    m0 = df['moment'].to_numpy(dtype=np.float64)[rows]*scale[rows]
+    results['m0'] = np.where(np.isfinite(m0),m0,results['m0'])
+    results = dict([(key,value.tolist()) for key,value in results.items()])
+    moments = []
+    for j,i in enumerate(rows.tolist()):
+        moment = {'method':'Mw','m0':results['m0'][j],
+                  'doublecouple':results['doublecouple'][j],
+                  'clvd':results['clvd'][j]}
+        for comp,values in zip(MT_COMPONENTS,components):
+            moment[comp] = values[j]
+        focal = {'method':'Mw','evalstatus':'reviewed'}
+        for plane in ['1','2']:
+            focal['np'+plane] = {'strike':results['strike'+plane][j],
+                                 'dip':results['dip'+plane][j],
+                                 'rake':results['rake'+plane][j]}
+        for axis in ['t','n','p']:
+            focal[axis+'axis'] = {'plunge':results[axis+'plunge'][j],
+                                  'azimuth':results[axis+'azimuth'][j],
+                                  'value':results[axis+'value'][j]}
+        moments.append((i,moment,focal))
+    return moments
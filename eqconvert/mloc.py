@@ -9,22 +9,46 @@ import string
 import argparse
 import textwrap
 import math
+import calendar
 from collections import OrderedDict
 import urllib.request as request
 import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 #local imports
-from .stationdb import StationTranslator
+from .stationdb import StationTranslator,POOLSIZE
+from .phases import PhaseTable
+from .cache import StationCache
 
 #minimum magnitude at which we decide to search comcat for potentially a better magnitude
 MINMAG = 4.0
 
 URLBASE = 'http://earthquake.usgs.gov/fdsnws/event/1/query?format=geojson&starttime=[START]&endtime=[END]&latitude=[LAT]&longitude=[LON]&maxradiuskm=[RAD]'
+BATCHURL = 'http://earthquake.usgs.gov/fdsnws/event/1/query?format=geojson&starttime=[START]&endtime=[END]&minlatitude=[MINLAT]&maxlatitude=[MAXLAT]&minlongitude=[MINLON]&maxlongitude=[MAXLON]&orderby=time-asc&limit=[LIMIT]&offset=[OFFSET]'
 RADIUS = 10 #km around an epicenter to search for matching earthquake
 TIMEDELTA = 3 #seconds around an origin time to search for matching earthquake
+EARTH_RADIUS = 6371.0 #km
+KM_PER_DEGREE = 111.19 #km per degree of latitude
+
+#settings for batched ComCat searches (see getPrefMags())
+BATCH_SPAN = 365 #days of events covered by one search
+BATCH_LIMIT = 20000 #events returned per request (ComCat's maximum), further events are requested in pages
 
 SOURCE = 'rde'
 
+LOOKUPS = ['single','batch','async']
+LOOKUP_BATCHSIZE = 500 #events parsed by iter_events() before their magnitudes are looked up with batch or async lookups
+
+#settings for concurrent ComCat searches (see getPrefMagsAsync())
+CONCURRENCY = 8 #searches running at the same time
+RATE = 10.0 #searches started per second
+TIMEOUT = 30 #seconds
+RETRIES = 3
+BACKOFF = 1.0 #seconds before first retry
+
+STATION_WORKERS = 8 #threads used to look up stations before parsing (see StationTranslator.resolveStations())
+
 TIMERROR = 5 #how many days can the phase time be from a given station epoch before we don't consider it to be part of that epoch 
 
 TIMEFMT = '%Y-%m-%dT%H:%M:%S'
@@ -40,45 +64,320 @@ DEPTHTYPES = {'c':'operator assigned',
               'u':'other',
               'w':'from moment tensor inversion'}
 
-def getPrefMag(event):
+def getPrefMag(event,magcache=None,comcat=None):
     """Search ComCat for the preferred magnitude value, source, and type.
 
     :param event:
       Dictionary containing earthquake event information, primarily a list of origin dictionaries with lat,lon,time fields.
+    :param magcache:
+      eqconvert.cache.MagnitudeCache object, used to avoid repeating searches, or None.
+    :param comcat:
+      eqconvert.comcat.ComCatIndex object of a ComCat export to search instead of ComCat, or None.
     :returns:
       Tuple of preferred (magnitude value,magnitude source, magnitude type).
     """
+    if comcat is not None:
+        return _get_mag_tuple(event,_get_local_features(_get_preferred_origin(event),comcat))
+    results,missing = _get_cached_results([event],magcache)
+    if not len(missing):
+        return results[0]
+    origin = _get_preferred_origin(event)
+    features = _get_features(_get_search_url(origin))
+    result = _get_mag_tuple(event,features)
+    _cache_result(magcache,origin,result)
+    return result
+
+def getPrefMags(events,magcache=None):
+    """Search ComCat for the preferred magnitude value, source, and type of many events with few requests.
+
+    Events are split into groups spanning at most BATCH_SPAN days, and one search covering the 
+    time range and bounding box of each group is made (requested BATCH_LIMIT events at a time, so 
+    that ComCat's limit on the size of a search is never exceeded).  Each event is then matched to the returned ComCat events using the same rules as 
+    getPrefMag() (within RADIUS km and TIMEDELTA seconds, and only if there is exactly one match).  
+    This is much faster than calling getPrefMag() for each event of a spatially compact cluster.
+
+    :param events:
+      Sequence of event dictionaries (see getPrefMag()).
+    :param magcache:
+      eqconvert.cache.MagnitudeCache object, used to avoid repeating searches, or None.
+    :returns:
+      List of tuples of preferred (magnitude value,magnitude source, magnitude type), one for each input event.
+    """
+    results,missing = _get_cached_results(events,magcache)
+    if not len(missing):
+        return results
+    for group in _get_batch_groups([(i,_get_preferred_origin(events[i])) for i in missing]):
+        features = _get_batch_features([origin for i,origin in group])
+        for i,origin in group:
+            matches = _match_features(origin,features)
+            results[i] = _get_mag_tuple(events[i],matches)
+            _cache_result(magcache,origin,results[i])
+    return results
+
+def _get_batch_groups(origins):
+    """Internal function to split (index,origin) tuples into time ordered groups spanning at most BATCH_SPAN days.
+    """
+    groups = []
+    for i,origin in sorted(origins,key=lambda item: item[1]['time']['value']):
+        otime = origin['time']['value']
+        if not len(groups) or otime - groups[-1][0][1]['time']['value'] > timedelta(days=BATCH_SPAN):
+            groups.append([])
+        groups[-1].append((i,origin))
+    return groups
+
+def _get_batch_features(origins):
+    """Internal function to return the features of a batch search, requesting them BATCH_LIMIT at a time.
+    """
+    features = []
+    while True:
+        page = _get_features(_get_batch_url(origins,offset=len(features)+1))
+        features += page
+        if len(page) < BATCH_LIMIT:
+            return features
+
+def getPrefMagsAsync(events,concurrency=None,rate=None,timeout=None,retries=None,backoff=None,magcache=None):
+    """Search ComCat for the preferred magnitude value, source, and type of many events concurrently.
+
+    One search is made per event (as in getPrefMag()), but searches are run concurrently using asyncio, 
+    which is much faster than getPrefMag() when events are too far apart for getPrefMags().  This 
+    function starts its own event loop, so it cannot be called from a running event loop.
+
+    :param events:
+      Sequence of event dictionaries (see getPrefMag()).
+    :param concurrency:
+      Maximum number of searches running at one time, or None to use CONCURRENCY.
+    :param rate:
+      Maximum number of searches started per second, or None to use RATE.
+    :param timeout:
+      Timeout in seconds for each search, or None to use TIMEOUT.
+    :param retries:
+      Number of times a failed search is retried, or None to use RETRIES.
+    :param backoff:
+      Delay in seconds before the first retry, doubled for each subsequent retry, or None to use BACKOFF.
+    :param magcache:
+      eqconvert.cache.MagnitudeCache object, used to avoid repeating searches, or None.  Failed 
+      searches are not cached.
+    :returns:
+      List of tuples of preferred (magnitude value,magnitude source, magnitude type), one for each 
+      input event.  Events whose searches fail after all retries get a tuple of Nones.
+    """
+    if concurrency is None:
+        concurrency = CONCURRENCY
+    if rate is None:
+        rate = RATE
+    if timeout is None:
+        timeout = TIMEOUT
+    if retries is None:
+        retries = RETRIES
+    if backoff is None:
+        backoff = BACKOFF
+    results,missing = _get_cached_results(events,magcache)
+    if not len(missing):
+        return results
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        searched = asyncio.run(_get_pref_mags_async([events[i] for i in missing],executor,
+                                                    concurrency,rate,timeout,retries,backoff))
+    finally:
+        executor.shutdown()
+    for i,result in zip(missing,searched):
+        if result is None:
+            results[i] = (None,None,None)
+            continue
+        results[i] = result
+        _cache_result(magcache,_get_preferred_origin(events[i]),result)
+    return results
+
+async def _get_pref_mags_async(events,executor,concurrency,rate,timeout,retries,backoff):
+    """Internal coroutine to run one search per event, with limited concurrency and rate.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = _RateLimiter(rate)
+    tasks = [_get_pref_mag_async(event,executor,semaphore,limiter,timeout,retries,backoff) for event in events]
+    #gather returns results in the order of the tasks, not the order they finish.
+    return await asyncio.gather(*tasks)
+
+async def _get_pref_mag_async(event,executor,semaphore,limiter,timeout,retries,backoff):
+    """Internal coroutine to search ComCat for one event, retrying failed searches.
+    """
+    loop = asyncio.get_running_loop()
+    url = _get_search_url(_get_preferred_origin(event))
+    async with semaphore:
+        for attempt in range(0,retries+1):
+            await limiter.wait()
+            try:
+                #urllib blocks, so run it in a worker thread
+                features = await loop.run_in_executor(executor,_get_features,url,timeout)
+                return _get_mag_tuple(event,features)
+            except (IOError,OSError,ValueError) as error:
+                if attempt == retries:
+                    sys.stderr.write('ComCat search "%s" failed after %i attempts: %s\n' % (url,retries+1,str(error)))
+                    return None
+                await asyncio.sleep(backoff*2**attempt)
+
+class _RateLimiter(object):
+    """Internal class that spaces out the starts of asyncio tasks to a maximum rate per second.
+    """
+    def __init__(self,rate):
+        self.interval = 0.0
+        if rate:
+            self.interval = 1.0/rate
+        self.next = 0.0
+
+    async def wait(self):
+        now = asyncio.get_running_loop().time()
+        start = max(now,self.next)
+        self.next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start-now)
+
+def _get_preferred_origin(event):
+    """Internal function to return the preferred origin of an event.
+    """
     origin = None
     for origin in event['origins']:
         if origin['preferred']:
             break
     if origin is None:
         raise Exception('No preferred origin!')
+    return origin
+
+def _get_cached_results(events,magcache):
+    """Internal function to look up events in a magnitude cache.
+
+    :returns:
+      Tuple of (list of cached results, with None for events that are not cached, list of indices 
+      of events that must be searched for).  In offline mode, nothing needs to be searched for.
+    """
+    results = [None]*len(events)
+    if magcache is None:
+        return results,list(range(0,len(events)))
+    missing = []
+    for i,event in enumerate(events):
+        results[i] = magcache.get(_get_cache_key(_get_preferred_origin(event)))
+        if results[i] is None:
+            if magcache.offline:
+                results[i] = (None,None,None)
+            else:
+                missing.append(i)
+    return results,missing
+
+def _cache_result(magcache,origin,result):
+    """Internal function to save a search result to a magnitude cache (if any).
+    """
+    if magcache is not None:
+        magcache.put(_get_cache_key(origin),result)
+
+def _get_cache_key(origin):
+    """Internal function to return the magnitude cache key of an origin (rounded as in the search URL).
+    """
+    otime = origin['time']['value'].replace(microsecond=0).strftime(TIMEFMT)
+    return (otime,'%.4f' % origin['lat'],'%.4f' % origin['lon'],RADIUS,TIMEDELTA)
+
+def _get_search_window(origin):
+    """Internal function to return the start and end times (to the second) of the search for an origin.
+    """
+    stime = origin['time']['value'] - timedelta(seconds=TIMEDELTA)
+    etime = origin['time']['value'] + timedelta(seconds=TIMEDELTA)
+    return (stime.replace(microsecond=0),etime.replace(microsecond=0))
+
+def _get_search_url(origin):
+    """Internal function to return the ComCat search URL for a single origin.
+    """
+    stime,etime = _get_search_window(origin)
     url = URLBASE.replace('[RAD]','%i' % RADIUS)
     url = url.replace('[LAT]','%.4f' % origin['lat'])
     url = url.replace('[LON]','%.4f' % origin['lon'])
-    stime = origin['time']['value'] - timedelta(seconds=TIMEDELTA)
-    etime = origin['time']['value'] + timedelta(seconds=TIMEDELTA)
     url = url.replace('[START]','%s' % stime.strftime(TIMEFMT))
     url = url.replace('[END]','%s' % etime.strftime(TIMEFMT))
-    try:
+    return url
+
+def _get_batch_url(origins,offset=1):
+    """Internal function to return the ComCat search URL covering the search windows of many origins.
+
+    offset is the (1-based) position of the first event returned, for requesting later pages of results.
+    """
+    windows = [_get_search_window(origin) for origin in origins]
+    stime = min([window[0] for window in windows])
+    etime = max([window[1] for window in windows])
+    lats = [origin['lat'] for origin in origins]
+    lons = [origin['lon'] for origin in origins]
+    #pad the bounding box by the search radius
+    latpad = RADIUS/KM_PER_DEGREE
+    maxlat = min(max(lats)+latpad,90.0)
+    minlat = max(min(lats)-latpad,-90.0)
+    coslat = math.cos(math.radians(max(abs(minlat),abs(maxlat))))
+    if coslat*KM_PER_DEGREE*360.0 < RADIUS*2:
+        lonpad = 180.0
+    else:
+        lonpad = RADIUS/(KM_PER_DEGREE*coslat)
+    url = BATCHURL.replace('[START]','%s' % stime.strftime(TIMEFMT))
+    url = url.replace('[END]','%s' % etime.strftime(TIMEFMT))
+    url = url.replace('[MINLAT]','%.4f' % minlat)
+    url = url.replace('[MAXLAT]','%.4f' % maxlat)
+    url = url.replace('[MINLON]','%.4f' % (min(lons)-lonpad))
+    url = url.replace('[MAXLON]','%.4f' % (max(lons)+lonpad))
+    url = url.replace('[LIMIT]','%i' % BATCH_LIMIT)
+    url = url.replace('[OFFSET]','%i' % offset)
+    return url
+
+def _get_local_features(origin,comcat):
+    """Internal function to return the features of a ComCatIndex matching the ComCat search for an origin.
+    """
+    stime,etime = _get_search_window(origin)
+    stime = calendar.timegm(stime.timetuple())*1000
+    etime = calendar.timegm(etime.timetuple())*1000
+    return comcat.search(stime,etime,round(origin['lat'],4),round(origin['lon'],4),RADIUS)
+
+def _get_features(url,timeout=None):
+    """Internal function to return the list of GeoJSON features returned by a ComCat search.
+    """
+    if timeout is None:
         fh = request.urlopen(url)
-    except:
-        pass
+    else:
+        fh = request.urlopen(url,timeout=timeout)
     data = fh.read().decode('utf-8')
     fh.close()
     jdict = json.loads(data)
-    if not 'features' in jdict or len(jdict['features']) > 1 or len(jdict['features']) == 0:
-        print('No event matching %s M%.1f' % (event['time'],event['magnitude'][0]['magnitude']))
+    if 'features' not in jdict:
+        return []
+    return jdict['features']
+
+def _match_features(origin,features):
+    """Internal function to return features within RADIUS km and the TIMEDELTA second window of an origin.
+    """
+    stime,etime = _get_search_window(origin)
+    stime = calendar.timegm(stime.timetuple())*1000
+    etime = calendar.timegm(etime.timetuple())*1000
+    lat = round(origin['lat'],4)
+    lon = round(origin['lon'],4)
+    matches = []
+    for feature in features:
+        ftime = feature['properties']['time']
+        if ftime < stime or ftime > etime:
+            continue
+        flon,flat = feature['geometry']['coordinates'][0:2]
+        if _get_distance(lat,lon,flat,flon) > RADIUS:
+            continue
+        matches.append(feature)
+    return matches
+
+def _get_distance(lat1,lon1,lat2,lon2):
+    """Internal function to return the great circle distance (km) between two points.
+    """
+    lat1,lon1,lat2,lon2 = [math.radians(x) for x in (lat1,lon1,lat2,lon2)]
+    a = math.sin((lat2-lat1)/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin((lon2-lon1)/2)**2
+    return 2*EARTH_RADIUS*math.asin(min(1.0,math.sqrt(a)))
+
+def _get_mag_tuple(event,features):
+    """Internal function to return the (magnitude value,magnitude source, magnitude type) of the only matching feature.
+    """
+    if len(features) != 1:
+        origin = _get_preferred_origin(event)
+        print('No event matching %s M%.1f' % (origin['time']['value'],event['magnitudes'][0]['value']))
         return (None,None,None)
-    try:
-        pevent = jdict['features'][0]
-    except:
-        pass
-    etime = datetime.utcfromtimestamp(pevent['properties']['time']/1000)
-    elon,elat,edep = pevent['geometry']['coordinates']
-    emag = pevent['properties']['mag']
-    prefmag = emag
+    pevent = features[0]
+    prefmag = pevent['properties']['mag']
     prefsource = pevent['properties']['sources'].split(',')[1]
     preftype = pevent['properties']['magType']
     return (prefmag,prefsource,preftype)
@@ -229,72 +528,137 @@ def readPhaseLine(event,line,st):
     :param line:
       Line from MLOC file ("P + URVA     0.51 133 Pg       2011  8 23 17 51 13.08  -2  -0.1  0.10")
     :returns:
-      Modified event dictionary with new or appended 'phases' list of dictionaries.
+      Modified event dictionary with new or appended 'phases' PhaseTable (see eqconvert.phases).  
+      A phase with the same station and phase name as a previous phase replaces it in the table.
     """
     parts = line[1:].split()
-    phase = {}
     #some phases are recorded but not used
     #following Hydra precedent here and using arrival->timeWeight=0 to mark those unused phases
-    phase['weight'] = USAGE[parts[0]] 
+    weight = USAGE[parts[0]] 
     station = parts[1]
-    phase['name'] = parts[4]
-    phase['distance'] = float(parts[2])
-    phase['azimuth'] = int(parts[3])
-    year = int(parts[5])
-    month = int(parts[6])
-    day = int(parts[7])
-    hour = int(parts[8])
-    minute = int(parts[9])
-    second = float(parts[10])
-    microsecond = int((second - int(second))*1e6)
-    second = int(second) - 1 #assumption here is that input seconds are 1 to 60
-    if second == -1: #sometimes seconds are 0 to 59, sometimes 1 to 60.  Not my problem.
-        second = 0
-    phase['time'] = datetime(year,month,day,hour,minute,second,microsecond)
+    name = parts[4]
+    distance = float(parts[2])
+    azimuth = int(parts[3])
+    phasetime = _get_phase_time(parts)
     nscl_station = station
     if 'stations' in event and station in event['stations']:
         nscl_station = st.getStationByLocation(station,
                                                lat=event['stations'][station]['lat'],
                                                lon=event['stations'][station]['lon'])
         if nscl_station == station:
-            nscl_station = st.getNSCL(station,phase['name'],phase['time'])
+            nscl_station = st.getNSCL(station,name,phasetime)
     else:
-        nscl_station = st.getNSCL(station,phase['name'],phase['time'])
-    phase['id'] = phase['time'].strftime('%Y%m%d%H%M%S')+'_%s_%s' % (phase['name'],nscl_station)
-    phase['station'] = nscl_station
-    phase['precision'] = int(parts[11])
-    phase['residual'] = float(parts[12])
-    #phase['error'] = float(parts[13])
-    phasekey = phase['station']+'_'+phase['name']
-    #if this phase matches one previously found, we'll replace that in the list.
+        nscl_station = st.getNSCL(station,name,phasetime)
+    precision = int(parts[11])
+    residual = float(parts[12])
+    #error = float(parts[13])
     origin = event['origins'][0]
     if 'phases' not in origin:
-        origin['phases'] = [phase.copy()]
-    else:
-        haskey = False
-        for i in range(0,len(origin['phases'])):
-            tphase = origin['phases'][i]
-            if tphase['station']+'_'+tphase['name'] == phasekey:
-                origin['phases'][i] = phase.copy()
-                haskey = True
-                break
-        if not haskey:
-            origin['phases'].append(phase.copy())
-
+        origin['phases'] = PhaseTable()
+    #if this phase matches one previously found, the table will replace it.
+    origin['phases'].add(name,nscl_station,distance,azimuth,phasetime,precision,residual,weight)
     return event
 
+def _get_phase_time(parts):
+    """Internal function to return the arrival time of a phase line split into parts.
+    """
+    year = int(parts[5])
+    month = int(parts[6])
+    day = int(parts[7])
+    hour = int(parts[8])
+    minute = int(parts[9])
+    second = float(parts[10])
+    microsecond = int((second - int(second))*1e6)
+    second = int(second) - 1 #assumption here is that input seconds are 1 to 60
+    if second == -1: #sometimes seconds are 0 to 59, sometimes 1 to 60.  Not my problem.
+        second = 0
+    return datetime(year,month,day,hour,minute,second,microsecond)
+
+def _iter_station_requests(qomfile):
+    """Internal generator yielding (station,phase name,phase time,lat,lon) for each phase line of an MLOC file.
 
-def get_events(qomfile,contributor='us',catalog='us'):
+    lat and lon are those of the event's station line for the station, or None if there is no station line.
+    """
+    stations = {}
+    with open(qomfile,'rt') as f:
+        for line in f:
+            if line.startswith('C'):
+                parts = line[1:].strip().split()
+                stations[parts[0]] = (float(parts[1]),float(parts[2]))
+            if line.startswith('P'):
+                parts = line[1:].split()
+                lat,lon = stations.get(parts[1],(None,None))
+                yield (parts[1],parts[4],_get_phase_time(parts),lat,lon)
+            if line.startswith('STOP'):
+                stations = {}
+
+def get_events(qomfile,contributor='us',catalog='us',lookup='single',magcache=None,comcat=None,stationcache=None,
+               stationworkers=None,inventory=None):
     """Parse MLOC format file, return list of event dictionaries, including origin, magnitude, and phase information.
 
+    See iter_events() for a description of the input parameters and event dictionaries.
+
+    :param lookup:
+      How to search ComCat for the preferred magnitudes of events larger than MINMAG:
+       - 'single' One search per event (see getPrefMag()).
+       - 'batch' One search for each group of events close in time (see getPrefMags()).
+       - 'async' One search per event, run concurrently (see getPrefMagsAsync()).
+    :param magcache:
+      eqconvert.cache.MagnitudeCache object, used to avoid repeating ComCat searches, or None.
+    :param comcat:
+      eqconvert.comcat.ComCatIndex object of a ComCat export to search instead of ComCat 
+      (lookup and magcache are then ignored), or None.
+    :param stationcache:
+      SQLite file used to store CWB station lookups between runs (see eqconvert.cache.StationCache), or None.
+    :param stationworkers:
+      Number of threads used to look up all stations before parsing (see StationTranslator.resolveStations()), 
+      None to use STATION_WORKERS, or 0 to look up each station as it is parsed.
+    :param inventory:
+      eqconvert.inventory.StationInventory object used to look up stations instead of the CWB server, or None.
+    :returns:
+      List of event dictionaries.
+    """
+    if lookup not in LOOKUPS:
+        raise Exception('Unknown magnitude lookup "%s", must be one of %s' % (lookup,str(LOOKUPS)))
+    events = list(_iter_parsed_events(qomfile,contributor=contributor,catalog=catalog,stationcache=stationcache,
+                                      stationworkers=stationworkers,inventory=inventory))
+    print('Read %i events' % len(events))
+    return _set_pref_mags(events,lookup,magcache,comcat)
+
+def iter_events(qomfile,contributor='us',catalog='us',lookup='single',magcache=None,comcat=None,stationcache=None,
+                stationworkers=None,inventory=None):
+    """Parse MLOC format file, yield event dictionaries, including origin, magnitude, and phase information.
+
+    With single lookups, each event is yielded as soon as its STOP line has been read (and its 
+    preferred magnitude has been looked up in ComCat).  With batch and async lookups, events 
+    are parsed LOOKUP_BATCHSIZE at a time, and the magnitudes of each batch are looked up 
+    together.  Either way, memory use does not depend on the size of the input file.
+
     :param qomfile:
       File in MLOC format.
     :param contributor:
       Source network of whoever is parsing this file.
     :param catalog:
       Source network of whoever created the MLOC data.
+    :param lookup:
+      How to search ComCat for the preferred magnitudes of events larger than MINMAG:
+       - 'single' One search per event (see getPrefMag()).
+       - 'batch' One search for each group of events close in time (see getPrefMags()).
+       - 'async' One search per event, run concurrently (see getPrefMagsAsync()).
+    :param magcache:
+      eqconvert.cache.MagnitudeCache object, used to avoid repeating ComCat searches, or None.
+    :param comcat:
+      eqconvert.comcat.ComCatIndex object of a ComCat export to search instead of ComCat 
+      (lookup and magcache are then ignored), or None.
+    :param stationcache:
+      SQLite file used to store CWB station lookups between runs (see eqconvert.cache.StationCache), or None.
+    :param stationworkers:
+      Number of threads used to look up all stations before parsing (see StationTranslator.resolveStations()), 
+      None to use STATION_WORKERS, or 0 to look up each station as it is parsed.
+    :param inventory:
+      eqconvert.inventory.StationInventory object used to look up stations instead of the CWB server, or None.
     :returns:
-      List of event dictionaries, which have the following fields:
+      Generator of event dictionaries, which have the following fields:
        - id Event ID.
        - catalog (see above).
        - contributor (see above).
@@ -313,69 +677,125 @@ def get_events(qomfile,contributor='us',catalog='us'):
          - type Magnitude type (ML,Mw,Mb, etc.)
          - value Magnitude value (0.0-9.9)
          - author Source of magnitude value.
-       - phases List of dictionaries, which have the following fields:
+       - phases eqconvert.phases.PhaseTable, which can be used as a list of read-only 
+         dictionaries with the following fields:
          - id Phase ID
          - name Phase type (Pg, Pn, Sg, etc.)
          - distance Distance from origin to station (dec degrees).
          - azimuth Angle between origin and station.
          - time Datetime of pick arrival time.
          - station NSCL of station where phase was determined.
+         - precision Precision of pick arrival time.
          - residual Float travel time residual (seconds).
          - weight  1 or 0 indicating whether this phase was used in the relocation.
     """
-    st = StationTranslator(dictionaryfile=None)
-    f = open(qomfile,'rt')
+    if lookup not in LOOKUPS:
+        raise Exception('Unknown magnitude lookup "%s", must be one of %s' % (lookup,str(LOOKUPS)))
+    batchsize = LOOKUP_BATCHSIZE
+    if lookup == 'single' or comcat is not None:
+        batchsize = 1
     events = []
+    for event in _iter_parsed_events(qomfile,contributor=contributor,catalog=catalog,stationcache=stationcache,
+                                     stationworkers=stationworkers,inventory=inventory):
+        events.append(event)
+        if len(events) == batchsize:
+            for batch_event in _set_pref_mags(events,lookup,magcache,comcat):
+                yield batch_event
+            events = []
+    for batch_event in _set_pref_mags(events,lookup,magcache,comcat):
+        yield batch_event
+
+def _iter_parsed_events(qomfile,contributor='us',catalog='us',stationcache=None,stationworkers=None,inventory=None):
+    """Internal generator yielding events from an MLOC file, without ComCat magnitude information.
+    """
+    if stationworkers is None:
+        stationworkers = STATION_WORKERS
+    cache = None
+    if stationcache is not None:
+        cache = StationCache(stationcache)
+    st = StationTranslator(dictionaryfile=None,poolsize=max(stationworkers,POOLSIZE),cache=cache,inventory=inventory)
+    if stationworkers > 0 and inventory is None:
+        #look up all of the stations first, so that parsing doesn't wait for the CWB server
+        st.resolveStations(_iter_station_requests(qomfile),workers=stationworkers)
     event = {'catalog':catalog,
              'contributor':contributor}
     i = 1
     nphases = 0
-    phaselist = []
     comment = ''    
-    for line in f.readlines():
-        if line.startswith('L'):
-            event = readLayerLine(event,line)
-        if line.startswith('C'):
-            event = readStationLine(event,line)
-        if line.startswith('#'):
-            comment += line.strip('#')
-        if line.startswith('E'):
-            event['id'] = '%08i' % i #ignore Eric's event ID fields
-        if line.startswith('H'):
-            event = readHypoLine(event,line)
-        if line.startswith('M'):
-            event = readMagnitudeLine(event,line)
-        if line.startswith('P'):
-            #sys.stderr.write('reading phase line %i ("%s")\n' % (nphases+1,line))
-            nphases += 1
-            event = readPhaseLine(event,line,st)
-        if line.startswith('STOP'):
-            if 'stations' in event:
-                del event['stations']
-            events.append(event.copy())
-            sys.stderr.write('Parsed event %i\n' % i)
-            i += 1
-            sys.stderr.flush()
-            event = {'catalog':catalog,
-                     'contributor':contributor}
-    f.close()
-    print('Read %i events' % len(events))
-
-    #try to find the best magnitude from comcat for the larger events
-    for event in events:
-        if event['magnitudes'][0]['value'] > MINMAG:
-            prefmag,prefsource,preftype = getPrefMag(event)
-            if prefmag is not None:
-                for i in range(0,len(event['magnitudes'])):
-                    if event['magnitudes'][i]['preferred']:
-                        event['magnitudes'][i]['preferred'] = False
-                        
-                event['magnitudes'].append({'preferred':True,
-                                            'type':preftype,
-                                            'value':prefmag,
-                                            'author':prefsource})
-
+    with open(qomfile,'rt') as f:
+        for line in f:
+            if line.startswith('L'):
+                event = readLayerLine(event,line)
+            if line.startswith('C'):
+                event = readStationLine(event,line)
+            if line.startswith('#'):
+                comment += line.strip('#')
+            if line.startswith('E'):
+                event['id'] = '%08i' % i #ignore Eric's event ID fields
+            if line.startswith('H'):
+                event = readHypoLine(event,line)
+            if line.startswith('M'):
+                event = readMagnitudeLine(event,line)
+            if line.startswith('P'):
+                #sys.stderr.write('reading phase line %i ("%s")\n' % (nphases+1,line))
+                nphases += 1
+                event = readPhaseLine(event,line,st)
+            if line.startswith('STOP'):
+                if 'stations' in event:
+                    del event['stations']
+                if 'origins' in event and 'phases' in event['origins'][0]:
+                    event['origins'][0]['phases'].drop_index()
+                sys.stderr.write('Parsed event %i\n' % i)
+                i += 1
+                sys.stderr.flush()
+                yield event
+                event = {'catalog':catalog,
+                         'contributor':contributor}
+    sys.stderr.write(st.getReport())
+
+def _set_pref_mags(events,lookup,magcache,comcat):
+    """Internal function to look up the ComCat preferred magnitudes of the events larger than MINMAG.
+
+    :param events:
+      List of event dictionaries.
+    :param lookup:
+      Kind of ComCat search (one of LOOKUPS, see get_events()).
+    :param magcache:
+      eqconvert.cache.MagnitudeCache object, or None.
+    :param comcat:
+      eqconvert.comcat.ComCatIndex object, or None.
+    :returns:
+      The same list of events, with ComCat magnitudes added as preferred magnitudes.
+    """
+    large_events = [event for event in events if event['magnitudes'][0]['value'] > MINMAG]
+    if comcat is not None:
+        results = [getPrefMag(event,comcat=comcat) for event in large_events]
+    elif lookup == 'batch':
+        results = getPrefMags(large_events,magcache=magcache)
+    elif lookup == 'async':
+        results = getPrefMagsAsync(large_events,magcache=magcache)
+    else:
+        results = [getPrefMag(event,magcache=magcache) for event in large_events]
+    for event,result in zip(large_events,results):
+        _set_pref_mag(event,result)
     return events
 
+def _set_pref_mag(event,result):
+    """Internal function to add a ComCat preferred magnitude to an event, making it the preferred magnitude.
 
-    
+    :param event:
+      Event dictionary.
+    :param result:
+      Tuple of (magnitude value,magnitude source, magnitude type) returned by getPrefMag(), which may be all None.
+    """
+    prefmag,prefsource,preftype = result
+    if prefmag is not None:
+        for i in range(0,len(event['magnitudes'])):
+            if event['magnitudes'][i]['preferred']:
+                event['magnitudes'][i]['preferred'] = False
+                    
+        event['magnitudes'].append({'preferred':True,
+                                    'type':preftype,
+                                    'value':prefmag,
+                                    'author':prefsource})
+    return event
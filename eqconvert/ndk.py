@@ -8,14 +8,117 @@ import optparse
 import re
 import math
 import pickle
+import bisect
+import mmap
+import io
+
+#third party imports
+import numpy as np
+
+#local imports
+from .tensor import decompose,MT_COMPONENTS
 
 
 TIMEFMT = '%Y-%m-%d %H:%M:%S'
 DYNECM_TO_NEWTONMETERS = 1/1e7
+LINEWIDTH = 80
+
+#number of events whose moment tensors are decomposed together by iter_events()
+BATCHSIZE = 10000
+
+INDEX_EXT = '.idx'
+INDEX_HEADER = '#ndkindex'
+INDEX_TIMEFMT = '%Y-%m-%dT%H:%M:%S.%f'
+
+#(start,end) column positions of numeric fields in each of the five lines of an NDK record,
+#matching the slices used in _parseLine1() through _parseLine5().
+FLOAT_FIELDS = {'lat':(0,27,33),
+                'lon':(0,34,41),
+                'depth':(0,42,47),
+                'seconds':(0,22,26),
+                'duration':(1,75,LINEWIDTH),
+                'ctimeshift':(2,9,18),
+                'ctimeerror':(2,18,23),
+                'clat':(2,23,30),
+                'claterror':(2,29,34),
+                'clon':(2,34,42),
+                'clonerror':(2,42,47),
+                'cdepth':(2,47,53),
+                'cdeptherror':(2,53,58),
+                'exponent':(3,0,2),
+                'mrr':(3,2,9),
+                'mrrerror':(3,9,15),
+                'mtt':(3,15,22),
+                'mtterror':(3,22,28),
+                'mpp':(3,28,35),
+                'mpperror':(3,35,41),
+                'mrt':(3,41,48),
+                'mrterror':(3,48,54),
+                'mrp':(3,54,61),
+                'mrperror':(3,61,67),
+                'mtp':(3,67,74),
+                'mtperror':(3,74,LINEWIDTH),
+                'tvalue':(4,3,11),
+                'tplunge':(4,11,14),
+                'tazimuth':(4,14,18),
+                'nvalue':(4,18,26),
+                'nplunge':(4,26,29),
+                'nazimuth':(4,29,33),
+                'pvalue':(4,33,41),
+                'pplunge':(4,41,44),
+                'pazimuth':(4,44,48),
+                'm0':(4,49,56),
+                'strike1':(4,56,60),
+                'dip1':(4,60,63),
+                'rake1':(4,63,68),
+                'strike2':(4,68,72),
+                'dip2':(4,72,75),
+                'rake2':(4,75,LINEWIDTH)}
+INT_FIELDS = {'year':(0,5,9),
+              'month':(0,10,12),
+              'day':(0,13,15),
+              'hour':(0,16,18),
+              'minute':(0,19,21),
+              'bodystations':(1,19,22),
+              'bodychannels':(1,22,27),
+              'surfacestations':(1,34,37),
+              'surfacechannels':(1,37,42),
+              'mantlestations':(1,49,52),
+              'mantlechannels':(1,52,57)}
+STRING_FIELDS = {'esource':(0,0,4),
+                 'id':(1,0,16),
+                 'cmt':(1,62,68),
+                 'functype':(1,69,74),
+                 'centroid':(2,9,59)}
+#fields (already multiplied by 10**exponent) that are converted from dyne-cm to newton-meters
+MOMENT_FIELDS = ['mrr','mrrerror','mtt','mtterror','mpp','mpperror',
+                 'mrt','mrterror','mrp','mrperror','mtp','mtperror',
+                 'tvalue','nvalue','pvalue','m0']
+#inversion type and method for each "CMT: N" code on line 2
+CMT_TYPES = {0:('general','Mwc'),
+             1:('zero trace','Mwc'),
+             2:('double couple','Mwc'),
+             3:('general','Mww'),
+             4:('zero trace','Mww'),
+             5:('double couple','Mww')}
 
 def get_events(filename,contributor=None,catalog=None):
     """Parse (possibly multi-event) NDK format file and return a list of dictionaries for each event.
 
+    See iter_events() for a description of the input parameters and event dictionaries.  The 
+    moment tensors of all events are decomposed together (see add_decomposition()).
+
+    :returns:
+      List of event dictionaries.
+    """
+    return add_decomposition(list(_iter_records(filename,contributor=contributor,catalog=catalog)))
+
+def iter_events(filename,contributor=None,catalog=None,batchsize=BATCHSIZE):
+    """Parse (possibly multi-event) NDK format file and yield a dictionary for each event.
+
+    Events are parsed batchsize at a time, so that their moment tensors can be decomposed together 
+    (see add_decomposition()), and memory use does not depend on the size of the input file.
+
     The NDK format is explained here:
     http://www.ldeo.columbia.edu/~gcmt/projects/CMT/catalog/allorder.ndk_explained
 
@@ -25,8 +128,10 @@ def get_events(filename,contributor=None,catalog=None):
       Source network of whoever is parsing this file.
     :param catalog:
       Source network of whoever created the MLOC data.
+    :param batchsize:
+      Number of events parsed before they are yielded.
     :returns:
-      List of event dictionaries, which have the following fields:
+      Generator of event dictionaries, which have the following fields:
        - id Event ID.
        - catalog (see above).
        - contributor (see above).
@@ -69,44 +174,298 @@ def get_events(filename,contributor=None,catalog=None):
          - mrr/mtt/mpp/mrt/mrp/mtp Dictionaries of moment tensor component information, containing fields:
            - value Component value in newton-meters.
            - uncertainty Component uncertainty in newton-meters.
+         - doublecouple Double couple fraction of moment tensor (0-1).
+         - clvd Compensated linear vector dipole fraction of moment tensor (0-1).
+    """
+    if batchsize < 1:
+        raise Exception('NDK batch size must be at least 1, not %i' % batchsize)
+    events = []
+    for event in _iter_records(filename,contributor=contributor,catalog=catalog):
+        events.append(event)
+        if len(events) == batchsize:
+            for batch_event in add_decomposition(events):
+                yield batch_event
+            events = []
+    for batch_event in add_decomposition(events):
+        yield batch_event
+
+def add_decomposition(events):
+    """Add the double couple and CLVD fractions of each event's moment tensor, decomposing all tensors at once.
+
+    :param events:
+      List of event dictionaries (see iter_events()).
+    :returns:
+      The same list, with 'doublecouple' and 'clvd' fields added to each 'moment' dictionary.
+    """
+    if not len(events):
+        return events
+    components = [[event['moment'][comp]['value'] for event in events] for comp in MT_COMPONENTS]
+    results = decompose(*components)
+    for event,doublecouple,clvd in zip(events,results['doublecouple'].tolist(),results['clvd'].tolist()):
+        event['moment']['doublecouple'] = doublecouple
+        event['moment']['clvd'] = clvd
+    return events
+
+def _iter_records(filename,contributor=None,catalog=None):
+    """Internal generator yielding a dictionary for each NDK record, without moment tensor decomposition.
     """
     if contributor is None:
         contributor = 'us'
     if catalog is None:
         catalog = 'us'
-    events = []
-    fh = open(filename,'rt')
-    lc = 0
+    lines = []
+    with open(filename,'rt') as fh:
+        for line in fh:
+            lines.append(line)
+            if len(lines) == 5:
+                yield _parse_record(lines,catalog,contributor)
+                lines = []
+
+def _parse_record(lines,catalog,contributor):
+    """Internal function to parse the five lines of an NDK record into an event dictionary.
+    """
     tdict = {'catalog':catalog,
              'contributor':contributor}
-    for line in fh.readlines():
-        if (lc+1) % 5 == 1:
-            tdict = _parseLine1(line,tdict)
-            lc += 1
-            continue
-        if (lc+1) % 5 == 2:
-            tdict = _parseLine2(line,tdict)
-            lc += 1
-            continue
-        if (lc+1) % 5 == 3:
-            tdict = _parseLine3(line,tdict)
-            lc += 1
-            continue
-        if (lc+1) % 5 == 4:
-            tdict = _parseLine4(line,tdict)
-            lc += 1
-            continue
-        if (lc+1) % 5 == 0:
-            tdict = _parseLine5(line,tdict)
-            del tdict['exponent']
-            tdict['focal']['evalstatus'] = 'reviewed'
-            events.append(tdict)
+    tdict = _parseLine1(lines[0],tdict)
+    tdict = _parseLine2(lines[1],tdict)
+    tdict = _parseLine3(lines[2],tdict)
+    tdict = _parseLine4(lines[3],tdict)
+    tdict = _parseLine5(lines[4],tdict)
+    del tdict['exponent']
+    tdict['focal']['evalstatus'] = 'reviewed'
+    return tdict
+
+class NDKIndex(list):
+    """List of (byte offset,event ID,origin datetime) tuples of the events in an NDK file, in file order.
+
+    The position in the list of each event ID is kept in a dictionary, so that events can be found 
+    by ID without searching the list (see get_position()).
+    """
+    def __init__(self,entries=()):
+        list.__init__(self,entries)
+        self.positions = {}
+        for i,(offset,eventid,etime) in enumerate(self):
+            self.positions.setdefault(eventid,i)
+
+    def get_position(self,eventid):
+        """Return the position in the index of the (first) event with an ID.
+
+        :param eventid:
+          Event ID.
+        :returns:
+          Position of event in the index, or None if no event has the ID.
+        """
+        return self.positions.get(eventid)
+
+def build_index(filename,indexfile=None):
+    """Find the byte offset, event ID and origin time of every event in an NDK file, and save them to an index file.
+
+    The index file is a text file, by default written next to the NDK file with INDEX_EXT appended 
+    to the file name.  The first line records the size and modification time of the NDK file, 
+    so that out of date index files can be detected (see read_index()).  Each subsequent line 
+    contains the tab separated offset, event ID and origin time of one event.
+
+    :param filename:
+      Input NDK filename.
+    :param indexfile:
+      Name of index file to write, or None to use filename+INDEX_EXT.  If the index file cannot 
+      be written (read-only folder, for example), the index is still returned.
+    :returns:
+      NDKIndex of (byte offset,event ID,origin datetime) tuples, in file order.
+    """
+    if indexfile is None:
+        indexfile = filename + INDEX_EXT
+    index = []
+    offset = 0
+    lc = 0
+    with open(filename,'rb') as fh:
+        for line in fh:
+            if lc % 5 == 0:
+                record_offset = offset
+                etime = _parseLine1(line.decode('utf-8'),{})['origins'][0]['time']
+            elif lc % 5 == 1:
+                eventid = line[0:16].decode('utf-8').strip()
+            elif lc % 5 == 4:
+                index.append((record_offset,eventid,etime))
+            offset += len(line)
             lc += 1
-            tdict = {'catalog':catalog,
-                     'contributor':contributor}
+    try:
+        stat = os.stat(filename)
+        f = open(indexfile,'wt')
+        f.write('%s size=%i mtime=%r\n' % (INDEX_HEADER,stat.st_size,stat.st_mtime))
+        for record_offset,eventid,etime in index:
+            f.write('%i\t%s\t%s\n' % (record_offset,eventid,etime.strftime(INDEX_TIMEFMT)))
+        f.close()
+    except (IOError,OSError):
+        pass
+    return NDKIndex(index)
 
-    fh.close()
-    return events
+def read_index(filename,indexfile=None):
+    """Read the index for an NDK file, (re)building it if it is missing or out of date.
+
+    :param filename:
+      Input NDK filename.
+    :param indexfile:
+      Name of index file, or None to use filename+INDEX_EXT.
+    :returns:
+      NDKIndex of (byte offset,event ID,origin datetime) tuples, in file order.
+    """
+    if indexfile is None:
+        indexfile = filename + INDEX_EXT
+    if not os.path.isfile(indexfile):
+        return build_index(filename,indexfile=indexfile)
+    stat = os.stat(filename)
+    f = open(indexfile,'rt')
+    header = f.readline().strip()
+    if header != '%s size=%i mtime=%r' % (INDEX_HEADER,stat.st_size,stat.st_mtime):
+        f.close()
+        return build_index(filename,indexfile=indexfile)
+    index = []
+    for line in f:
+        offset,eventid,timestr = line.rstrip('\n').split('\t')
+        index.append((int(offset),eventid,datetime.datetime.strptime(timestr,INDEX_TIMEFMT)))
+    f.close()
+    return NDKIndex(index)
+
+def get_event_by_id(filename,eventid,contributor=None,catalog=None,index=None):
+    """Parse only the event matching an ID from an NDK file.
+
+    :param filename:
+      Input NDK filename.
+    :param eventid:
+      Event ID (first 16 characters of the second line of the NDK record).
+    :param contributor:
+      Source network of whoever is parsing this file.
+    :param catalog:
+      Source network of whoever created the NDK data.
+    :param index:
+      NDKIndex returned by read_index(), or None to read it.
+    :returns:
+      Event dictionary (see get_events()), or None if no event matches the ID.
+    """
+    if index is None:
+        index = read_index(filename)
+    elif not isinstance(index,NDKIndex):
+        index = NDKIndex(index)
+    position = index.get_position(eventid)
+    if position is None:
+        return None
+    return _read_records(filename,index,[position],contributor,catalog)[0]
+
+def get_record_ranges(filename,chunksize,index=None):
+    """Split an NDK file into byte ranges of at most chunksize records, which can be parsed separately.
+
+    :param filename:
+      Input NDK filename.
+    :param chunksize:
+      Maximum number of records in each range.
+    :param index:
+      NDKIndex returned by read_index(), or None to read it.
+    :returns:
+      List of (start byte offset,end byte offset) tuples, in file order, where the end of the last 
+      range is None (see get_events_in_range()).
+    """
+    if chunksize < 1:
+        raise Exception('NDK chunk size must be at least 1, not %i' % chunksize)
+    if index is None:
+        index = read_index(filename)
+    ranges = []
+    for i in range(0,len(index),chunksize):
+        end = None
+        if i+chunksize < len(index):
+            end = index[i+chunksize][0]
+        ranges.append((index[i][0],end))
+    return ranges
+
+def get_events_in_range(filename,start,end=None,contributor=None,catalog=None):
+    """Parse only the NDK records in a byte range of a file.
+
+    :param filename:
+      Input NDK filename.
+    :param start:
+      Byte offset of the first record (see get_record_ranges()).
+    :param end:
+      Byte offset of the record after the range, or None to parse to the end of the file.
+    :param contributor:
+      Source network of whoever is parsing this file.
+    :param catalog:
+      Source network of whoever created the NDK data.
+    :returns:
+      List of event dictionaries (see get_events()), the same as those get_events() returns for 
+      the records in the range.
+    """
+    if contributor is None:
+        contributor = 'us'
+    if catalog is None:
+        catalog = 'us'
+    with open(filename,'rb') as fh:
+        fh.seek(start)
+        if end is None:
+            data = fh.read()
+        else:
+            data = fh.read(end-start)
+    events = []
+    lines = []
+    #read the lines as a text mode file would, so that the events match those of get_events()
+    for line in io.StringIO(data.decode('utf-8'),newline=None):
+        lines.append(line)
+        if len(lines) == 5:
+            events.append(_parse_record(lines,catalog,contributor))
+            lines = []
+    return add_decomposition(events)
+
+def get_events_by_time(filename,starttime,endtime,contributor=None,catalog=None,index=None):
+    """Parse only the events with origin times in a time window from an NDK file.
+
+    :param filename:
+      Input NDK filename.
+    :param starttime:
+      Datetime of start of window (inclusive).
+    :param endtime:
+      Datetime of end of window (inclusive).
+    :param contributor:
+      Source network of whoever is parsing this file.
+    :param catalog:
+      Source network of whoever created the NDK data.
+    :param index:
+      Index returned by read_index(), or None to read it.
+    :returns:
+      List of event dictionaries (see get_events()), in file order.
+    """
+    if index is None:
+        index = read_index(filename)
+    #NDK files are normally in time order, but we don't depend on it
+    bytime = sorted(range(0,len(index)),key=lambda i: index[i][2])
+    times = [index[i][2] for i in bytime]
+    i1 = bisect.bisect_left(times,starttime)
+    i2 = bisect.bisect_right(times,endtime)
+    matches = sorted(bytime[i1:i2])
+    return _read_records(filename,index,matches,contributor,catalog)
+
+def _read_records(filename,index,positions,contributor,catalog):
+    """Internal function to parse selected records from a memory-mapped NDK file.
+    """
+    if contributor is None:
+        contributor = 'us'
+    if catalog is None:
+        catalog = 'us'
+    events = []
+    if not len(positions):
+        return events
+    with open(filename,'rb') as fh:
+        mm = mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+        try:
+            for i in positions:
+                start = index[i][0]
+                if i+1 < len(index):
+                    end = index[i+1][0]
+                else:
+                    end = len(mm)
+                lines = mm[start:end].decode('utf-8').splitlines(True)
+                events.append(_parse_record(lines[0:5],catalog,contributor))
+        finally:
+            mm.close()
+    return add_decomposition(events)
 
 def _parseLine1(line,tdict):
     origins = []
@@ -285,3 +644,222 @@ def _parseLine5(line,tdict):
     tdict['focal']['np1'] = np1.copy()
     tdict['focal']['np2'] = np2.copy()
     return tdict
+
+
+def read_table(filename,contributor=None,catalog=None):
+    """Parse an entire (possibly multi-event) NDK format file into columnar NumPy arrays.
+
+    This is much faster than get_events() for large files (the full GCMT catalog, for example), 
+    because each field is converted for all events at once.  Event dictionaries identical to those 
+    returned by get_events() are only created when requested from the returned NDKTable.
+
+    :param filename:
+      Input NDK filename.
+    :param contributor:
+      Source network of whoever is parsing this file.
+    :param catalog:
+      Source network of whoever created the NDK data.
+    :returns:
+      NDKTable object.
+    """
+    with open(filename,'rb') as f:
+        data = f.read()
+    lines = _get_lines(data)
+    nevents = len(lines)//5
+    records = lines[0:nevents*5].reshape(nevents,5,LINEWIDTH)
+    #(5,LINEWIDTH,nevents) copy, so that each character position is contiguous across all events
+    chars = np.ascontiguousarray(records.transpose(1,2,0))
+    columns = {}
+    for name,(lineno,start,end) in FLOAT_FIELDS.items():
+        columns[name] = _parse_numbers(chars[lineno,start:end])
+    for name,(lineno,start,end) in INT_FIELDS.items():
+        columns[name] = _parse_numbers(chars[lineno,start:end],integer=True)
+    for name,(lineno,start,end) in STRING_FIELDS.items():
+        field = np.ascontiguousarray(records[:,lineno,start:end])
+        columns[name] = field.view('S%i' % (end-start)).ravel()
+
+    #math.pow() and numpy.power() do not always agree in the last bit, so use math.pow() 
+    #for each of the (few) unique exponents to get the same values as get_events().
+    exponents,inverse = np.unique(columns['exponent'],return_inverse=True)
+    scale = np.array([math.pow(10.0,exponent) for exponent in exponents])[inverse.ravel()]
+    for name in MOMENT_FIELDS:
+        columns[name] = columns[name]*scale*DYNECM_TO_NEWTONMETERS
+    columns['depth'] = columns['depth']*1000
+    columns['cdepth'] = columns['cdepth']*1000
+
+    #origin times - seconds can be 60.0 in NDK files.
+    fseconds = columns['seconds']
+    seconds = np.minimum(fseconds.astype(np.int64),59)
+    microseconds = np.minimum(((fseconds-seconds)*1e6).astype(np.int64),999999)
+    columns['second'] = seconds
+    columns['microsecond'] = microseconds
+    results = decompose(*[columns[comp] for comp in MT_COMPONENTS])
+    columns['doublecouple'] = results['doublecouple']
+    columns['clvd'] = results['clvd']
+    return NDKTable(columns,contributor=contributor,catalog=catalog)
+
+def _get_lines(data):
+    """Internal function to turn the contents of an NDK file into a (nlines,LINEWIDTH) array of bytes.
+    """
+    if not data.endswith(b'\n'):
+        data += b'\n'
+    raw = np.frombuffer(data,dtype=np.uint8)
+    #in a well-formed file every line is exactly LINEWIDTH characters, and we can use the file contents as-is
+    if len(raw) % (LINEWIDTH+1) == 0 and (raw[LINEWIDTH::LINEWIDTH+1] == ord('\n')).all():
+        return raw.reshape(-1,LINEWIDTH+1)[:,0:LINEWIDTH]
+    lines = data.splitlines()
+    while len(lines) and not lines[-1].strip():
+        lines.pop()
+    data = b''.join([line[0:LINEWIDTH].ljust(LINEWIDTH) for line in lines])
+    return np.frombuffer(data,dtype=np.uint8).reshape(-1,LINEWIDTH)
+
+def _parse_numbers(field,integer=False):
+    """Internal function to convert a fixed-width text field for all records into numbers.
+
+    Digits are accumulated into an integer one character position at a time, and the result divided 
+    by the appropriate power of ten.  Both are exactly representable for NDK field widths, so 
+    (IEEE division being correctly rounded) the results are identical to calling float() on each field.
+
+    :param field:
+      (width,nrecords) array of characters (uint8).
+    :param integer:
+      Boolean indicating whether to return integers instead of floats.
+    :returns:
+      Array of nrecords float64 (or int64) values.
+    """
+    width,nrecords = field.shape
+    value = np.zeros(nrecords,dtype=np.int64)
+    nfrac = np.zeros(nrecords,dtype=np.int64)
+    seendot = np.zeros(nrecords,dtype=bool)
+    negative = np.zeros(nrecords,dtype=bool)
+    for char in field:
+        digit = char - np.uint8(ord('0')) #non-digits wrap around to values >= 10
+        isdigit = digit < 10
+        value = np.where(isdigit,value*10 + digit,value)
+        nfrac += isdigit & seendot
+        seendot |= (char == ord('.'))
+        negative |= (char == ord('-'))
+    value[negative] *= -1
+    if integer:
+        return value
+    return value/np.power(10.0,nfrac)
+
+class NDKTable(object):
+    """Columnar representation of the events in an NDK file, created by read_table().
+
+    Each column is a NumPy array with one element per event.  Numeric columns hold values in 
+    the same units as the event dictionaries (moment tensor values in newton-meters, depths in meters), 
+    string columns hold the raw (bytes) fields from the NDK file.  Event dictionaries are built 
+    from the columns on request.
+    """
+    def __init__(self,columns,contributor=None,catalog=None):
+        if contributor is None:
+            contributor = 'us'
+        if catalog is None:
+            catalog = 'us'
+        self.columns = columns
+        self.contributor = contributor
+        self.catalog = catalog
+        self._cmtcodes = {}
+        self._lists = None
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self,index):
+        return self.get_event(index)
+
+    def __iter__(self):
+        for i in range(0,len(self)):
+            yield self.get_event(i)
+
+    def get_event(self,index):
+        """Build the event dictionary (see get_events()) for one event.
+
+        :param index:
+          Index of event in table.
+        :returns:
+          Event dictionary.
+        """
+        #indexing Python lists is much faster than indexing NumPy arrays one element at a time
+        if self._lists is None:
+            self._lists = {}
+            for name,column in self.columns.items():
+                self._lists[name] = column.tolist()
+        c = self._lists
+        i = index
+        esource = c['esource'][i].decode('utf-8')
+        etime = datetime.datetime(c['year'][i],c['month'][i],c['day'][i],
+                                  c['hour'][i],c['minute'][i],
+                                  c['second'][i],c['microsecond'][i])
+        hypo = {'id':'%s%s' % (esource,etime.strftime('%Y%m%d%H%M%S')),
+                'preferred':True,
+                'time':etime,
+                'lat':c['lat'][i],
+                'lon':c['lon'][i],
+                'depth':c['depth'][i]}
+        dtime = etime+datetime.timedelta(microseconds=c['ctimeshift'][i]*1e6)
+        centroid = {'id':c['centroid'][i].decode('utf-8').split()[-1],
+                    'time':{'value':dtime,'uncertainty':c['ctimeerror'][i]},
+                    'lat':{'value':c['clat'][i],'uncertainty':c['claterror'][i]},
+                    'lon':{'value':c['clon'][i],'uncertainty':c['clonerror'][i]},
+                    'depth':{'value':c['cdepth'][i],'uncertainty':c['cdeptherror'][i]},
+                    'preferred':False}
+        tdict = {'catalog':self.catalog,
+                 'contributor':self.contributor,
+                 'origins':[hypo,centroid],
+                 'id':c['id'][i].decode('utf-8').strip()}
+        moment = {'body':{'numstations':c['bodystations'][i],
+                          'numchannels':c['bodychannels'][i]},
+                  'surface':{'numstations':c['surfacestations'][i],
+                             'numchannels':c['surfacechannels'][i]},
+                  'mantle':{'numstations':c['mantlestations'][i],
+                            'numchannels':c['mantlechannels'][i]}}
+        tdict['moment'] = moment
+        code = self._get_cmt_code(c['cmt'][i])
+        if code is not None:
+            invtype,method = CMT_TYPES[code]
+            moment['invtype'] = invtype
+            moment['method'] = method
+            tdict['focal'] = {'method':method}
+        duration = c['duration'][i]
+        if c['functype'][i] == b'TRIHD':
+            moment['source'] = {'type':'triangle','duration':duration}
+        else:
+            tdict['source'] = {'type':'box car','duration':duration}
+        for comp in ['mrr','mtt','mpp','mrt','mrp','mtp']:
+            moment[comp] = {'value':c[comp][i],'uncertainty':c[comp+'error'][i]}
+        focal = tdict['focal']
+        for axis in ['t','n','p']:
+            focal[axis+'axis'] = {'plunge':c[axis+'plunge'][i],
+                                  'azimuth':c[axis+'azimuth'][i],
+                                  'value':c[axis+'value'][i]}
+        m0 = c['m0'][i]
+        moment['m0'] = m0
+        moment['doublecouple'] = c['doublecouple'][i]
+        moment['clvd'] = c['clvd'][i]
+        mag = (2.0/3.0) * (math.log10(m0*1e7) - 16.1)
+        mag = round(mag * 10.0)/10.0
+        tdict['magnitudes'] = [{'preferred':True,
+                                'type':focal['method'],
+                                'value':mag,
+                                'author':self.catalog}]
+        focal['np1'] = {'strike':c['strike1'][i],
+                        'dip':c['dip1'][i],
+                        'rake':c['rake1'][i]}
+        focal['np2'] = {'strike':c['strike2'][i],
+                        'dip':c['dip2'][i],
+                        'rake':c['rake2'][i]}
+        focal['evalstatus'] = 'reviewed'
+        return tdict
+
+    def _get_cmt_code(self,cmt):
+        """Internal method to find (and remember) the "CMT: N" code in a line 2 CMT field.
+        """
+        if cmt not in self._cmtcodes:
+            code = None
+            match = re.search('CMT:\\s*([0-5])',cmt.decode('utf-8').strip())
+            if match is not None:
+                code = int(match.group(1))
+            self._cmtcodes[cmt] = code
+        return self._cmtcodes[cmt]
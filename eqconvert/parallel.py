@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import os
+import pickle
+import shutil
+import tempfile
+from multiprocessing import Pool
+
+#local imports
+from .convert import create_quakeml,write_quakeml,write_csv,render_event,_write_rendered_documents
+from .formats import get_parser
+
+#number of events of an input file converted by a worker process at a time
+CHUNKSIZE = 200
+
+def convert_files(module,datafiles,outfolder,jobs,catalog='us',contributor='us',
+                  csvfile=None,bundle=None,maxevents=None,chunksize=CHUNKSIZE,cache=None,
+                  parser_args=None):
+    """Convert input data files to QuakeML using a pool of worker processes.
+
+    Input files are split into tasks, which are parsed, rendered and (unless writing to bundled
+    documents) written by worker processes, so that events never have to be sent between
+    processes.  Files of formats whose parsers can read part of a file (parser modules with
+    get_record_ranges() and get_events_in_range() functions, like ndk) are split into chunks of
+    chunksize events, and other files are converted by one worker each.
+
+    Results are collected in input order, so the output is the same as a serial run: workers
+    write QuakeML files to a temporary folder, and the parent process moves them into outfolder
+    in input order (so the last of several events with the same ID wins, as in a serial run).
+    When writing to bundled documents, workers spool rendered events to temporary files, which
+    the parent process copies into the output documents.
+
+    :param module:
+      Name of the format of the input files ('ndk','mloc','iscgem', see formats.get_format_names()).
+    :param datafiles:
+      Sequence of input data files.
+    :param outfolder:
+      Folder where QuakeML files should be written.
+    :param jobs:
+      Number of worker processes.
+    :param catalog:
+      Source network of whoever created the input data.
+    :param contributor:
+      Source network of whoever is parsing the input data.
+    :param csvfile:
+      File object where CSV lines (see write_csv()) for each event should be written, or None.
+    :param bundle:
+      None to write each event to its own file (see write_quakeml()), or the base name of
+      multi-event QuakeML files (see write_quakeml_documents()).
+    :param maxevents:
+      With bundle, the maximum number of events to write to each file.
+    :param chunksize:
+      Maximum number of events of a file converted by a worker process at a time.
+    :param cache:
+      CatalogCache object used to avoid parsing unchanged input files again, or None.  Cached
+      files are not split into chunks.
+    :param parser_args:
+      Dictionary of additional keyword arguments for the module's iter_events() function, or None.
+    :returns:
+      Tuple of (list of output file names, number of events written).
+    """
+    if parser_args is None:
+        parser_args = {}
+    chunks = []
+    for dfile in datafiles:
+        chunks += [(dfile,chunk) for chunk in _get_file_chunks(module,dfile,chunksize,cache)]
+    parse_task = (module,catalog,contributor,cache,parser_args,csvfile is not None)
+    if bundle is None:
+        spooldir = tempfile.mkdtemp(dir=outfolder)
+    else:
+        spooldir = tempfile.mkdtemp()
+    try:
+        with Pool(processes=jobs) as pool:
+            if bundle is None:
+                tasks = [(dfile,chunk,os.path.join(spooldir,'%i' % i))+parse_task
+                         for i,(dfile,chunk) in enumerate(chunks)]
+                fnames = []
+                for taskdir,names,csvlines in pool.imap(_write_chunk,tasks):
+                    _write_csv_lines(csvfile,csvlines)
+                    #a later file of a task replaces any earlier file with the same name, as in a serial run
+                    for name in names:
+                        if os.path.isfile(os.path.join(taskdir,name)):
+                            os.replace(os.path.join(taskdir,name),os.path.join(outfolder,name))
+                        fnames.append(os.path.join(outfolder,name))
+                return (fnames,len(fnames))
+            tasks = [(dfile,chunk,os.path.join(spooldir,'%i' % i))+parse_task for i,(dfile,chunk) in enumerate(chunks)]
+            rendered = _iter_rendered(pool.imap(_render_chunk,tasks),csvfile)
+            return _write_rendered_documents(rendered,outfolder,bundle,maxevents=maxevents)
+    finally:
+        shutil.rmtree(spooldir)
+
+def _get_file_chunks(module,dfile,chunksize,cache):
+    """Internal function to return the parts of an input file converted by separate tasks.
+
+    :returns:
+      List of (start,end) ranges to be passed to the parser's get_events_in_range() function, or
+      [None] if the whole file is converted by one task.
+    """
+    if cache is not None:
+        return [None]
+    parser = get_parser(module)
+    if not hasattr(parser,'get_record_ranges'):
+        return [None]
+    return parser.get_record_ranges(dfile,chunksize)
+
+def _iter_rendered(results,csvfile):
+    """Yield rendered events from a sequence of _render_chunk() results, in order.
+    """
+    for spoolfile,csvlines in results:
+        _write_csv_lines(csvfile,csvlines)
+        with open(spoolfile,'rb') as f:
+            while True:
+                try:
+                    item = pickle.load(f)
+                except EOFError:
+                    break
+                yield item
+        os.remove(spoolfile)
+
+def _write_csv_lines(csvfile,csvlines):
+    if csvfile is None:
+        return
+    for line in csvlines:
+        csvfile.write(line+'\n')
+
+def _iter_chunk_events(dfile,chunk,module,catalog,contributor,cache,parser_args):
+    """Internal function to return the events of an input file, or of a range of it.
+    """
+    parser = get_parser(module)
+    if chunk is not None:
+        return parser.get_events_in_range(dfile,chunk[0],chunk[1],catalog=catalog,contributor=contributor,
+                                          **parser_args)
+    if cache is not None:
+        return cache.get_events(parser,dfile,catalog=catalog,contributor=contributor,**parser_args)
+    return parser.iter_events(dfile,catalog=catalog,contributor=contributor,**parser_args)
+
+def _write_chunk(task):
+    """Worker function to parse part of an input file, and render and write one QuakeML file per event to a task folder.
+    """
+    dfile,chunk,taskdir,module,catalog,contributor,cache,parser_args,docsv = task
+    os.mkdir(taskdir)
+    names = []
+    csvlines = []
+    for event in _iter_chunk_events(dfile,chunk,module,catalog,contributor,cache,parser_args):
+        quakeml = create_quakeml(event)
+        names.append(os.path.basename(write_quakeml(quakeml,event['id'],taskdir,filetype=module)))
+        if docsv:
+            csvlines.append(write_csv(event))
+    return (taskdir,names,csvlines)
+
+def _render_chunk(task):
+    """Worker function to parse part of an input file, and spool its rendered QuakeML event elements to a file.
+    """
+    dfile,chunk,spoolfile,module,catalog,contributor,cache,parser_args,docsv = task
+    csvlines = []
+    with open(spoolfile,'wb') as f:
+        for event in _iter_chunk_events(dfile,chunk,module,catalog,contributor,cache,parser_args):
+            pickle.dump((event['contributor'],render_event(event)),f,protocol=pickle.HIGHEST_PROTOCOL)
+            if docsv:
+                csvlines.append(write_csv(event))
+    return (spoolfile,csvlines)
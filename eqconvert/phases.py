@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+from array import array
+from collections.abc import Mapping
+from datetime import datetime,timedelta
+
+EPOCH = datetime(1970,1,1)
+MICROSECOND = timedelta(microseconds=1)
+PHASE_FIELDS = ['id','name','distance','azimuth','time','station','precision','residual','weight']
+
+class PhaseTable(object):
+    """Compact, column oriented table of phases (picks and arrivals) for an origin.
+
+    Each column is stored in an array (or, for station and phase names, a list of interned
+    strings), so a phase takes tens of bytes instead of the kilobyte or so of a phase dictionary.
+    Phase times are stored as microseconds since 1970, and phase IDs are created when they are
+    requested.  A phase with the same station and phase name as a previous phase replaces it,
+    keeping its position in the table.
+
+    For compatibility with code expecting a list of phase dictionaries, indexing and iterating
+    over the table return read-only PhaseView mappings, with the fields id, name, distance,
+    azimuth, time, station, precision, residual and weight.
+    """
+    def __init__(self,phases=None):
+        """Create a phase table.
+
+        :param phases:
+          Optional sequence of phase dictionaries (see PHASE_FIELDS; id is ignored, and precision is optional) 
+          to add to the table.
+        """
+        self.names = []
+        self.stations = []
+        self.distances = array('d')
+        self.azimuths = array('l')
+        self.times = array('q')
+        self.precisions = array('l')
+        self.residuals = array('d')
+        self.weights = array('b')
+        self._index = {}
+        if phases is not None:
+            for phase in phases:
+                self.add(phase['name'],phase['station'],phase['distance'],phase['azimuth'],phase['time'],
+                         phase.get('precision',0),phase['residual'],phase['weight'])
+
+    def __getstate__(self):
+        #the index is rebuilt when needed, so don't store it
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self,i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('Phase index out of range')
+        return PhaseView(self,i)
+
+    def __iter__(self):
+        for i in range(0,len(self)):
+            yield PhaseView(self,i)
+
+    def __eq__(self,other):
+        try:
+            return len(self) == len(other) and list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def add(self,name,station,distance,azimuth,time,precision,residual,weight):
+        """Add a phase to the table, replacing any previous phase with the same station and phase name.
+
+        :param name:
+          Phase type (Pg, Pn, Sg, etc.)
+        :param station:
+          NSCL of station where phase was determined.
+        :param distance:
+          Distance from origin to station (dec degrees).
+        :param azimuth:
+          Angle between origin and station.
+        :param time:
+          Datetime of pick arrival time.
+        :param precision:
+          Precision of pick arrival time.
+        :param residual:
+          Float travel time residual (seconds).
+        :param weight:
+          1 or 0 indicating whether this phase was used in the relocation.
+        :returns:
+          Position of the phase in the table.
+        """
+        name = sys.intern(name)
+        station = sys.intern(station)
+        microseconds = (time - EPOCH)//MICROSECOND
+        if self._index is None:
+            self._index = self._get_index()
+        phasekey = station+'_'+name
+        if phasekey in self._index:
+            i = self._index[phasekey]
+            self.names[i] = name
+            self.stations[i] = station
+            self.distances[i] = distance
+            self.azimuths[i] = azimuth
+            self.times[i] = microseconds
+            self.precisions[i] = precision
+            self.residuals[i] = residual
+            self.weights[i] = weight
+            return i
+        i = len(self.times)
+        self._index[phasekey] = i
+        self.names.append(name)
+        self.stations.append(station)
+        self.distances.append(distance)
+        self.azimuths.append(azimuth)
+        self.times.append(microseconds)
+        self.precisions.append(precision)
+        self.residuals.append(residual)
+        self.weights.append(weight)
+        return i
+
+    def drop_index(self):
+        """Release the station/phase name index used by add() (it is rebuilt if more phases are added).
+        """
+        self._index = None
+
+    def get_time(self,i):
+        """Return the arrival time of a phase as a datetime.
+        """
+        return EPOCH + timedelta(microseconds=self.times[i])
+
+    def get_id(self,i):
+        """Return the ID of a phase, made from its time, phase name and station.
+        """
+        return self.get_time(i).strftime('%Y%m%d%H%M%S')+'_%s_%s' % (self.names[i],self.stations[i])
+
+    def get_phase(self,i):
+        """Return a phase as a dictionary.
+        """
+        return {'id':self.get_id(i),
+                'name':self.names[i],
+                'distance':self.distances[i],
+                'azimuth':self.azimuths[i],
+                'time':self.get_time(i),
+                'station':self.stations[i],
+                'precision':self.precisions[i],
+                'residual':self.residuals[i],
+                'weight':self.weights[i]}
+
+    def _get_index(self):
+        index = {}
+        for i in range(0,len(self.times)):
+            phasekey = self.stations[i]+'_'+self.names[i]
+            if phasekey not in index:
+                index[phasekey] = i
+        return index
+
+class PhaseView(Mapping):
+    """Read-only dictionary view of one phase in a PhaseTable, reading values from the table's columns.
+    """
+    __slots__ = ('table','index')
+
+    def __init__(self,table,index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self,key):
+        table = self.table
+        i = self.index
+        if key == 'id':
+            return table.get_id(i)
+        if key == 'name':
+            return table.names[i]
+        if key == 'distance':
+            return table.distances[i]
+        if key == 'azimuth':
+            return table.azimuths[i]
+        if key == 'time':
+            return table.get_time(i)
+        if key == 'station':
+            return table.stations[i]
+        if key == 'precision':
+            return table.precisions[i]
+        if key == 'residual':
+            return table.residuals[i]
+        if key == 'weight':
+            return table.weights[i]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(PHASE_FIELDS)
+
+    def __len__(self):
+        return len(PHASE_FIELDS)
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def copy(self):
+        """Return the phase as a (new) dictionary.
+        """
+        return self.table.get_phase(self.index)
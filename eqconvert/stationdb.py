@@ -1,15 +1,276 @@
 import re
 import socket
+import threading
+import time
+import json
+from bisect import bisect_left
+from collections import OrderedDict,deque
 from datetime import timedelta,datetime
+from concurrent.futures import ThreadPoolExecutor
 
 CWBHOST = 'cwbpub.cr.usgs.gov'
 CWBPORT = 2052
+POOLSIZE = 4 #maximum number of open connections to the CWB server
+TIMEOUT = 30 #seconds to wait when connecting to or reading from the CWB server
+REQUEST_TIMEOUT = 120 #maximum seconds for a whole CWB request, however slowly the response arrives
+BREAKER_THRESHOLD = 5 #consecutive failed CWB requests before requests are stopped
+BREAKER_RESET = 60 #seconds before a request is tried again after requests are stopped
+RESOLVE_WINDOW = 1000 #requests read ahead of the lookups they wait for in StationTranslator.resolveStations()
+EOR = '<EOR>'
+EPOCHFMT = '%Y-%m-%d %H:%M:%S'
 
 TIMERROR = 5 #how many days can the phase time be from a given station epoch before we don't consider it to be part of that epoch 
 
+class CWBConnectionPool(object):
+    """Pool of open (keep-alive) connections to a CWB query server.
+
+    Requests are sent on an idle connection if there is one, or on a new connection if fewer than 
+    size connections are in use.  A connection that fails (for example, because the server closed 
+    it) is replaced by a new connection and the request is sent again.
+    """
+    def __init__(self,host=None,port=None,size=POOLSIZE,timeout=TIMEOUT,deadline=REQUEST_TIMEOUT):
+        """Create a connection pool.
+
+        :param host:
+          CWB query server host name, or None to use CWBHOST.
+        :param port:
+          CWB query server port, or None to use CWBPORT.
+        :param size:
+          Maximum number of open connections.
+        :param timeout:
+          Timeout in seconds for connecting and for each read from the server.
+        :param deadline:
+          Timeout in seconds for sending a request and reading the whole response.
+        """
+        if host is None:
+            host = CWBHOST
+        if port is None:
+            port = CWBPORT
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.deadline = deadline
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        self.nconnects = 0
+
+    def request(self,req):
+        """Send a request and return the response, up to and including the <EOR> marker.
+
+        :param req:
+          Request string.
+        :returns:
+          Response string.
+        :raises:
+          socket.error (or socket.timeout) if the request fails on a new connection, or the server 
+          closes a new connection before the <EOR> marker.
+        """
+        with self.slots:
+            with self.lock:
+                sock = None
+                if len(self.idle):
+                    sock = self.idle.pop()
+            if sock is not None:
+                try:
+                    response,complete = self._send(sock,req)
+                    if complete:
+                        self._release(sock)
+                        return response
+                except socket.error:
+                    pass
+                #the server may have closed an idle connection, so try again on a new one
+                sock.close()
+            sock = self._connect()
+            try:
+                response,complete = self._send(sock,req)
+            except:
+                sock.close()
+                raise
+            if not complete:
+                sock.close()
+                #an incomplete response would look like a lookup that found nothing
+                raise socket.error('CWB server closed connection before end of response')
+            self._release(sock)
+            return response
+
+    def close(self):
+        """Close all idle connections.
+        """
+        with self.lock:
+            for sock in self.idle:
+                sock.close()
+            self.idle = []
+
+    def _connect(self):
+        sock = socket.create_connection((self.host,self.port),timeout=self.timeout)
+        with self.lock:
+            self.nconnects += 1
+        return sock
+
+    def _send(self,sock,req):
+        """Send request, return (response,boolean indicating whether the <EOR> marker was received).
+        """
+        endtime = time.time() + self.deadline
+        sock.settimeout(self.timeout)
+        sock.sendall(req.encode('utf-8'))
+        data = b''
+        while True:
+            remaining = endtime - time.time()
+            if remaining <= 0:
+                raise socket.timeout('CWB response not complete after %.1f seconds' % self.deadline)
+            sock.settimeout(min(self.timeout,remaining))
+            block = sock.recv(10241)
+            if not block:
+                break
+            data += block
+            if data.find(EOR.encode('utf-8')) > -1:
+                return (data.decode('utf-8'),True)
+        return (data.decode('utf-8'),False)
+
+    def _release(self,sock):
+        with self.lock:
+            self.idle.append(sock)
+
+class CircuitBreaker(object):
+    """Stops requests to a server that keeps failing, so that lookups fail fast.
+
+    After threshold consecutive failures the breaker opens, and allow() returns False until reset 
+    seconds have passed.  Then one request is allowed through: if it succeeds the breaker closes, 
+    and if it fails the breaker stays open for another reset seconds.
+    """
+    def __init__(self,threshold=BREAKER_THRESHOLD,reset=BREAKER_RESET):
+        """Create a circuit breaker.
+
+        :param threshold:
+          Number of consecutive failures that open the breaker.
+        :param reset:
+          Seconds to wait after the breaker opens before trying another request.
+        """
+        self.threshold = threshold
+        self.reset = reset
+        self.nfailures = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a request should be made.
+        """
+        with self.lock:
+            if self.opened is None:
+                return True
+            if time.time() - self.opened < self.reset:
+                return False
+            #let one request through, and stop the others until it is finished
+            self.opened = time.time()
+            return True
+
+    def success(self):
+        with self.lock:
+            self.nfailures = 0
+            self.opened = None
+
+    def failure(self):
+        with self.lock:
+            self.nfailures += 1
+            if self.nfailures >= self.threshold:
+                self.opened = time.time()
+
+class EpochIndex(object):
+    """Sorted index of the metadata epochs of a station, searched by phase time.
+
+    Epochs are sorted by start time, with the latest end time of each epoch and those before 
+    it, so that the epochs containing a phase time can be found with a binary search.  The 
+    position of each epoch in the input sequence is kept, so that overlapping epochs are 
+    chosen in the same order as a search through the epochs returned by the CWB server.
+    """
+    def __init__(self,epochs):
+        """Create an epoch index.
+
+        :param epochs:
+          Sequence of (start,end) datetime tuples, in the order returned by the CWB server, 
+          possibly repeated (one per channel).
+        """
+        order = {}
+        for i,epoch in enumerate(epochs):
+            order.setdefault(epoch,i)
+        self.epochs = sorted(order.keys())
+        self.order = [order[epoch] for epoch in self.epochs]
+        self.starts = [t1 for t1,t2 in self.epochs]
+        self.maxends = []
+        maxend = None
+        for t1,t2 in self.epochs:
+            if maxend is None or t2 > maxend:
+                maxend = t2
+            self.maxends.append(maxend)
+        self.error = timedelta(seconds=86400*TIMERROR)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def find(self,phasetime):
+        """Return the epoch containing a phase time.
+
+        :param phasetime:
+          Datetime of phase arrival.
+        :returns:
+          (start,end) tuple of the first epoch in the input sequence that contains phasetime 
+          (allowing TIMERROR days either side), or None if no epoch contains it.
+        """
+        match = None
+        #epochs before this index start less than TIMERROR days after the phase time
+        i = bisect_left(self.starts,phasetime+self.error)-1
+        while i >= 0 and self.maxends[i]+self.error > phasetime:
+            t1,t2 = self.epochs[i]
+            if phasetime > t1-self.error and phasetime < t2+self.error:
+                if match is None or self.order[i] < self.order[match]:
+                    match = i
+            i -= 1
+        if match is None:
+            return None
+        return self.epochs[match]
+
 class StationTranslator(object):
-    def __init__(self,dictionaryfile=None):
+    def __init__(self,dictionaryfile=None,host=None,port=None,poolsize=POOLSIZE,timeout=TIMEOUT,cache=None,
+                 inventory=None,breaker=None):
+        """Create a station translator.
+
+        :param dictionaryfile:
+          File of "station-phase initial[-epoch start] = NSCL" lines written by save(), or None.  
+          Lines without an epoch start apply to all epochs of the station.
+        :param host:
+          CWB query server host name, or None to use CWBHOST.
+        :param port:
+          CWB query server port, or None to use CWBPORT.
+        :param poolsize:
+          Maximum number of open connections to the CWB server.
+        :param timeout:
+          Timeout in seconds for connecting and for each read from the CWB server.
+        :param cache:
+          eqconvert.cache.StationCache object used to store lookups between runs, or None.  
+          Lookups during which a CWB request failed are not stored.
+        :param inventory:
+          eqconvert.inventory.StationInventory object used to look up stations instead of the CWB 
+          server (and the cache), or None.
+        :param breaker:
+          CircuitBreaker object used to stop requests after repeated CWB failures, or None to 
+          use a CircuitBreaker with the default settings.
+        """
+        self.pool = CWBConnectionPool(host=host,port=port,size=poolsize,timeout=timeout)
+        self.cache = cache
+        self.inventory = inventory
+        if breaker is None:
+            breaker = CircuitBreaker()
+        self.breaker = breaker
+        self.nfailures = 0
+        #failed requests of the lookups running in each thread, so concurrent lookups don't affect each other
+        self.local = threading.local()
+        self.stats = OrderedDict([('hits',0),('misses',0),('requests',0),('failures',0),('rejected',0),
+                                  ('latency',0.0),('maxlatency',0.0)])
+        self.lock = threading.Lock()
         self.stationdict = {}
+        self.epochs = {} #station -> EpochIndex
         if dictionaryfile is not None:
             f = open(dictionaryfile,'rt')
             for line in f.readlines():
@@ -20,38 +281,162 @@ class StationTranslator(object):
 
     def save(self,dictfile):
         f = open(dictfile,'wt')
-        for key,value in self.stationdict.iteritems():
+        for key,value in self.stationdict.items():
             f.write('%s = %s\n' % (key.strip(),value.strip()))
         f.close()
 
     def callCWBServer(self,req):
-        req = req.encode('utf-8')
-        response = ''
+        if not self.breaker.allow():
+            #the server has failed repeatedly, so don't wait for it
+            with self.lock:
+                self.nfailures += 1
+                self.stats['rejected'] += 1
+            self.local.nfailures = self._getFailures() + 1
+            return ''
+        t1 = time.time()
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM,0)
-            s.connect((CWBHOST,CWBPORT))
-            s.send(req)
-            while True:
-                tresp = s.recv(10241).decode('utf-8')
-                response += tresp
-                if response.find('<EOR>') > -1:
-                    break
-
-
-            s.close()
-        except Exception as msg:
-            try:
-                time.sleep(2)
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM,0)
-                s.connect((CWBHOST,CWBPORT))
-                s.send(req)
-                response = s.recv(10241)
-                s.close()
-            except:
-                pass
+            response = self.pool.request(req)
+            self.breaker.success()
+        except socket.error:
+            self.breaker.failure()
+            with self.lock:
+                self.nfailures += 1
+                self.stats['failures'] += 1
+            self.local.nfailures = self._getFailures() + 1
+            response = ''
+        latency = time.time() - t1
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['latency'] += latency
+            self.stats['maxlatency'] = max(self.stats['maxlatency'],latency)
         return response
 
+    def getStats(self):
+        """Return counts of station lookups and CWB requests.
+
+        :returns:
+          Dictionary with 'hits' (lookups answered from memory, the dictionary file or the cache), 
+          'misses' (lookups made with the CWB server or inventory), 'requests' (CWB requests made), 
+          'failures' (failed requests), 'rejected' (requests not made because the circuit breaker 
+          was open), 'latency' (total seconds spent on requests) and 'maxlatency' (longest request 
+          in seconds).
+        """
+        with self.lock:
+            return dict(self.stats)
+
+    def getReport(self):
+        """Return a one line summary of getStats().
+        """
+        stats = self.getStats()
+        meanlatency = 0.0
+        if stats['requests']:
+            meanlatency = stats['latency']/stats['requests']
+        fmt = ('Station lookups: %i hits, %i misses. CWB requests: %i (%i failed, %i rejected), '
+               'mean latency %.3f s, max %.3f s\n')
+        return fmt % (stats['hits'],stats['misses'],stats['requests'],stats['failures'],stats['rejected'],
+                      meanlatency,stats['maxlatency'])
+
+    def _getFailures(self):
+        """Internal method to return the number of failed CWB requests made by the current thread.
+        """
+        return getattr(self.local,'nfailures',0)
+
+    def _count(self,name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _getCached(self,kind,key):
+        if self.cache is None or self.inventory is not None:
+            return None
+        return self.cache.get(kind,key)
+
+    def _putCached(self,kind,key,station,value,nfailures,found=True):
+        #don't store results of lookups where a request to the CWB server failed
+        if self.cache is not None and self.inventory is None and self._getFailures() == nfailures:
+            self.cache.put(kind,key,station,value,found=found)
+
+    def resolveStations(self,requests,workers=POOLSIZE):
+        """Look up the NSCL codes of many stations concurrently, storing the results in stationdict.
+
+        Later calls to getStationByLocation() and getNSCL() with the same arguments are answered 
+        from stationdict, without contacting the CWB server.  Stations with a location are looked 
+        up with getStationByLocation(), and with getNSCL() if that fails, as mloc.readPhaseLine() 
+        does.  The epochs of each station are looked up first, and as getNSCL() results are stored 
+        by station, phase type initial and epoch, only the first phase time in each epoch is used, 
+        so the results are the same as looking up the requests in order.
+
+        Requests are read one at a time while earlier lookups run, and only the distinct 
+        locations and (station,phase type initial,epoch) keys are kept, so memory use does not 
+        depend on the number of requests.
+
+        :param requests:
+          Sequence (or generator) of (station,phase type,phase time,lat,lon) tuples, where lat and 
+          lon are None if the station location is not known.
+        :param workers:
+          Number of threads making lookups at the same time.
+        """
+        locations = {} #(station,lat,lon) -> getStationByLocation() future
+        epochs = {} #station -> getEpochIndex() future
+        nscls = set()
+        pending = deque()
+        futures = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def resolve(block):
+                #resolve waiting requests in order, until one of them needs a lookup that is still running
+                while len(pending):
+                    station,phasetype,phasetime,location = pending[0]
+                    if location is not None:
+                        if not block and not locations[location].done():
+                            return
+                        if locations[location].result() != station:
+                            pending.popleft()
+                            continue
+                    if station not in epochs:
+                        epochs[station] = executor.submit(self.getEpochIndex,station)
+                    if not block and not epochs[station].done():
+                        return
+                    stationkey = self._getNSCLKey(station,phasetype,epochs[station].result().find(phasetime))
+                    if stationkey not in nscls:
+                        nscls.add(stationkey)
+                        futures.append(executor.submit(self.getNSCL,station,phasetype,phasetime))
+                    pending.popleft()
+
+            for station,phasetype,phasetime,lat,lon in requests:
+                location = None
+                if lat is not None:
+                    location = (station,lat,lon)
+                    if location not in locations:
+                        locations[location] = executor.submit(self.getStationByLocation,station,lat,lon)
+                elif station not in epochs:
+                    epochs[station] = executor.submit(self.getEpochIndex,station)
+                pending.append((station,phasetype,phasetime,location))
+                resolve(len(pending) > RESOLVE_WINDOW)
+            resolve(True)
+            for future in futures:
+                future.result()
+
     def getStationByLocation(self,station,lat,lon,radius=0.2):
+        locationkey = '%s:%.4f:%.4f:%.1f' % (station,lat,lon,radius)
+        if locationkey in self.stationdict:
+            self._count('hits')
+            return self.stationdict[locationkey]
+        cached = self._getCached('location',locationkey)
+        if cached is not None:
+            self._count('hits')
+            self.stationdict[locationkey] = cached
+            return cached
+        self._count('misses')
+        nfailures = self._getFailures()
+        if self.inventory is not None:
+            nscl = self._getInventoryStationByLocation(station,lat,lon,radius)
+        else:
+            nscl = self._getStationByLocation(station,lat,lon,radius)
+        if self._getFailures() == nfailures:
+            self.stationdict[locationkey] = nscl
+        self._putCached('location',locationkey,station,nscl,nfailures,found=nscl != station)
+        return nscl
+
+    def _getStationByLocation(self,station,lat,lon,radius):
         req = "-delaz %.1f:%.4f:%.4f -c r \n" % (radius,lat,lon)
         pad = chr(0) * (80 - len(req))
         req = str(req + pad)
@@ -70,6 +455,8 @@ class StationTranslator(object):
         network = None
         for line in lines[1:]:
             parts = line.split()
+            if not len(parts):
+                continue
             if re.search(station,parts[0]) is not None:
                 fullstation = parts[0]
                 network = fullstation.replace(station,'')
@@ -87,9 +474,27 @@ class StationTranslator(object):
                 net,station,location,channel = parts[0].split()
                 return '%s.%s.%s.%s' % (net,station,channel,location)
         return '%s.%s..' % (network,station)
+
+    def _getInventoryStationByLocation(self,station,lat,lon,radius):
+        """Internal method to find a station by location in the station inventory, as _getStationByLocation() does using CWB.
+        """
+        for network,sta in self.inventory.find_stations(lat,lon,radius):
+            if re.search(station,network+sta) is None:
+                continue
+            for net,sta,location,channel,start,end in self.inventory.get_channels(sta,network=network):
+                if channel.find('HHZ') > -1:
+                    return '%s.%s.%s.%s' % (net,sta,channel,location)
+            return '%s.%s..' % (network,sta)
+        return station
         
     
-    def getStationEpoch(self,station,phasetime):
+    def getStationEpochs(self,station):
+        if self.inventory is not None:
+            return [(start,end) for net,sta,location,channel,start,end in self.inventory.get_channels(station)]
+        cached = self._getCached('epochs',station)
+        if cached is not None:
+            return [(datetime.strptime(t1,EPOCHFMT),datetime.strptime(t2,EPOCHFMT)) for t1,t2 in json.loads(cached)]
+        nfailures = self._getFailures()
         req = '-c c -s ..%s -b all \n' % station
         pad = chr(0) * (80 - len(req))
         req = str(req + pad)
@@ -104,23 +509,55 @@ class StationTranslator(object):
             timestr1 = parts[11]+':00'
             datestr2 = parts[13]
             timestr2 = parts[14]+':00'
-            t1 = datetime.strptime(datestr1 + ' ' + timestr1,'%Y-%m-%d %H:%M:%S')
-            t2 = datetime.strptime(datestr2 + ' ' + timestr2,'%Y-%m-%d %H:%M:%S')
+            t1 = datetime.strptime(datestr1 + ' ' + timestr1,EPOCHFMT)
+            t2 = datetime.strptime(datestr2 + ' ' + timestr2,EPOCHFMT)
             epochs.append((t1,t2))
-        etime = None
-        for epoch in epochs:
-            t1,t2 = epoch
-            if phasetime > t1 - timedelta(seconds=86400*TIMERROR) and phasetime < t2 + timedelta(seconds=86400*TIMERROR):
-                dt = t2-t1
-                nseconds = dt.days*86400 + dt.seconds
-                etime = t1 + timedelta(seconds=nseconds/2)
-                if etime > datetime.utcnow():
-                    etime = phasetime
-                else:
-                    pass
-                break
+        self._putCached('epochs',station,station,
+                        json.dumps([(t1.strftime(EPOCHFMT),t2.strftime(EPOCHFMT)) for t1,t2 in epochs]),nfailures,
+                        found=len(epochs) > 0)
+        return epochs
+
+    def getEpochIndex(self,station):
+        """Return the epoch index of a station, looking up its epochs only the first time.
+
+        :param station:
+          Station code.
+        :returns:
+          EpochIndex object.
+        """
+        index = self.epochs.get(station)
+        if index is None:
+            nfailures = self._getFailures()
+            index = EpochIndex(self.getStationEpochs(station))
+            #look up the epochs again next time if a request to the CWB server failed
+            if self._getFailures() == nfailures:
+                self.epochs[station] = index
+        return index
+
+    def getStationEpoch(self,station,phasetime):
+        return self._getEpochTime(self.getEpochIndex(station).find(phasetime),phasetime)
+
+    def _getEpochTime(self,epoch,phasetime):
+        """Internal method to return a time when valid metadata is available for a station epoch.
+        """
+        if epoch is None:
+            return None
+        t1,t2 = epoch
+        dt = t2-t1
+        nseconds = dt.days*86400 + dt.seconds
+        etime = t1 + timedelta(seconds=nseconds/2)
+        if etime > datetime.utcnow():
+            etime = phasetime
         return etime
 
+    def _getNSCLKey(self,station,phasetype,epoch):
+        """Internal method to return the stationdict key of a station, phase type and epoch.
+        """
+        stationkey = station+'-'+phasetype[0:1]
+        if epoch is not None:
+            stationkey += '-' + epoch[0].strftime('%Y%m%dT%H%M%S')
+        return stationkey
+
     def getIR(self,station):
         req = '-b all -a *.*.%s -c c \n' % station
         pad = chr(0) * (80 - len(req))
@@ -163,34 +600,52 @@ class StationTranslator(object):
         return fsdn
     
     def getNSCL(self,station,phasetype,phasetime):
-        stationkey = station+'-'+phasetype[0:1]
+        #dictionary files can have translations for all epochs of a station
+        if station+'-'+phasetype[0:1] in self.stationdict:
+            self._count('hits')
+            return self.stationdict[station+'-'+phasetype[0:1]]
+        #stations can have different channels in each epoch, so translations are stored by epoch
+        nfailures = self._getFailures()
+        stationepoch = self.getEpochIndex(station).find(phasetime)
+        stationkey = self._getNSCLKey(station,phasetype,stationepoch)
         if stationkey in self.stationdict:
             #sys.stderr.write('Using cached station key %s\n' % stationkey)
+            self._count('hits')
             return self.stationdict[stationkey]
+        cached = self._getCached('nscl',stationkey)
+        if cached is not None:
+            self._count('hits')
+            self.stationdict[stationkey] = cached
+            return cached
+        self._count('misses')
         
         dt = timedelta(seconds=86400)
         preferred = station
-        epoch = self.getStationEpoch(station,phasetime) #get a date where valid metadata is available
+        epoch = self._getEpochTime(stationepoch,phasetime) #get a date where valid metadata is available
+        channels = []
         if epoch is not None:
             timestr = (epoch+dt).strftime('%Y/%m/%d')
             okchannels = ['HH','BH','SH','HN']
-            scode = '..%s' % (station)
-            req = '-c c -s %s -b %s \n' % (scode,timestr)
-            pad = chr(0) * (80 - len(req))
-            req = str(req + pad)
-            response = self.callCWBServer(req)
-            lines = response.split('\n')
-            if response.find('no channels found to match') > -1:
-                preferred = station
-                lines = []
-        else:
-            lines = []
+            if self.inventory is not None:
+                channeltime = datetime.strptime(timestr,'%Y/%m/%d')
+                channels = [channel[0:4] for channel in self.inventory.get_channels(station,time=channeltime)]
+            else:
+                scode = '..%s' % (station)
+                req = '-c c -s %s -b %s \n' % (scode,timestr)
+                pad = chr(0) * (80 - len(req))
+                req = str(req + pad)
+                response = self.callCWBServer(req)
+                lines = response.split('\n')
+                if response.find('no channels found to match') > -1:
+                    preferred = station
+                    lines = []
+                for line in lines:
+                    parts = line.split(':')
+                    if len(parts) < 2:
+                        continue
+                    channels.append(tuple(parts[0].split()))
         nscl_list = []
-        for line in lines:
-            parts = line.split(':')
-            if len(parts) < 2:
-                continue
-            net,sta,loc,channel = parts[0].split()
+        for net,sta,loc,channel in channels:
             if sta.lower() != station.lower():
                 continue
             if channel[0:2] not in okchannels:
@@ -216,9 +671,16 @@ class StationTranslator(object):
             if channel.lower().startswith('hn'):
                 preferred = nscl
                 break
-        if preferred == station:
+        if preferred == station and self.inventory is not None:
+            #like getFSDN() and getIR(), fall back to the network and station codes
+            inventory_channels = self.inventory.get_channels(station)
+            if len(inventory_channels):
+                preferred = '%s.%s..' % inventory_channels[0][0:2]
+        if preferred == station and self.inventory is None:
             preferred = self.getFSDN(station)
-        if preferred == station:
+        if preferred == station and self.inventory is None:
             preferred = self.getIR(station)
-        self.stationdict[stationkey] = preferred
+        if self._getFailures() == nfailures:
+            self.stationdict[stationkey] = preferred
+        self._putCached('nscl',stationkey,station,preferred,nfailures,found=preferred != station)
         return preferred
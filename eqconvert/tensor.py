@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+#third party imports
+import numpy as np
+
+#moment tensor components, in Up-South-East (r,t,p) coordinates
+MT_COMPONENTS = ['mrr','mtt','mpp','mrt','mrp','mtp']
+
+def decompose(mrr,mtt,mpp,mrt,mrp,mtp):
+    """Decompose many moment tensors at once.
+
+    The eigenvalues and eigenvectors of all tensors are found with one batched call to
+    numpy.linalg.eigh(), and everything else is derived from them with array operations.  The
+    scalar moment is that of the best double couple, (T - P)/2 for the deviatoric eigenvalues,
+    and the CLVD fraction is 2|e| where e is minus the ratio of the smallest to the largest
+    (absolute) deviatoric eigenvalue, so that the double couple fraction is 1 - 2|e|.
+
+    :param mrr,mtt,mpp,mrt,mrp,mtp:
+      Arrays (or sequences) of moment tensor components, one element per tensor.
+    :returns:
+      Dictionary of arrays, one element per tensor:
+        - m0 Scalar moment, in the units of the components.
+        - doublecouple Double couple fraction (0-1).
+        - clvd Compensated linear vector dipole fraction (0-1).
+        - tvalue,nvalue,pvalue Eigenvalues of the T, N and P axes.
+        - tplunge,nplunge,pplunge Plunges (degrees) of the T, N and P axes.
+        - tazimuth,nazimuth,pazimuth Azimuths (degrees) of the T, N and P axes.
+        - strike1,dip1,rake1,strike2,dip2,rake2 Nodal planes (degrees) of the best double couple.
+    """
+    mrr,mtt,mpp,mrt,mrp,mtp = [np.asarray(m,dtype=np.float64) for m in (mrr,mtt,mpp,mrt,mrp,mtp)]
+    tensors = np.empty((len(mrr),3,3))
+    tensors[:,0,0] = mrr
+    tensors[:,1,1] = mtt
+    tensors[:,2,2] = mpp
+    tensors[:,0,1] = tensors[:,1,0] = mrt
+    tensors[:,0,2] = tensors[:,2,0] = mrp
+    tensors[:,1,2] = tensors[:,2,1] = mtp
+    #eigenvalues are in ascending order, so the axes are P, N, T
+    values,vectors = np.linalg.eigh(tensors)
+
+    deviatoric = values - values.mean(axis=1)[:,np.newaxis]
+    order = np.argsort(np.abs(deviatoric),axis=1)
+    smallest = np.take_along_axis(deviatoric,order[:,0:1],axis=1)[:,0]
+    largest = np.abs(np.take_along_axis(deviatoric,order[:,2:3],axis=1)[:,0])
+    epsilon = np.zeros(len(values))
+    nonzero = largest > 0
+    epsilon[nonzero] = -smallest[nonzero]/largest[nonzero]
+    results = {'m0':(deviatoric[:,2]-deviatoric[:,0])/2,
+               'clvd':2*np.abs(epsilon),
+               'doublecouple':1-2*np.abs(epsilon)}
+
+    axes = {}
+    for name,index in [('p',0),('n',1),('t',2)]:
+        axis = _get_ned(vectors[:,:,index])
+        results[name+'value'] = values[:,index]
+        results[name+'plunge'] = np.degrees(np.arcsin(np.clip(axis[:,2],-1,1)))
+        results[name+'azimuth'] = np.degrees(np.arctan2(axis[:,1],axis[:,0])) % 360
+        axes[name] = axis
+
+    #the nodal planes bisect the T and P axes
+    plus = (axes['t']+axes['p'])/np.sqrt(2)
+    minus = (axes['t']-axes['p'])/np.sqrt(2)
+    for plane,(normal,slip) in [('1',(plus,minus)),('2',(minus,plus))]:
+        strike,dip,rake = _get_plane(normal,slip)
+        results['strike'+plane] = strike
+        results['dip'+plane] = dip
+        results['rake'+plane] = rake
+    return results
+
+def _get_ned(vectors):
+    """Internal function to turn (n,3) Up-South-East unit vectors into downward pointing North-East-Down vectors.
+    """
+    ned = np.column_stack([-vectors[:,1],vectors[:,2],-vectors[:,0]])
+    ned[ned[:,2] < 0] *= -1
+    return ned
+
+def _get_plane(normal,slip):
+    """Internal function to return strike, dip and rake arrays (degrees) of planes from North-East-Down normal and slip vectors.
+
+    See Aki and Richards (1980), Box 4.4.
+    """
+    #use the upward pointing normal, and the slip of the block above the plane
+    down = normal[:,2] > 0
+    normal = np.where(down[:,np.newaxis],-normal,normal)
+    slip = np.where(down[:,np.newaxis],-slip,slip)
+    dip = np.arccos(np.clip(-normal[:,2],-1,1))
+    strike = np.arctan2(-normal[:,0],normal[:,1])
+    rake = np.arctan2(-slip[:,2],np.sin(dip)*(slip[:,0]*np.cos(strike)+slip[:,1]*np.sin(strike)))
+    return (np.degrees(strike) % 360,np.degrees(dip),np.degrees(rake))
@@ -7,5 +7,5 @@ setup(name='eqconvert',
       author_email='mhearne@usgs.gov',
       url='',
       packages=['eqconvert'],
-      scripts = ['fetchgcmt','convertcat'],
+      scripts = ['fetchgcmt','convertcat','stationcache'],
 )
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import tempfile
+import shutil
+import time
+import json
+from datetime import datetime
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert import ndk,mloc
+from eqconvert.cache import CatalogCache,MagnitudeCache,CACHE_EXT
+from eqconvert.comcat import ComCatIndex
+from eqconvert.inventory import StationInventory
+from fdsnserver import make_feature
+
+def test_cache():
+    tdir = tempfile.mkdtemp()
+    try:
+        ndkfile = os.path.join(tdir,'gcmt.ndk')
+        shutil.copyfile(os.path.join(homedir,'data','gcmt.ndk'),ndkfile)
+        cachedir = os.path.join(tdir,'cache')
+        cache = CatalogCache(cachedir)
+        print('Testing to see if parsed events are cached...')
+        events = cache.get_events(ndk,ndkfile,catalog='gcmt')
+        assert events == ndk.get_events(ndkfile,catalog='gcmt')
+        assert len(os.listdir(cachedir)) == 1
+        key = cache.get_key('eqconvert.ndk',ndkfile,None,'gcmt')
+        assert cache.load(key) == events
+
+        print('Testing to see if changed input files are parsed again...')
+        assert cache.get_key('eqconvert.ndk',ndkfile,None,'us') != key
+        f = open(ndkfile,'at')
+        f.write('\n')
+        f.close()
+        assert cache.get_key('eqconvert.ndk',ndkfile,None,'gcmt') != key
+
+        print('Testing to see if least recently used cache files are evicted...')
+        cache.clear()
+        cache.save('first',events)
+        cache.save('second',events)
+        fsize = os.path.getsize(os.path.join(cachedir,'first'+CACHE_EXT))
+        now = time.time()
+        os.utime(os.path.join(cachedir,'second'+CACHE_EXT),(now-100,now-100))
+        os.utime(os.path.join(cachedir,'first'+CACHE_EXT),(now-50,now-50))
+        cache.maxsize = fsize*2
+        cache.save('third',events)
+        assert sorted(os.listdir(cachedir)) == ['first'+CACHE_EXT,'third'+CACHE_EXT]
+    finally:
+        shutil.rmtree(tdir)
+
+def test_parser_args():
+    tdir = tempfile.mkdtemp()
+    try:
+        mlocfile = os.path.join(homedir,'data','mloc.comcat')
+        cachedir = os.path.join(tdir,'cache')
+        cache = CatalogCache(cachedir)
+        inventory = StationInventory(os.path.join(homedir,'data','stations.txt'))
+        jsonfile = os.path.join(tdir,'comcat.geojson')
+        f = open(jsonfile,'wt')
+        json.dump({'type':'FeatureCollection',
+                   'features':[make_feature(datetime(2011,8,23,17,51,3,520000),37.9212,-78.0054,5.8)]},f)
+        f.close()
+        print('Testing to see if parser arguments that change events are part of the cache key...')
+        magcache = MagnitudeCache(os.path.join(tdir,'magnitudes.db'),offline=True)
+        offline = cache.get_events(mloc,mlocfile,inventory=inventory,magcache=magcache)
+        matched = cache.get_events(mloc,mlocfile,inventory=inventory,comcat=ComCatIndex(jsonfile))
+        assert len(offline[0]['magnitudes'])+1 == len(matched[0]['magnitudes'])
+        assert len(os.listdir(cachedir)) == 2
+        magcache.close()
+
+        print('Testing to see if equivalent parser arguments share a cache entry...')
+        magcache = MagnitudeCache(os.path.join(tdir,'magnitudes.db'),offline=True)
+        assert cache.get_events(mloc,mlocfile,inventory=inventory,magcache=magcache,stationworkers=2) == offline
+        assert len(os.listdir(cachedir)) == 2
+        magcache.offline = False
+        key = cache.get_key('eqconvert.mloc',mlocfile,None,None,parser_args={'inventory':inventory,'magcache':magcache})
+        assert cache.load(key) is None
+        args = {'inventory':inventory}
+        assert cache.get_key('eqconvert.mloc',mlocfile,None,None,parser_args=dict(args,lookup='batch')) != \
+            cache.get_key('eqconvert.mloc',mlocfile,None,None,parser_args=args)
+        magcache.close()
+    finally:
+        shutil.rmtree(tdir)
+
+if __name__ == '__main__':
+    test_cache()
+    test_parser_args()
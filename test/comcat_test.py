@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import json
+import tempfile
+import shutil
+from datetime import datetime,timedelta
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert.comcat import ComCatIndex
+from fdsnserver import FDSNServer,make_feature
+
+def test_search():
+    t0 = datetime(2011,8,23,17,51,2)
+    features = [make_feature(t0+timedelta(hours=i),37.0+0.1*(i % 10),-78.0,4.0+0.1*(i % 20)) for i in range(0,1000)]
+    tdir = tempfile.mkdtemp()
+    try:
+        jsonfile = os.path.join(tdir,'comcat.json')
+        f = open(jsonfile,'wt')
+        json.dump({'type':'FeatureCollection','features':features[::-1]},f)
+        f.close()
+        comcat = ComCatIndex(jsonfile)
+        #the FDSN stand-in implements the same search rules as ComCat
+        server = FDSNServer(features)
+        print('Testing to see if ComCat export searches match ComCat searches...')
+        for i in range(0,1000,37):
+            ftime = features[i]['properties']['time']
+            for lat in [37.0,37.5,38.0]:
+                for stime,etime in [(ftime-3000,ftime+3000),(ftime,ftime),(ftime+1000,ftime+7200000)]:
+                    matches = comcat.search(stime,etime,lat,-78.0,20)
+                    params = {'starttime':datetime.utcfromtimestamp(stime/1000).strftime('%Y-%m-%dT%H:%M:%S'),
+                              'endtime':datetime.utcfromtimestamp(etime/1000).strftime('%Y-%m-%dT%H:%M:%S'),
+                              'latitude':str(lat),'longitude':'-78.0','maxradiuskm':'20'}
+                    expected = server.search(params)
+                    assert [m['properties'] for m in matches] == [e['properties'] for e in expected]
+        server.server.server_close()
+    finally:
+        shutil.rmtree(tdir)
+
+if __name__ == '__main__':
+    test_search()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import timeit
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert.ndk import get_events
+from eqconvert.convert import create_quakeml
+
+NRUNS = 2000
+
+def bench_serializers():
+    event = get_events(os.path.join(homedir,'data','gcmt.ndk'))[0]
+    print('Rendering the same NDK event %i times with each QuakeML serializer...' % NRUNS)
+    for serializer in ['tag','string']:
+        elapsed = timeit.timeit(lambda: create_quakeml(event,serializer=serializer),number=NRUNS)
+        print('%-6s %8.1f microseconds/event' % (serializer,elapsed/NRUNS*1e6))
+
+if __name__ == '__main__':
+    bench_serializers()
@@ -4,7 +4,9 @@
 import sys
 import os.path
 import tempfile
+import shutil
 from datetime import datetime
+from xml.etree.ElementTree import canonicalize
 
 #hack the path so that I can debug these functions if I need to
 homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
@@ -13,9 +15,11 @@ sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring
 
 #third party imports
 from obspy.io.quakeml.core import _is_quakeml as isQuakeML
+from obspy import read_events
 
 #local imports
-from eqconvert.convert import create_quakeml
+from eqconvert.convert import create_quakeml,write_quakeml_documents
+from eqconvert.phases import PhaseTable
 
 def test_simple_events():
     event1 = {'id':'1234abcd',
@@ -68,6 +72,95 @@ def test_simple_events():
     finally:
         os.remove(fname)
 
+def test_serializers():
+    event = {'id':'1234abcd',
+             'catalog':'mycatalog',
+             'contributor':'us',
+             'origins':[{'id':'1234abcd',
+                         'preferred':True,
+                         'time':{'value':datetime(2011,8,23,17,51,2,520000),'uncertainty':0.5},
+                         'lat':37.9212,
+                         'lon':-78.0054,
+                         'depth':{'value':9.6,'lower':1.7,'upper':1.7},
+                         'ellipse':{'major':0.51,'minor':0.57,'azimuth':50},
+                         'quality':{'numphases':12,'numstations':10,'stderr':0.4,'azgap':45,'mindist':0.51},
+                         'phases':[{'id':'20110823175112_Pg_SE.URVA.HHZ.--',
+                                    'name':'Pg',
+                                    'distance':0.51,
+                                    'azimuth':133,
+                                    'time':datetime(2011,8,23,17,51,12,80000),
+                                    'station':'SE.URVA.HHZ.--',
+                                    'residual':-0.1,
+                                    'weight':1},
+                                   {'id':'20110823175133_Pn_IR.VWCC..',
+                                    'name':'Pn',
+                                    'distance':1.7,
+                                    'azimuth':247,
+                                    'time':datetime(2011,8,23,17,51,33,250000),
+                                    'station':'IR.VWCC..',
+                                    'residual':0.8,
+                                    'weight':0}]}],
+             'magnitudes':[{'preferred':False,'type':'ML','value':5.7,'author':'ISC'},
+                           {'preferred':True,'type':'Mw','value':5.8,'author':'us'}],
+             'focal':{'method':'Mwc',
+                      'np1':{'strike':9.0,'dip':29.0,'rake':142.0},
+                      'np2':{'strike':133.0,'dip':72.0,'rake':66.0},
+                      'taxis':{'value':1.581e16,'plunge':56.0,'azimuth':12.0},
+                      'naxis':{'value':-0.537e16,'plunge':23.0,'azimuth':140.0},
+                      'paxis':{'value':-1.044e16,'plunge':24.0,'azimuth':241.0}},
+             'moment':{'method':'Mwc',
+                       'm0':1.312e16,
+                       'mrr':{'value':0.838e16,'uncertainty':0.201e16},
+                       'mtt':{'value':-0.005e16,'uncertainty':0.231e16},
+                       'mpp':{'value':-0.833e16,'uncertainty':0.270e16},
+                       'mrt':{'value':1.050e16,'uncertainty':0.121e16},
+                       'mrp':{'value':-0.369e16,'uncertainty':0.161e16},
+                       'mtp':{'value':0.044e16,'uncertainty':0.240e16},
+                       'source':{'type':'triangle','duration':0.6},
+                       'doublecouple':0.912,
+                       'clvd':0.088}}
+    print('Testing to see if Tag and string serializers produce equivalent QuakeML.')
+    tagxml = create_quakeml(event,serializer='tag')
+    strxml = create_quakeml(event,serializer='string')
+    #canonical XML sorts attributes and writes empty elements the same way
+    assert canonicalize(tagxml,strip_text=True) == canonicalize(strxml,strip_text=True)
+
+    print('Testing to see if phase tables produce the same QuakeML as lists of phases.')
+    event['origins'][0]['phases'] = PhaseTable(event['origins'][0]['phases'])
+    assert create_quakeml(event,serializer='tag') == tagxml
+    assert create_quakeml(event,serializer='string') == strxml
+
+def test_documents():
+    events = []
+    for i in range(0,5):
+        events.append({'id':'event%i' % i,
+                       'catalog':'mycatalog',
+                       'contributor':'us',
+                       'origins':[{'id':'origin%i' % i,
+                                   'preferred':True,
+                                   'time':datetime(2016,1,1,0,0,i),
+                                   'lat':float(i),
+                                   'lon':float(i),
+                                   'depth':10.0}],
+                       'magnitudes':[{'preferred':True,'type':'Mw','value':5.0+i/10.0,'author':'us'}]})
+    tdir = tempfile.mkdtemp()
+    try:
+        print('Testing to see if we can stream events into a single QuakeML document.')
+        fnames,nevents = write_quakeml_documents(iter(events),tdir,'catalog')
+        assert nevents == 5
+        assert fnames == [os.path.join(tdir,'catalog.xml')]
+        assert isQuakeML(fnames[0])
+        assert [e.resource_id.id for e in read_events(fnames[0])] == ['quakeml:mycatalog.anss.org/event/event%i' % i for i in range(0,5)]
+
+        print('Testing to see if we can stream events into a bounded number of QuakeML documents.')
+        fnames,nevents = write_quakeml_documents(iter(events),tdir,'chunk',maxevents=2)
+        assert nevents == 5
+        assert [os.path.basename(f) for f in fnames] == ['chunk_0001.xml','chunk_0002.xml','chunk_0003.xml']
+        assert [len(read_events(f)) for f in fnames] == [2,2,1]
+    finally:
+        shutil.rmtree(tdir)
     
 if __name__ == '__main__':
     test_simple_events()
+    test_serializers()
+    test_documents()
@@ -0,0 +1,173 @@
+#stdlib imports
+import re
+import math
+import time
+import random
+import threading
+import socketserver
+from datetime import datetime
+
+EOR = '<EOR>'
+NOCHANNELS = 'no channels found to match'
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn,socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class CWBSimulator(object):
+    """Local stand-in for a CWB query server.
+
+    Requests are newline terminated (and padded with NUL characters), and each response is
+    followed by an <EOR> line.  Responses are made by calling respond(request) with the request
+    string (without padding).  If keepalive is False, the connection is closed after each response.  
+    Each response is delayed by latency seconds, and a fraction failrate of requests are answered 
+    by closing the connection.  The largest number of requests answered at the same time is 
+    kept in max_active.
+    """
+    def __init__(self,respond,keepalive=True,latency=0.0,failrate=0.0,seed=None):
+        self.respond = respond
+        self.keepalive = keepalive
+        self.latency = latency
+        self.failrate = failrate
+        self.random = random.Random(seed)
+        self.requests = []
+        self.nconnects = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        server = self
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with server.lock:
+                    server.nconnects += 1
+                data = b''
+                while True:
+                    while data.find(b'\n') < 0:
+                        block = self.request.recv(4096)
+                        if not block:
+                            return
+                        data += block
+                    req,data = data.split(b'\n',1)
+                    data = data.lstrip(b'\x00')
+                    req = req.strip(b'\x00').decode('utf-8').strip()
+                    with server.lock:
+                        server.requests.append(req)
+                        failed = server.failrate > 0 and server.random.random() < server.failrate
+                        server.active += 1
+                        server.max_active = max(server.max_active,server.active)
+                    try:
+                        if server.latency > 0:
+                            time.sleep(server.latency)
+                        if failed:
+                            return
+                        response = server.respond(req)
+                    finally:
+                        with server.lock:
+                            server.active -= 1
+                    self.request.sendall((response+EOR+'\n').encode('utf-8'))
+                    if not server.keepalive:
+                        return
+        self.server = ThreadingTCPServer(('127.0.0.1',0),Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+class InventoryResponder(object):
+    """Answers CWB query server requests from an eqconvert.inventory.StationInventory.
+
+    The requests made by eqconvert.stationdb.StationTranslator are supported: station searches by 
+    location ("-delaz radius:lat:lon"), channel lists ("-c c -s REGEX -b yyyy/mm/dd"), channel 
+    epochs ("-c c -s REGEX -b all") and alias searches ("-c c -a FDSN.NN.SSSSS", and 
+    "-b all -a *.*.SSSSS").  Station regular expressions match NNSSSSSCCCLL channel names.
+    """
+    def __init__(self,inventory):
+        self.inventory = inventory
+
+    def __call__(self,req):
+        parts = req.split()
+        if not len(parts):
+            return ''
+        if parts[0] == '-delaz':
+            radius,lat,lon = [float(p) for p in parts[1].split(':')]
+            return self._get_stations(lat,lon,radius)
+        if '-a' in parts:
+            return self._get_aliases(parts[parts.index('-a')+1])
+        if '-s' in parts:
+            date = None
+            if '-b' in parts:
+                date = parts[parts.index('-b')+1]
+            return self._get_channels(parts[parts.index('-s')+1],date)
+        return ''
+
+    def _get_stations(self,lat,lon,radius):
+        lines = ['Station  dist(deg) azimuth']
+        for network,station in self.inventory.find_stations(lat,lon,radius):
+            slat,slon = self.inventory.stations[(network,station)]
+            distance,azimuth = get_distance_azimuth(lat,lon,slat,slon)
+            lines.append('%-8s %8.2f %8.2f' % (network+station,distance,azimuth))
+        return '\n'.join(lines) + '\n'
+
+    def _iter_channels(self,regex):
+        pattern = re.compile(regex)
+        for channels in self.inventory.channels.values():
+            for network,station,location,channel,start,end in channels:
+                seedname = '%-2s%-5s%-3s%-2s' % (network,station,channel,location.replace('-',' '))
+                if pattern.match(seedname) is not None:
+                    yield network,station,location,channel,start,end
+
+    def _get_channels(self,regex,date):
+        lines = []
+        if date == 'all':
+            for network,station,location,channel,start,end in self._iter_channels(regex):
+                lat,lon = self.inventory.stations[(network,station)]
+                lines.append('%s %s %s %s %.4f %.4f 0 0 0 0 %s - %s' % (network,station,location,channel,lat,lon,
+                                                                       start.strftime('%Y-%m-%d %H:%M'),
+                                                                       end.strftime('%Y-%m-%d %H:%M')))
+        else:
+            time = None
+            if date is not None:
+                time = datetime.strptime(date,'%Y/%m/%d')
+            for network,station,location,channel,start,end in self._iter_channels(regex):
+                if time is not None and (time < start or time > end):
+                    continue
+                lines.append('%s %s %s %s:0 Hz' % (network,station,location,channel))
+        if not len(lines):
+            return NOCHANNELS + '\n'
+        return '\n'.join(lines) + '\n'
+
+    def _get_aliases(self,alias):
+        parts = alias.split('.')
+        station = parts[-1]
+        lines = []
+        for network,sta,location,channel,start,end in self.inventory.get_channels(station):
+            if parts[0] == 'FDSN' and network != parts[1]:
+                continue
+            lines.append('FDSN.%s.%s.%s:0 Hz' % (network,sta,channel))
+        if not len(lines):
+            return NOCHANNELS + '\n'
+        return '\n'.join(lines) + '\n'
+
+def get_distance_azimuth(lat1,lon1,lat2,lon2):
+    """Return the great circle distance (degrees) and azimuth (degrees) from one point to another.
+    """
+    lat1,lon1,lat2,lon2 = [math.radians(x) for x in (lat1,lon1,lat2,lon2)]
+    a = math.sin((lat2-lat1)/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin((lon2-lon1)/2)**2
+    distance = math.degrees(2*math.asin(min(1.0,math.sqrt(a))))
+    azimuth = math.degrees(math.atan2(math.sin(lon2-lon1)*math.cos(lat2),
+                                      math.cos(lat1)*math.sin(lat2)-math.sin(lat1)*math.cos(lat2)*math.cos(lon2-lon1)))
+    return (distance,azimuth % 360)
@@ -0,0 +1,140 @@
+#stdlib imports
+import threading
+import time
+import json
+import math
+import calendar
+from datetime import datetime
+from http.server import HTTPServer,BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse,parse_qs
+
+TIMEFMT = '%Y-%m-%dT%H:%M:%S'
+EARTH_RADIUS = 6371.0
+
+class ThreadingHTTPServer(ThreadingMixIn,HTTPServer):
+    daemon_threads = True
+
+class FDSNServer(object):
+    """Local stand-in for the ComCat FDSN event web service, answering GeoJSON searches from a list of features.
+
+    delay is the number of seconds to wait before answering each request, and the first failures 
+    requests are answered with HTTP 503 errors.  Like ComCat, searches matching more than 
+    maxresults events (after limit is applied) are answered with HTTP 400 errors.  The path and 
+    arrival time of each request are recorded in requests and times, and the largest number of 
+    requests answered at the same time in max_active.
+    """
+    def __init__(self,features,delay=0.0,failures=0,maxresults=20000):
+        self.features = features
+        self.delay = delay
+        self.failures = failures
+        self.maxresults = maxresults
+        self.requests = []
+        self.times = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests.append(self.path)
+                    server.times.append(time.time())
+                    fail = len(server.requests) <= server.failures
+                    server.active += 1
+                    server.max_active = max(server.max_active,server.active)
+                try:
+                    time.sleep(server.delay)
+                finally:
+                    with server.lock:
+                        server.active -= 1
+                if fail:
+                    self.send_error(503)
+                    return
+                params = parse_qs(urlparse(self.path).query)
+                params = dict([(key,value[0]) for key,value in params.items()])
+                features = server.search(params)
+                if features is None:
+                    self.send_error(400)
+                    return
+                data = json.dumps({'type':'FeatureCollection',
+                                   'features':features}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type','application/json')
+                self.send_header('Content-Length',str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            def log_message(self,format,*args):
+                pass
+        self.server = ThreadingHTTPServer(('127.0.0.1',0),Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def reset(self):
+        """Forget the recorded requests.
+        """
+        with self.lock:
+            self.requests = []
+            self.times = []
+            self.max_active = 0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def base(self):
+        return 'http://127.0.0.1:%i' % self.server.server_address[1]
+
+    def search(self,params):
+        stime = _get_ms(params['starttime'])
+        etime = _get_ms(params['endtime'])
+        matches = []
+        for feature in self.features:
+            ftime = feature['properties']['time']
+            if ftime < stime or ftime > etime:
+                continue
+            lon,lat = feature['geometry']['coordinates'][0:2]
+            if 'maxradiuskm' in params:
+                dist = _get_distance(float(params['latitude']),float(params['longitude']),lat,lon)
+                if dist > float(params['maxradiuskm']):
+                    continue
+            if 'minlatitude' in params:
+                if lat < float(params['minlatitude']) or lat > float(params['maxlatitude']):
+                    continue
+                if lon < float(params['minlongitude']) or lon > float(params['maxlongitude']):
+                    continue
+            if 'minmagnitude' in params and feature['properties']['mag'] < float(params['minmagnitude']):
+                continue
+            matches.append(feature)
+        if params.get('orderby') == 'time-asc':
+            matches.sort(key=lambda feature: feature['properties']['time'])
+        offset = int(params.get('offset',1))
+        matches = matches[offset-1:]
+        if 'limit' in params:
+            matches = matches[0:int(params['limit'])]
+        if len(matches) > self.maxresults:
+            return None
+        return matches
+
+def make_feature(time,lat,lon,mag,magtype='mww',sources=',us,'):
+    """Create a GeoJSON feature like those returned by ComCat.
+    """
+    return {'type':'Feature',
+            'properties':{'time':int(round(calendar.timegm(time.timetuple())*1000 + time.microsecond/1000.0)),
+                          'mag':mag,
+                          'magType':magtype,
+                          'sources':sources},
+            'geometry':{'type':'Point','coordinates':[lon,lat,10.0]}}
+
+def _get_ms(timestr):
+    return calendar.timegm(datetime.strptime(timestr,TIMEFMT).timetuple())*1000
+
+def _get_distance(lat1,lon1,lat2,lon2):
+    lat1,lon1,lat2,lon2 = [math.radians(x) for x in (lat1,lon1,lat2,lon2)]
+    a = math.sin((lat2-lat1)/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin((lon2-lon1)/2)**2
+    return 2*EARTH_RADIUS*math.asin(min(1.0,math.sqrt(a)))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import time
+import subprocess
+import tempfile
+import shutil
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+NRUNS = 10
+
+#what convertcat imported before parsers were looked up in the format registry
+EAGER = ('from eqconvert.convert import create_quakeml; from eqconvert import iscgem,ndk,mloc; '
+         'from eqconvert.parallel import convert_files; from eqconvert.cache import CatalogCache; '
+         'from eqconvert.comcat import ComCatIndex; from eqconvert.inventory import StationInventory')
+LAZY = ('from eqconvert.convert import create_quakeml; from eqconvert.formats import get_parser; '
+        'get_parser("%s")')
+
+def run(args,env):
+    """Return the median time (seconds) of NRUNS runs of a command in a new interpreter.
+    """
+    times = []
+    for i in range(0,NRUNS):
+        t1 = time.time()
+        subprocess.check_call(args,env=env,stdout=subprocess.DEVNULL)
+        times.append(time.time()-t1)
+    return sorted(times)[NRUNS//2]
+
+def bench_imports():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([mapiodir]+[p for p in [env.get('PYTHONPATH')] if p])
+    tdir = tempfile.mkdtemp()
+    try:
+        tempty = run([sys.executable,'-c','pass'],env)
+        teager = run([sys.executable,'-c',EAGER],env)
+        print('Median of %i runs, including %.3f seconds of interpreter startup:' % (NRUNS,tempty))
+        print('importing all formats:    %.3f seconds' % teager)
+        for module in ['ndk','mloc','iscgem']:
+            tlazy = run([sys.executable,'-c',LAZY % module],env)
+            print('importing %-6s format:   %.3f seconds' % (module,tlazy))
+        ndkfile = os.path.join(homedir,'data','gcmt.ndk')
+        tconvert = run([sys.executable,os.path.join(mapiodir,'convertcat'),'ndk',tdir,ndkfile],env)
+        print('convertcat of one NDK event: %.3f seconds' % tconvert)
+    finally:
+        shutil.rmtree(tdir)
+
+if __name__ == '__main__':
+    bench_imports()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import subprocess
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert import formats,ndk
+from eqconvert.formats import get_format_names,has_format,get_parser,register_format,FORMATS
+
+def test_formats():
+    print('Testing that parsers are found for the eqconvert formats...')
+    assert get_format_names(plugins=False) == ['iscgem','ndk','mloc']
+    assert get_parser('ndk') is ndk
+    assert not has_format('nosuchformat')
+    try:
+        get_parser('nosuchformat')
+        assert False,'An unknown format should raise an exception.'
+    except Exception as error:
+        assert str(error).find('nosuchformat') > -1
+
+    print('Testing that plugin formats can be registered...')
+    register_format('gcmt','eqconvert.ndk')
+    try:
+        assert 'gcmt' in get_format_names()
+        assert get_parser('gcmt') is ndk
+    finally:
+        del FORMATS['gcmt']
+
+    print('Testing that plugin formats are found through entry points...')
+    get_entry_points = formats._get_entry_points
+    formats._get_entry_points = lambda: {'gcmt':'eqconvert.ndk'}
+    try:
+        assert has_format('gcmt')
+        assert get_format_names() == ['iscgem','ndk','mloc','gcmt']
+        assert get_parser('gcmt') is ndk
+    finally:
+        formats._get_entry_points = get_entry_points
+        FORMATS.pop('gcmt',None)
+
+def test_lazy():
+    print('Testing that only the parser of the selected format is imported...')
+    #use a new interpreter, as other tests have already imported everything
+    code = ('import sys; sys.path.insert(0,%r); from eqconvert.formats import get_parser; get_parser("ndk"); '
+            'print(" ".join([m for m in ["eqconvert.iscgem","eqconvert.mloc","pandas"] if m in sys.modules]))' % mapiodir)
+    output = subprocess.check_output([sys.executable,'-c',code]).decode('utf-8')
+    assert output.strip() == '',output
+
+if __name__ == '__main__':
+    test_formats()
+    test_lazy()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import tempfile
+import shutil
+import socket
+from datetime import datetime
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert.inventory import StationInventory,OPEN_END
+from eqconvert.stationdb import StationTranslator
+from eqconvert import mloc,stationdb
+
+STATIONXML = '''<?xml version="1.0" encoding="UTF-8"?>
+<FDSNStationXML xmlns="http://www.fdsn.org/xml/station/1" schemaVersion="1.0">
+  <Source>test</Source>
+  <Created>2016-01-01T00:00:00</Created>
+  <Network code="PE">
+    <Station code="PSUB" startDate="2005-01-01T00:00:00">
+      <Latitude>39.9274</Latitude>
+      <Longitude>-75.4514</Longitude>
+      <Elevation>110.0</Elevation>
+      <Site><Name>PSUB</Name></Site>
+      <Channel code="BHZ" locationCode="" startDate="2005-01-01T00:00:00" endDate="2009-12-31T23:59:59">
+        <Latitude>39.9274</Latitude><Longitude>-75.4514</Longitude><Elevation>110.0</Elevation><Depth>0</Depth>
+      </Channel>
+      <Channel code="HHZ" locationCode="" startDate="2010-01-01T00:00:00">
+        <Latitude>39.9274</Latitude><Longitude>-75.4514</Longitude><Elevation>110.0</Elevation><Depth>0</Depth>
+      </Channel>
+    </Station>
+  </Network>
+  <Network code="IU">
+    <Station code="ANMO" startDate="1989-08-29T00:00:00">
+      <Latitude>34.9459</Latitude>
+      <Longitude>-106.4572</Longitude>
+      <Elevation>1820.0</Elevation>
+      <Site><Name>Albuquerque</Name></Site>
+    </Station>
+  </Network>
+</FDSNStationXML>
+'''
+
+def test_inventory():
+    inventory = StationInventory(os.path.join(homedir,'data','stations.txt'))
+    print('Testing to see if stations are found by location...')
+    assert inventory.find_stations(39.9274,-75.4514,0.2) == [('LD','BVD'),('PE','PSUB'),('SY','PSUB')]
+    assert inventory.find_stations(39.9274,-75.4514,0.01) == [('PE','PSUB'),('SY','PSUB')]
+    assert inventory.find_stations(38.0,-78.0,0.2) == []
+    assert inventory.find_stations(38.0,-78.0,1.0) == [('SE','URVA'),('US','CBN')]
+
+    print('Testing to see if channel epochs are found...')
+    channels = inventory.get_channels('PSUB',network='PE')
+    assert [c[3] for c in channels] == ['BHZ','HHZ','HHN','HHE']
+    assert channels[0][2] == '--'
+    assert channels[1][4:] == (datetime(2010,1,1),OPEN_END)
+    channels = inventory.get_channels('PSUB',network='PE',time=datetime(2008,1,1))
+    assert [c[3] for c in channels] == ['BHZ']
+    assert len(inventory.get_channels('PSUB')) == 5
+
+    print('Testing to see if StationXML inventories can be read...')
+    tdir = tempfile.mkdtemp()
+    try:
+        xmlfile = os.path.join(tdir,'stations.xml')
+        f = open(xmlfile,'wt')
+        f.write(STATIONXML)
+        f.close()
+        xinventory = StationInventory(xmlfile)
+        assert xinventory.get_channels('PSUB') == inventory.get_channels('PSUB',network='PE')[0:2]
+        assert xinventory.find_stations(35.0,-106.5,0.2) == [('IU','ANMO')]
+        assert xinventory.get_channels('ANMO') == []
+    finally:
+        shutil.rmtree(tdir)
+
+def test_inventory_translator():
+    #nothing listens on this port, so any CWB request would fail
+    sock = socket.socket()
+    sock.bind(('127.0.0.1',0))
+    port = sock.getsockname()[1]
+    sock.close()
+    inventory = StationInventory(os.path.join(homedir,'data','stations.txt'))
+    phasetime = datetime(2011,8,23,17,51,47)
+    print('Testing to see if stations are translated using the inventory...')
+    st = StationTranslator(host='127.0.0.1',port=port,timeout=0.2,inventory=inventory)
+    assert st.getNSCL('PSUB','Pn',phasetime) == 'PE.PSUB.HHZ.--'
+    assert st.getNSCL('PSUB','Sn',phasetime) == 'PE.PSUB.HHN.--'
+    assert st.getNSCL('CBN','Pn',phasetime) == 'US.CBN.BHZ.00'
+    assert st.getNSCL('VWCC','Pn',phasetime) == 'IR.VWCC..'
+    assert st.getNSCL('XXXX','Pn',phasetime) == 'XXXX'
+    assert st.getStationByLocation('PSUB',39.9274,-75.4514) == 'PE.PSUB.HHZ.--'
+    assert st.getStationByLocation('PSUB',30.0,-75.4514) == 'PSUB'
+    assert st.nfailures == 0
+
+    print('Testing to see if MLOC files can be converted without a CWB server...')
+    host,port2 = stationdb.CWBHOST,stationdb.CWBPORT
+    try:
+        stationdb.CWBHOST,stationdb.CWBPORT = '127.0.0.1',port
+        filename = os.path.join(homedir,'data','mloc.comcat')
+        events = list(mloc._iter_parsed_events(filename,inventory=inventory))
+        stations = [phase['station'] for phase in events[0]['origins'][0]['phases']]
+        for station in ['SE.URVA.HHZ.--','US.CBN.BHZ.00','LD.SDMD.HHZ.--','PE.PSUB.HHZ.--','IR.VWCC..']:
+            assert station in stations
+    finally:
+        stationdb.CWBHOST,stationdb.CWBPORT = host,port2
+
+if __name__ == '__main__':
+    test_inventory()
+    test_inventory_translator()
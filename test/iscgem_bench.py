@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import tempfile
+import time
+import tracemalloc
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#third party imports
+import pandas as pd
+
+#local imports
+from eqconvert.iscgem import get_events,iter_events,COLUMNS,CHUNKSIZE
+from eqconvert.tensor import decompose,MT_COMPONENTS
+from eqconvert.convert import create_quakeml
+
+NEVENTS = 50000 #a little more than the full ISC-GEM catalog
+
+def make_catalog(nevents):
+    """Write a synthetic ISC-GEM CSV file by repeating the test events with new IDs, return the file name.
+    """
+    lines = [line for line in open(os.path.join(homedir,'data','isc-gem-cat.csv'),'rt') if not line.startswith('#')]
+    f,fname = tempfile.mkstemp(suffix='.csv')
+    os.close(f)
+    f = open(fname,'wt')
+    for i in range(0,nevents):
+        line = lines[i % len(lines)]
+        f.write(line[0:line.rindex(',')+1] + '%11i\n' % (i+1))
+    f.close()
+    return fname
+
+def get_events_iterrows(filename,contributor='us'):
+    """Build event dictionaries row by row with DataFrame.iterrows(), as get_events() used to.
+    """
+    events = []
+    reader = pd.read_csv(filename,comment='#',names=COLUMNS,parse_dates=[0],chunksize=CHUNKSIZE)
+    for df in reader:
+        for index,row in df.iterrows():
+            event = {}
+            event['id'] = str(row['eventid'])
+            event['catalog'] = 'iscgem'
+            event['contributor'] = contributor
+            event['origins'] = [{'preferred':True,
+                                'id':'iscgem',
+                                'evalmode':'manual',
+                                'evalstatus':'reviewed',
+                                'ellipse':{'major':row['smajax'],'minor':row['sminax'],'azimuth':0.0},
+                                'time':row['date'].to_pydatetime(),
+                                'lat':row['lat'],
+                                'lon':row['lon'],
+                                'depth':{'value':row['depth'],'uncertainty':row['depth_uncertainty']}}]
+            event['magnitudes'] = [{'preferred':True,'type':'Mw','value':row['mw'],'author':row['moment_author'].strip()}]
+            events.append(event)
+    return events
+
+def bench_iscgem():
+    fname = make_catalog(NEVENTS)
+    try:
+        t1 = time.time()
+        pd.read_csv(fname,comment='#',names=COLUMNS,parse_dates=[0])
+        tread = time.time()-t1
+
+        t1 = time.time()
+        rows = get_events_iterrows(fname)
+        trows = time.time()-t1
+
+        t1 = time.time()
+        events = get_events(fname)
+        tcolumns = time.time()-t1
+
+        #the iterrows version does not add moment tensors
+        mechanisms = [(event.pop('moment'),event.pop('focal')) for event in events]
+        assert events == rows
+        assert [create_quakeml(event) for event in events[0:100]] == [create_quakeml(event) for event in rows[0:100]]
+        print('Parsing %i ISC-GEM events:' % NEVENTS)
+        print('read_csv only:                       %6.2f seconds' % tread)
+        print('DataFrame.iterrows:                  %6.2f seconds' % trows)
+        print('get_events (column operations):      %6.2f seconds (%.0fx)' % (tcolumns,trows/tcolumns))
+    finally:
+        os.remove(fname)
+
+def bench_moments():
+    fname = make_catalog(NEVENTS)
+    try:
+        events = get_events(fname)
+        tensors = [[event['moment'][comp] for comp in MT_COMPONENTS] for event in events]
+
+        t1 = time.time()
+        single = [decompose(*[[value] for value in tensor]) for tensor in tensors]
+        tsingle = time.time()-t1
+
+        t1 = time.time()
+        batch = decompose(*zip(*tensors))
+        tbatch = time.time()-t1
+        for i in range(0,len(tensors),997):
+            for key,values in batch.items():
+                assert abs(values[i]-single[i][key][0]) <= 1e-9*max(1.0,abs(values[i]))
+
+        t1 = time.time()
+        for event in events:
+            create_quakeml(event)
+        tquakeml = time.time()-t1
+        print('Decomposing %i ISC-GEM moment tensors:' % NEVENTS)
+        print('one tensor at a time:                %6.2f seconds' % tsingle)
+        print('decompose (batched):                 %6.2f seconds (%.0fx)' % (tbatch,tsingle/tbatch))
+        print('QuakeML for all events:              %6.2f seconds' % tquakeml)
+    finally:
+        os.remove(fname)
+
+def get_peak_memory(function):
+    """Return the peak memory (bytes) allocated while calling function().
+    """
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def bench_memory():
+    fname = make_catalog(NEVENTS)
+    try:
+        def read_all():
+            df = pd.read_csv(fname,comment='#',names=COLUMNS,parse_dates=[0])
+            events = get_events(fname)
+        def stream(chunksize):
+            nevents = 0
+            for event in iter_events(fname,chunksize=chunksize):
+                nevents += 1
+            assert nevents == NEVENTS
+        print('Peak memory used reading %i ISC-GEM events:' % NEVENTS)
+        print('whole DataFrame + event list:        %6.1f MB' % (get_peak_memory(read_all)/1024.0**2))
+        for chunksize in [100000,10000,1000]:
+            print('iter_events, %6i row chunks:       %6.1f MB' % (chunksize,
+                                                                 get_peak_memory(lambda: stream(chunksize))/1024.0**2))
+    finally:
+        os.remove(fname)
+
+if __name__ == '__main__':
+    bench_iscgem()
+    bench_moments()
+    bench_memory()
@@ -12,10 +12,11 @@ mapiodir = os.path.abspath(os.path.join(homedir,'..'))
 sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
 
 #third party imports
+import numpy as np
 from obspy.io.quakeml.core import _is_quakeml as isQuakeML
 
 #local imports
-from eqconvert.iscgem import get_events
+from eqconvert.iscgem import get_events,iter_events
 from eqconvert.convert import create_quakeml,xml_pprint
 from utils import cmpdict,check_quake
 
@@ -52,7 +53,7 @@ def test_read():
                                    'depth':{'value':15.0,'uncertainty':3.4}}],
                        'magnitudes':[{'preferred':True,'type':'Mw','value':6.65,'author':'gcmt'}]}
     print('Comparing Loma Prieta to known example...')
-    res,msg = cmpdict(test_loma,lomaprieta)
+    res,msg = cmpdict(test_loma,without_mechanism(lomaprieta))
     if res:
         print('Loma Prieta was parsed correctly.')
     else:
@@ -66,7 +67,7 @@ def test_read():
         print('Loma Prieta dictionary did NOT create valid QuakeML.')
         
     print('Comparing Loma Prieta to known example...')
-    res,msg = cmpdict(test_northridge,northridge)
+    res,msg = cmpdict(test_northridge,without_mechanism(northridge))
     if res:
         print('Northridge was parsed correctly.')
     else:
@@ -78,6 +79,68 @@ def test_read():
     else:
         print('Northridge dictionary did NOT create valid QuakeML.')
 
+def without_mechanism(event):
+    event = event.copy()
+    del event['moment']
+    del event['focal']
+    return event
+
+def test_mechanism():
+    datafile = os.path.join(homedir,'data','isc-gem-cat.csv')
+    lomaprieta = get_events(datafile)[0]
+    print('Testing to see if the Loma Prieta moment tensor is scaled by the exponent...')
+    moment = lomaprieta['moment']
+    assert moment['method'] == 'Mw'
+    for comp,value in [('mrr',1.28),('mtt',-2.52),('mpp',1.23),('mrt',1.24),('mrp',-1.04),('mtp',0.11)]:
+        np.testing.assert_allclose(moment[comp],value*1e19,rtol=1e-12)
+        assert isinstance(moment[comp],float)
+
+    print('Testing to see if the Loma Prieta scalar moment is the catalog value...')
+    np.testing.assert_allclose(moment['m0'],2.69e19,rtol=1e-12)
+    assert isinstance(moment['m0'],float)
+
+    print('Testing to see if the Loma Prieta mechanism is derived from the tensor...')
+    np.testing.assert_allclose(moment['doublecouple'],0.669,atol=1e-3)
+    np.testing.assert_allclose(moment['clvd'],0.331,atol=1e-3)
+    focal = lomaprieta['focal']
+    planes = [(focal[plane]['strike'],focal[plane]['dip'],focal[plane]['rake']) for plane in ['np1','np2']]
+    np.testing.assert_allclose(planes,[(235.5,41.6,28.7),(123.2,71.4,127.9)],atol=0.1)
+    axes = [(focal[axis]['plunge'],focal[axis]['azimuth']) for axis in ['taxis','naxis','paxis']]
+    np.testing.assert_allclose(axes,[(49.0,74.6),(35.6,289.3),(17.7,186.1)],atol=0.1)
+    assert check_quake(lomaprieta)
+
+def test_missing_moment():
+    print('Testing to see if the scalar moment is computed from the tensor when the catalog has none...')
+    lines = open(os.path.join(homedir,'data','isc-gem-cat.csv'),'rt').read().splitlines()
+    row = [line for line in lines if line.startswith(' 1989-10-18')][0].split(',')
+    row[14] = ''
+    f,datafile = tempfile.mkstemp(suffix='.csv')
+    os.close(f)
+    f = open(datafile,'wt')
+    f.write(','.join(row)+'\n')
+    f.close()
+    try:
+        moment = get_events(datafile)[0]['moment']
+        #the tensor scalar moment is a little less than the catalog's 2.69e19 Nm
+        np.testing.assert_allclose(moment['m0'],2.6845e19,rtol=1e-4)
+    finally:
+        os.remove(datafile)
+
+def test_chunks():
+    datafile = os.path.join(homedir,'data','isc-gem-cat.csv')
+    print('Testing to see if reading one row at a time gives the same events...')
+    events = get_events(datafile)
+    assert list(iter_events(datafile,chunksize=1)) == events
+    assert get_events(datafile,chunksize=1) == events
+    try:
+        get_events(datafile,chunksize=0)
+        assert False
+    except Exception as error:
+        assert str(error).find('chunk size') > -1
+
 if __name__ == '__main__':
     test_read()
+    test_mechanism()
+    test_missing_moment()
+    test_chunks()
     
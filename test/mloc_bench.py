@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import time
+import tracemalloc
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert.mloc import readPhaseLine
+from eqconvert.phases import PhaseTable
+
+NPHASES = 50000
+NLINEAR = 10000 #the linear search is too slow to run on all phases
+NSTATIONS = 5000
+PHASENAMES = ['Pg','Pn','Sg','Sn','P']
+
+class LocalTranslator(object):
+    """Station translator that does not contact the CWB server, so that only parsing is timed.
+    """
+    def getNSCL(self,station,phase,phasetime):
+        return 'XX.%s..' % station
+
+    def getStationByLocation(self,station,lat,lon,radius=0.2):
+        return station
+
+def make_lines(nphases):
+    """Return synthetic MLOC phase lines, where every station/phase name appears more than once.
+    """
+    lines = []
+    for i in range(0,nphases):
+        station = 'S%04i' % (i % NSTATIONS)
+        name = PHASENAMES[(i // NSTATIONS) % len(PHASENAMES)]
+        second = 1 + (i % 5900)/100.0
+        lines.append('P + %-8s %6.2f %3i %-8s 2011  8 23 17 51 %5.2f  -2  -0.1  0.10\n' % (station,(i % 900)/100.0,
+                                                                                       i % 360,name,second))
+    return lines
+
+def make_event():
+    return {'origins':[{'preferred':True}]}
+
+def read_linear(lines,st):
+    """Read phase lines, finding repeated station/phase names with a linear search of the phase list.
+    """
+    event = make_event()
+    phases = []
+    for line in lines:
+        phase = readPhaseLine(make_event(),line,st)['origins'][0]['phases'][0].copy()
+        phasekey = phase['station']+'_'+phase['name']
+        for i in range(0,len(phases)):
+            if phases[i]['station']+'_'+phases[i]['name'] == phasekey:
+                phases[i] = phase
+                break
+        else:
+            phases.append(phase)
+    event['origins'][0]['phases'] = phases
+    return event
+
+def read_indexed(lines,st):
+    """Read phase lines with readPhaseLine().
+    """
+    event = make_event()
+    for line in lines:
+        readPhaseLine(event,line,st)
+    event['origins'][0]['phases'].drop_index()
+    return event
+
+def bench_phases():
+    st = LocalTranslator()
+    lines = make_lines(NPHASES)
+    t1 = time.time()
+    event = read_indexed(lines,st)
+    tindex = time.time()-t1
+
+    t1 = time.time()
+    linear = read_linear(lines[0:NLINEAR],st)
+    tlinear = time.time()-t1
+    assert read_indexed(lines[0:NLINEAR],st) == linear
+
+    print('Reading MLOC phases (%i unique station/phase names):' % len(event['origins'][0]['phases']))
+    print('linear search of phase list, %i phases:   %6.2f seconds' % (NLINEAR,tlinear))
+    print('readPhaseLine (phase index), %i phases:   %6.2f seconds' % (NPHASES,tindex))
+
+def bench_memory():
+    st = LocalTranslator()
+    lines = make_lines(NPHASES)
+    tracemalloc.start()
+    table = read_indexed(lines,st)['origins'][0]['phases']
+    tablesize = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    dicts = [phase.copy() for phase in table]
+    dictsize = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('Memory used by %i MLOC phases:' % len(table))
+    print('list of phase dictionaries:   %6.1f MB' % (dictsize/1024.0**2))
+    print('PhaseTable:                   %6.1f MB (%.0fx smaller)' % (tablesize/1024.0**2,dictsize/tablesize))
+
+if __name__ == '__main__':
+    bench_phases()
+    bench_memory()
@@ -3,8 +3,11 @@
 #stdlib imports
 import sys
 import os.path
-from datetime import datetime
+from datetime import datetime,timedelta
 import tempfile
+import shutil
+import time
+import json
 
 #hack the path so that I can debug these functions if I need to
 homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
@@ -15,9 +18,47 @@ sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring
 from obspy.io.quakeml.core import _is_quakeml as isQuakeML
 
 #local
-from eqconvert.mloc import get_events
+from eqconvert.mloc import get_events,getPrefMag,getPrefMags,getPrefMagsAsync
+from eqconvert import mloc,stationdb
+from eqconvert.cache import MagnitudeCache
+from eqconvert.comcat import ComCatIndex
+from eqconvert.inventory import StationInventory
 from eqconvert.convert import create_quakeml,xml_pprint
 from utils import cmpdict
+from fdsnserver import FDSNServer,make_feature
+from cwbsim import CWBSimulator
+
+COMCAT = 'http://earthquake.usgs.gov'
+
+def make_event(time,lat,lon,mag):
+    return {'id':time.strftime('%Y%m%d%H%M%S'),
+            'catalog':'us',
+            'contributor':'us',
+            'origins':[{'preferred':True,
+                        'id':'cluster',
+                        'time':{'value':time,'uncertainty':0.1},
+                        'lat':lat,
+                        'lon':lon,
+                        'depth':{'value':10.0,'lower':1.0,'upper':1.0}}],
+            'magnitudes':[{'preferred':True,'type':'ML','value':mag,'author':'ISC'}]}
+
+def make_cluster():
+    """Return a list of events, and a list of ComCat features that match some of them.
+    """
+    t0 = datetime(2011,8,23,17,51,2,520000)
+    events = [make_event(t0,37.9212,-78.0054,5.7),
+              make_event(t0+timedelta(days=1),37.95,-78.05,4.5),
+              make_event(t0+timedelta(days=2),37.90,-78.00,4.2),
+              make_event(t0+timedelta(days=3),37.93,-78.02,4.8)]
+    features = [make_feature(t0+timedelta(seconds=0.4),37.91,-77.98,5.8),
+                make_feature(t0+timedelta(days=1,seconds=2.1),37.96,-78.06,4.4,magtype='mb',sources=',se,us,'),
+                #too far away in time or distance to match the third event
+                make_feature(t0+timedelta(days=2,seconds=4),37.90,-78.00,4.1),
+                make_feature(t0+timedelta(days=2),38.10,-78.00,4.1),
+                #two events close to the fourth event, so there is no unique match
+                make_feature(t0+timedelta(days=3,seconds=1),37.93,-78.02,4.9),
+                make_feature(t0+timedelta(days=3,seconds=-1),37.94,-78.03,4.7)]
+    return (events,features)
 
 def test_mloc():
     filename = os.path.join('data','mloc.comcat')
@@ -122,6 +163,245 @@ def test_mloc():
     finally:
         os.remove(fname)
 
+def test_batch_prefmag():
+    events,features = make_cluster()
+    server = FDSNServer(features).start()
+    urlbase,batchurl = mloc.URLBASE,mloc.BATCHURL
+    try:
+        mloc.URLBASE = urlbase.replace(COMCAT,server.base)
+        mloc.BATCHURL = batchurl.replace(COMCAT,server.base)
+        print('Testing to see if batched ComCat magnitude search matches single event searches...')
+        single = [getPrefMag(event) for event in events]
+        assert single == [(5.8,'us','mww'),(4.4,'se','mb'),(None,None,None),(None,None,None)]
+        assert len(server.requests) == len(events)
+        server.requests = []
+        assert getPrefMags(events) == single
+        assert len(server.requests) == 1
+
+        print('Testing to see if batched ComCat searches match small ComCat events like single event searches...')
+        t0 = datetime(2012,3,1,4,2,11)
+        server.features = features + [make_feature(t0+timedelta(seconds=1),37.91,-78.01,2.1,magtype='ml')]
+        event = make_event(t0,37.92,-78.00,4.3)
+        assert getPrefMag(event) == (2.1,'us','ml')
+        assert getPrefMags(events+[event]) == single+[(2.1,'us','ml')]
+    finally:
+        mloc.URLBASE,mloc.BATCHURL = urlbase,batchurl
+        server.stop()
+
+def test_batch_long_span():
+    #a cluster of events spanning 30 years, in an area with many small ComCat events
+    t0 = datetime(1980,1,1,12,0,0,250000)
+    events = []
+    features = []
+    for i in range(0,60):
+        etime = t0+timedelta(days=182*i)
+        events.append(make_event(etime,37.92,-78.00,4.5))
+        features.append(make_feature(etime+timedelta(seconds=1),37.93,-78.01,4.6))
+        for j in range(0,10):
+            features.append(make_feature(etime+timedelta(days=10+j),37.92,-78.00,1.5))
+    #enough more events in the first year that they must be requested in more pages
+    for j in range(0,30):
+        features.append(make_feature(t0+timedelta(days=30,hours=j),37.92,-78.00,3.0))
+    server = FDSNServer(features,maxresults=50).start()
+    urlbase,batchurl,limit = mloc.URLBASE,mloc.BATCHURL,mloc.BATCH_LIMIT
+    try:
+        mloc.URLBASE = urlbase.replace(COMCAT,server.base)
+        mloc.BATCHURL = batchurl.replace(COMCAT,server.base)
+        mloc.BATCH_LIMIT = 20
+        print('Testing to see if batched ComCat searches of a long cluster stay under the search size limit...')
+        single = [getPrefMag(event) for event in events]
+        assert single == [(4.6,'us','mww')]*len(events)
+        server.requests = []
+        assert getPrefMags(events[::-1]) == single[::-1]
+        assert len(server.requests) < len(events)
+        assert len([request for request in server.requests if request.find('offset=41') > -1]) == 1
+    finally:
+        mloc.URLBASE,mloc.BATCHURL,mloc.BATCH_LIMIT = urlbase,batchurl,limit
+        server.stop()
+
+def test_async_prefmag():
+    events,features = make_cluster()
+    events = events*3
+    server = FDSNServer(features,delay=0.2).start()
+    urlbase = mloc.URLBASE
+    try:
+        mloc.URLBASE = urlbase.replace(COMCAT,server.base)
+        single = [getPrefMag(event) for event in events[0:4]]*3
+        server.reset()
+        print('Testing to see if concurrent ComCat searches match single event searches...')
+        results = getPrefMagsAsync(events,concurrency=4,rate=0)
+        assert results == single
+        assert len(server.requests) == len(events)
+        assert server.max_active > 1
+        assert server.max_active <= 4
+
+        print('Testing that the search rate is limited...')
+        server.reset()
+        server.delay = 0.0
+        assert getPrefMagsAsync(events[0:4],rate=10) == single[0:4]
+        assert len(server.requests) == 4
+        #four searches at 10 per second start over at least 0.3 seconds, less some slack for request delivery
+        assert max(server.times)-min(server.times) >= 0.25
+
+        print('Testing that failed searches are retried...')
+        server.reset()
+        server.failures = 2
+        assert getPrefMagsAsync(events[0:1],retries=2,backoff=0.1) == single[0:1]
+        assert len(server.requests) == 3
+        #the delay before each retry doubles
+        assert server.times[1]-server.times[0] >= 0.08
+        assert server.times[2]-server.times[1] >= 0.16
+        server.reset()
+        server.failures = 10
+        assert getPrefMagsAsync(events[0:1],retries=1,backoff=0.01) == [(None,None,None)]
+        assert len(server.requests) == 2
+    finally:
+        mloc.URLBASE = urlbase
+        server.stop()
+
+def test_magcache():
+    events,features = make_cluster()
+    server = FDSNServer(features).start()
+    urlbase,batchurl = mloc.URLBASE,mloc.BATCHURL
+    tdir = tempfile.mkdtemp()
+    try:
+        mloc.URLBASE = urlbase.replace(COMCAT,server.base)
+        mloc.BATCHURL = batchurl.replace(COMCAT,server.base)
+        dbfile = os.path.join(tdir,'magnitudes.db')
+        print('Testing to see if ComCat magnitude searches (including no match) are cached...')
+        magcache = MagnitudeCache(dbfile)
+        single = [getPrefMag(event,magcache=magcache) for event in events]
+        assert single == [(5.8,'us','mww'),(4.4,'se','mb'),(None,None,None),(None,None,None)]
+        assert len(server.requests) == len(events)
+        magcache.close()
+        server.requests = []
+        magcache = MagnitudeCache(dbfile)
+        assert [getPrefMag(event,magcache=magcache) for event in events] == single
+        assert getPrefMags(events,magcache=magcache) == single
+        assert getPrefMagsAsync(events,magcache=magcache) == single
+        assert len(server.requests) == 0
+
+        print('Testing to see if only uncached events are searched for...')
+        magcache.clear()
+        magcache.put(mloc._get_cache_key(events[0]['origins'][0]),single[0])
+        assert getPrefMags(events,magcache=magcache) == single
+        assert len(server.requests) == 1
+        magcache.clear()
+        magcache.put(mloc._get_cache_key(events[0]['origins'][0]),single[0])
+        assert getPrefMagsAsync(events,magcache=magcache) == single
+        assert len(server.requests) == 1+len(events)-1
+
+        print('Testing to see if expired results are searched for again...')
+        server.requests = []
+        magcache.ttl = 0
+        time.sleep(0.01)
+        assert getPrefMag(events[0],magcache=magcache) == single[0]
+        assert len(server.requests) == 1
+
+        print('Testing offline mode...')
+        server.requests = []
+        magcache.clear()
+        magcache.offline = True
+        magcache.ttl = None
+        assert getPrefMags(events,magcache=magcache) == [(None,None,None)]*len(events)
+        assert getPrefMag(events[0],magcache=magcache) == (None,None,None)
+        assert len(server.requests) == 0
+        magcache.close()
+    finally:
+        mloc.URLBASE,mloc.BATCHURL = urlbase,batchurl
+        server.stop()
+        shutil.rmtree(tdir)
+
+def test_comcat_prefmag():
+    events,features = make_cluster()
+    server = FDSNServer(features).start()
+    urlbase = mloc.URLBASE
+    tdir = tempfile.mkdtemp()
+    try:
+        mloc.URLBASE = urlbase.replace(COMCAT,server.base)
+        single = [getPrefMag(event) for event in events]
+        server.requests = []
+        print('Testing to see if matching against ComCat exports gives the same results as ComCat searches...')
+        jsonfile = os.path.join(tdir,'comcat.geojson')
+        f = open(jsonfile,'wt')
+        json.dump({'type':'FeatureCollection','features':features[::-1]},f)
+        f.close()
+        csvfile = os.path.join(tdir,'comcat.csv')
+        f = open(csvfile,'wt')
+        f.write('time,latitude,longitude,depth,mag,magType,net,id\n')
+        for i,feature in enumerate(features):
+            ftime = datetime.utcfromtimestamp(feature['properties']['time']/1000.0)
+            lon,lat = feature['geometry']['coordinates'][0:2]
+            f.write('%s,%.4f,%.4f,10.0,%.1f,%s,%s,ev%i\n' % (ftime.strftime('%Y-%m-%dT%H:%M:%S.%f')[0:-3]+'Z',lat,lon,
+                                                            feature['properties']['mag'],feature['properties']['magType'],
+                                                            feature['properties']['sources'].split(',')[1],i))
+        f.close()
+        for fname in [jsonfile,csvfile]:
+            comcat = ComCatIndex(fname)
+            assert len(comcat) == len(features)
+            assert [getPrefMag(event,comcat=comcat) for event in events] == single
+        assert len(server.requests) == 0
+    finally:
+        mloc.URLBASE = urlbase
+        server.stop()
+        shutil.rmtree(tdir)
+
+def test_iter_lookups():
+    features = [make_feature(datetime(2011,8,23,17,51,3,520000),37.9212,-78.0054,5.8)]
+    server = FDSNServer(features).start()
+    urlbase,batchurl,batchsize = mloc.URLBASE,mloc.BATCHURL,mloc.LOOKUP_BATCHSIZE
+    tdir = tempfile.mkdtemp()
+    try:
+        mloc.URLBASE = urlbase.replace(COMCAT,server.base)
+        mloc.BATCHURL = batchurl.replace(COMCAT,server.base)
+        mloc.LOOKUP_BATCHSIZE = 2
+        mlocfile = os.path.join(tdir,'cluster.mloc')
+        f = open(mlocfile,'wt')
+        f.write(open(os.path.join(homedir,'data','mloc.comcat'),'rt').read()*3)
+        f.close()
+        inventory = StationInventory(os.path.join(homedir,'data','stations.txt'))
+        events = get_events(mlocfile,inventory=inventory)
+        assert [event['magnitudes'][-1]['value'] for event in events] == [5.8]*3
+        print('Testing to see if batch and async lookups can be used while iterating over events...')
+        for lookup,nrequests in [('single',3),('batch',2),('async',3)]:
+            server.requests = []
+            assert list(mloc.iter_events(mlocfile,lookup=lookup,inventory=inventory)) == events
+            assert len(server.requests) == nrequests
+    finally:
+        mloc.URLBASE,mloc.BATCHURL,mloc.LOOKUP_BATCHSIZE = urlbase,batchurl,batchsize
+        server.stop()
+        shutil.rmtree(tdir)
+
+def test_station_prepass():
+    def respond(req):
+        if req.startswith('-delaz'):
+            return 'Station  dist(deg) azimuth\nPEPSUB      0.00    22.52\n'
+        if req.startswith('-c c -s PEPSUB'):
+            return 'PE PSUB -- HHZ:100.0 Hz\n'
+        return ''
+    server = CWBSimulator(respond).start()
+    host,port = stationdb.CWBHOST,stationdb.CWBPORT
+    try:
+        stationdb.CWBHOST,stationdb.CWBPORT = server.host,server.port
+        filename = os.path.join(homedir,'data','mloc.comcat')
+        print('Testing to see if looking up stations before parsing gives the same events...')
+        events = list(mloc._iter_parsed_events(filename,stationworkers=0))
+        nrequests = len(server.requests)
+        server.requests = []
+        assert list(mloc._iter_parsed_events(filename,stationworkers=4)) == events
+        assert len(server.requests) <= nrequests
+        assert 'PE.PSUB.HHZ.--' in [phase['station'] for phase in events[0]['origins'][0]['phases']]
+    finally:
+        stationdb.CWBHOST,stationdb.CWBPORT = host,port
+        server.stop()
+
 if __name__ == '__main__':
     test_mloc()
+    test_batch_prefmag()
+    test_batch_long_span()
+    test_async_prefmag()
+    test_magcache()
+    test_comcat_prefmag()
+    test_iter_lookups()
+    test_station_prepass()
     
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import tempfile
+import time
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert.ndk import get_events,read_table
+
+NEVENTS = 60000 #roughly the size of the full GCMT catalog
+
+def make_catalog(nevents):
+    """Write a synthetic NDK file by repeating the test event, return the file name.
+    """
+    record = open(os.path.join(homedir,'data','gcmt.ndk'),'rt').read().rstrip('\n')+'\n'
+    f,fname = tempfile.mkstemp(suffix='.ndk')
+    os.close(f)
+    f = open(fname,'wt')
+    for i in range(0,nevents):
+        f.write(record)
+    f.close()
+    return fname
+
+def bench_ndk():
+    fname = make_catalog(NEVENTS)
+    try:
+        t1 = time.time()
+        events = get_events(fname)
+        tlines = time.time()-t1
+        
+        t1 = time.time()
+        table = read_table(fname)
+        tcolumns = time.time()-t1
+        t1 = time.time()
+        tevents = [table.get_event(i) for i in range(0,len(table))]
+        tbuild = time.time()-t1
+        
+        assert events == tevents
+        print('Parsing %i NDK events:' % NEVENTS)
+        print('get_events (line by line):           %6.2f seconds' % tlines)
+        print('read_table (columns only):           %6.2f seconds (%.0fx)' % (tcolumns,tlines/tcolumns))
+        print('read_table + building all events:    %6.2f seconds' % (tcolumns+tbuild))
+    finally:
+        os.remove(fname)
+
+if __name__ == '__main__':
+    bench_ndk()
@@ -16,7 +16,8 @@ sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring
 import numpy as np
 
 #local imports
-from eqconvert.ndk import get_events,DYNECM_TO_NEWTONMETERS
+from eqconvert.ndk import get_events,iter_events,read_table,DYNECM_TO_NEWTONMETERS
+from eqconvert.ndk import read_index,get_event_by_id,get_events_by_time,get_record_ranges,get_events_in_range,INDEX_EXT
 from eqconvert.convert import create_quakeml,xml_pprint
 from utils import cmpdict,check_quake
 
@@ -74,6 +75,8 @@ def test_ndk():
                        'mtp':{'value':0.044*(10**EXP)*DYNECM_TO_NEWTONMETERS,
                               'uncertainty':0.240*(10**EXP)*DYNECM_TO_NEWTONMETERS},
                        'm0':moment,
+                       'doublecouple':0.3199569,
+                       'clvd':0.6800431,
                        'method':'Mwc',
                        'source':{'type':'triangle',
                                  'duration':0.6},
@@ -96,7 +99,89 @@ def test_ndk():
         print('Test NDK dictionary created valid QuakeML.')
     else:
         print('Test NDK dictionary did not create valid QuakeML.')
+
+
+def test_iter_events():
+    testfile = os.path.join(homedir,'data','gcmt.ndk')
+    print('Testing to see if NDK events can be read one at a time...')
+    events = iter_events(testfile,catalog='gcmt')
+    event = next(events)
+    res,msg = cmpdict(get_events(testfile,catalog='gcmt')[0],event)
+    assert res,msg
+    assert list(events) == []
+
+
+def test_decomposition():
+    testfile = os.path.join(homedir,'data','gcmt.ndk')
+    print('Testing that NDK moment tensors are decomposed the same way in batches...')
+    events = get_events(testfile,catalog='gcmt')
+    assert list(iter_events(testfile,catalog='gcmt',batchsize=1)) == events
+    moment = events[0]['moment']
+    np.testing.assert_allclose(moment['doublecouple'],0.320,atol=1e-3)
+    np.testing.assert_allclose(moment['clvd'],0.680,atol=1e-3)
+    try:
+        list(iter_events(testfile,batchsize=0))
+        assert False
+    except Exception as error:
+        assert str(error).find('batch size') > -1
+    quakeml = create_quakeml(events[0])
+    assert quakeml.find('<doubleCouple>%.3f</doubleCouple>' % moment['doublecouple']) > -1
+    assert quakeml.find('<clvd>%.3f</clvd>' % moment['clvd']) > -1
+
+
+def test_read_table():
+    testfile = os.path.join(homedir,'data','gcmt.ndk')
+    print('Testing to see if columnar NDK parser creates the same events as the line parser...')
+    table = read_table(testfile,catalog='gcmt')
+    assert len(table) == 1
+    np.testing.assert_allclose(table.columns['m0'][0],1.312e16)
+    assert list(table) == get_events(testfile,catalog='gcmt')
+
+
+def test_index():
+    #make a 10 event file from the test event, one day apart, with different IDs
+    lines = open(os.path.join(homedir,'data','gcmt.ndk'),'rt').read().splitlines()
+    f,ndkfile = tempfile.mkstemp(suffix='.ndk')
+    os.close(f)
+    f = open(ndkfile,'wt')
+    for i in range(0,10):
+        f.write(lines[0][0:13]+'%02i' % (i+1)+lines[0][15:]+'\n')
+        f.write('%-16s' % ('EVENT%02i' % i) + lines[1][16:]+'\n')
+        f.write('\n'.join(lines[2:5])+'\n')
+    f.close()
+    try:
+        print('Testing to see if events can be read from indexed NDK file...')
+        events = get_events(ndkfile,catalog='gcmt')
+        index = read_index(ndkfile)
+        assert os.path.isfile(ndkfile+INDEX_EXT)
+        assert [eventid for offset,eventid,etime in index] == [event['id'] for event in events]
+        assert read_index(ndkfile) == index
+
+        event = get_event_by_id(ndkfile,'EVENT03',catalog='gcmt')
+        assert event == events[3]
+        assert get_event_by_id(ndkfile,'NOTANEVENT') is None
+        assert index.get_position('EVENT07') == 7
+        assert get_event_by_id(ndkfile,'EVENT07',catalog='gcmt',index=list(index)) == events[7]
+
+        tevents = get_events_by_time(ndkfile,datetime(2005,1,3),datetime(2005,1,5,12),catalog='gcmt')
+        assert tevents == events[2:5]
+
+        print('Testing to see if an NDK file can be parsed in separate byte ranges...')
+        ranges = get_record_ranges(ndkfile,3)
+        assert len(ranges) == 4 and ranges[-1][1] is None
+        revents = []
+        for start,end in ranges:
+            revents += get_events_in_range(ndkfile,start,end,catalog='gcmt')
+        assert revents == events
+    finally:
+        os.remove(ndkfile)
+        if os.path.isfile(ndkfile+INDEX_EXT):
+            os.remove(ndkfile+INDEX_EXT)
         
 if __name__ == '__main__':
     test_ndk()
+    test_iter_events()
+    test_decomposition()
+    test_read_table()
+    test_index()
     
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import tempfile
+import shutil
+import io
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert.ndk import get_events
+from eqconvert.convert import create_quakeml,write_quakeml,write_csv,write_quakeml_documents
+from eqconvert.parallel import convert_files
+
+def read_folder(folder):
+    contents = {}
+    for fname in os.listdir(folder):
+        contents[fname] = open(os.path.join(folder,fname),'rb').read()
+    return contents
+
+def write_ndk(ndkfile,ids,day):
+    #make a multi-event file from the test event, one day apart starting at day, with the given IDs
+    lines = open(os.path.join(homedir,'data','gcmt.ndk'),'rt').read().splitlines()
+    f = open(ndkfile,'wt')
+    for i,eventid in enumerate(ids):
+        f.write(lines[0][0:13]+'%02i' % (day+i)+lines[0][15:]+'\n')
+        f.write('%-16s' % eventid + lines[1][16:]+'\n')
+        f.write('\n'.join(lines[2:5])+'\n')
+    f.close()
+
+def test_parallel():
+    tdir = tempfile.mkdtemp()
+    #two multi-event files split into several chunks, where the second file repeats some IDs of the first
+    ndkfile1 = os.path.join(tdir,'first.ndk')
+    ndkfile2 = os.path.join(tdir,'second.ndk')
+    write_ndk(ndkfile1,['EVENT%02i' % i for i in range(0,10)],1)
+    write_ndk(ndkfile2,['EVENT%02i' % i for i in range(5,12)],15)
+    ndkfile3 = os.path.join(tdir,'gcmt.ndk')
+    shutil.copy(os.path.join(homedir,'data','gcmt.ndk'),ndkfile3)
+    datafiles = [ndkfile1,ndkfile2,ndkfile3]
+    try:
+        serialdir = os.path.join(tdir,'serial')
+        paralleldir = os.path.join(tdir,'parallel')
+        os.mkdir(serialdir)
+        os.mkdir(paralleldir)
+        serialcsv = ''
+        events = []
+        for dfile in datafiles:
+            events += get_events(dfile,catalog='gcmt')
+        serialnames = {}
+        for event in events:
+            fname = write_quakeml(create_quakeml(event),event['id'],serialdir,filetype='ndk')
+            serialnames[event['id']] = os.path.basename(fname)
+            serialcsv += write_csv(event)+'\n'
+
+        print('Testing to see if parallel conversion matches serial conversion.')
+        csvfile = io.StringIO()
+        fnames,nevents = convert_files('ndk',datafiles,paralleldir,2,catalog='gcmt',csvfile=csvfile,chunksize=3)
+        assert nevents == len(events)
+        assert csvfile.getvalue() == serialcsv
+        assert len(os.listdir(paralleldir)) == 13
+        assert read_folder(serialdir) == read_folder(paralleldir)
+
+        print('Testing to see if the last of several events with the same ID wins, as in a serial conversion.')
+        duplicates = [event for event in events if event['id'].endswith('EVENT07')]
+        assert len(duplicates) == 2
+        fname = os.path.join(paralleldir,serialnames[duplicates[-1]['id']])
+        assert open(fname,'rb').read() == create_quakeml(duplicates[-1]).encode('utf-8')
+
+        print('Testing to see if parallel conversion to bundled files matches serial conversion.')
+        write_quakeml_documents(events,serialdir,'bundle',maxevents=2)
+        fnames,nevents = convert_files('ndk',datafiles,paralleldir,2,catalog='gcmt',bundle='bundle',maxevents=2,
+                                       chunksize=3)
+        assert nevents == len(events)
+        assert len(fnames) == 9
+        assert read_folder(serialdir) == read_folder(paralleldir)
+    finally:
+        shutil.rmtree(tdir)
+
+if __name__ == '__main__':
+    test_parallel()
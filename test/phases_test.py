@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import pickle
+from datetime import datetime
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert.phases import PhaseTable
+
+PHASES = [{'id':'20110823175147_Pn_PE.PSUB.HHZ.--',
+           'name':'Pn',
+           'distance':2.83,
+           'azimuth':44,
+           'time':datetime(2011, 8, 23, 17, 51, 47, 240000),
+           'station':'PE.PSUB.HHZ.--',
+           'precision':-2,
+           'residual':-0.5,
+           'weight':1},
+          {'id':'20110823175133_Pn_IR.VWCC..',
+           'name':'Pn',
+           'distance':1.7,
+           'azimuth':247,
+           'time':datetime(2011, 8, 23, 17, 51, 33, 250000),
+           'station':'IR.VWCC..',
+           'precision':-1,
+           'residual':0.8,
+           'weight':0}]
+
+def test_phase_table():
+    print('Testing to see if phase table can be used as a list of phase dictionaries...')
+    table = PhaseTable(PHASES)
+    assert len(table) == 2
+    assert table == PHASES
+    assert table[1] == PHASES[1]
+    assert table[-1]['id'] == PHASES[1]['id']
+    assert dict(table[0]) == PHASES[0]
+    assert table[0].copy() == PHASES[0]
+    assert [phase['station'] for phase in table] == ['PE.PSUB.HHZ.--','IR.VWCC..']
+    try:
+        table[2]
+        assert False
+    except IndexError:
+        pass
+
+    print('Testing to see if repeated station/phase names replace earlier phases...')
+    phase = PHASES[0].copy()
+    phase['residual'] = 0.1
+    phase['time'] = datetime(2011, 8, 23, 17, 51, 48, 1)
+    phase['id'] = '20110823175148_Pn_PE.PSUB.HHZ.--'
+    assert table.add(phase['name'],phase['station'],phase['distance'],phase['azimuth'],phase['time'],
+                     phase['precision'],phase['residual'],phase['weight']) == 0
+    assert table == [phase,PHASES[1]]
+
+    print('Testing to see if phase table can be pickled...')
+    table.drop_index()
+    table2 = pickle.loads(pickle.dumps(table))
+    assert table2 == table
+    assert table2.add('Sn','IR.VWCC..',1.7,247,datetime(2011, 8, 23, 17, 52),-2,0.2,1) == 2
+    assert table2.add('Pn','IR.VWCC..',1.7,247,datetime(2011, 8, 23, 17, 52),-2,0.2,1) == 1
+    assert len(table2) == 3
+
+if __name__ == '__main__':
+    test_phase_table()
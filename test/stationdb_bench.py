@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import time
+import random
+import tempfile
+import shutil
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert import mloc,stationdb
+from eqconvert.inventory import StationInventory
+from cwbsim import CWBSimulator,InventoryResponder
+
+NSTATIONS = 200
+NEVENTS = 20
+NPHASES = 60 #phases per event
+NLOCATED = 20 #stations with C lines giving their location
+LATENCY = 0.005 #seconds added to each CWB response
+FAILRATE = 0.1 #fraction of CWB requests that fail in the failure benchmark
+PHASENAMES = ['Pg','Pn','Sg','Sn']
+
+def make_inventory(filename):
+    """Write an FDSN text inventory of synthetic stations, some of which changed channels in 2008.
+    """
+    rng = random.Random(1)
+    f = open(filename,'wt')
+    f.write('#Network|Station|Location|Channel|Latitude|Longitude|Elevation|Depth|Azimuth|Dip|'
+            'SensorDescription|Scale|ScaleFreq|ScaleUnits|SampleRate|StartTime|EndTime\n')
+    for i in range(0,NSTATIONS):
+        station = 'B%03i' % i
+        lat = 36.0 + rng.uniform(0,4)
+        lon = -80.0 + rng.uniform(0,4)
+        epochs = [('HH','2000-01-01T00:00:00','')]
+        if i % 3 == 0:
+            epochs = [('BH','2000-01-01T00:00:00','2007-12-31T23:59:59'),('HH','2008-01-01T00:00:00','')]
+        for band,start,end in epochs:
+            for component in 'ZNE':
+                f.write('XX|%s||%s%s|%.4f|%.4f|100.0|0.0|0.0|0.0|Synthetic|1.0|1.0|m/s|100.0|%s|%s\n' %
+                        (station,band,component,lat,lon,start,end))
+    f.close()
+
+def make_mloc(filename,inventory):
+    """Write an MLOC file of synthetic events recorded by the inventory stations.
+    """
+    rng = random.Random(2)
+    f = open(filename,'wt')
+    for network,station in list(inventory.stations.keys())[0:NLOCATED]:
+        lat,lon = inventory.stations[(network,station)]
+        f.write('C %-8s %8.4f %9.4f     100\n' % (station,lat,lon))
+    for i in range(0,NEVENTS):
+        year = 2005 + i % 6
+        f.write('E   synthetic%i\n' % i)
+        f.write('H   %i 08 23 17 51  3.52  0.04   37.9212  281.9946  50  0.51  0.57   9.6 m   1.7   1.7 CH01 '
+                'synthetic synthetic%i\n' % (year,i))
+        #below mloc.MINMAG, so that ComCat is not searched for a preferred magnitude
+        f.write('M   3.5  UNK   ISC\n')
+        for j in range(0,NPHASES):
+            station = 'B%03i' % rng.randint(0,NSTATIONS-1)
+            name = rng.choice(PHASENAMES)
+            f.write('P + %-8s %5.2f %3i %-8s %i  8 23 17 52 %5.2f  -2  -0.1  0.10\n' % (station,rng.uniform(0,4),
+                                                                                     rng.randint(0,359),name,year,
+                                                                                     rng.uniform(1,59)))
+        f.write('STOP\n')
+    f.close()
+
+def run(filename,server,**kwargs):
+    server.requests = []
+    t1 = time.time()
+    events = mloc.get_events(filename,**kwargs)
+    return (events,time.time()-t1,len(server.requests))
+
+def bench_stations():
+    tdir = tempfile.mkdtemp()
+    host,port = stationdb.CWBHOST,stationdb.CWBPORT
+    server = None
+    try:
+        inventoryfile = os.path.join(tdir,'stations.txt')
+        make_inventory(inventoryfile)
+        inventory = StationInventory(inventoryfile)
+        mlocfile = os.path.join(tdir,'synthetic.mloc')
+        make_mloc(mlocfile,inventory)
+        server = CWBSimulator(InventoryResponder(inventory),latency=LATENCY).start()
+        stationdb.CWBHOST,stationdb.CWBPORT = server.host,server.port
+        dbfile = os.path.join(tdir,'stations.db')
+
+        serial,tserial,nserial = run(mlocfile,server,stationworkers=0)
+        concurrent,tconcurrent,nconcurrent = run(mlocfile,server,stationworkers=mloc.STATION_WORKERS)
+        assert concurrent == serial
+        cold,tcold,ncold = run(mlocfile,server,stationcache=dbfile)
+        warm,twarm,nwarm = run(mlocfile,server,stationcache=dbfile)
+        assert warm == serial
+        local,tlocal,nlocal = run(mlocfile,server,inventory=inventory)
+        assert local == serial
+        server.failrate = FAILRATE
+        failed,tfailed,nfailed = run(mlocfile,server)
+        nchanged = 0
+        for event1,event2 in zip(serial,failed):
+            phases1 = event1['origins'][0]['phases']
+            phases2 = event2['origins'][0]['phases']
+            nchanged += len([i for i in range(0,len(phases1)) if phases1[i]['station'] != phases2[i]['station']])
+
+        nphases = sum([len(event['origins'][0]['phases']) for event in serial])
+        print('Converting %i MLOC events (%i phases, %i stations) with %.0f ms CWB latency:' % (NEVENTS,nphases,
+                                                                                          NSTATIONS,LATENCY*1000))
+        print('lookups while parsing:              %6.2f seconds, %5i requests' % (tserial,nserial))
+        print('lookups before parsing (%2i threads): %6.2f seconds, %5i requests' % (mloc.STATION_WORKERS,
+                                                                                   tconcurrent,nconcurrent))
+        print('empty station cache:                %6.2f seconds, %5i requests' % (tcold,ncold))
+        print('full station cache:                 %6.2f seconds, %5i requests' % (twarm,nwarm))
+        print('station inventory:                  %6.2f seconds, %5i requests' % (tlocal,nlocal))
+        print('%2.0f%% of requests failing:            %6.2f seconds, %5i requests (%i phases not translated)' %
+              (FAILRATE*100,tfailed,nfailed,nchanged))
+    finally:
+        stationdb.CWBHOST,stationdb.CWBPORT = host,port
+        if server is not None:
+            server.stop()
+        shutil.rmtree(tdir)
+
+if __name__ == '__main__':
+    bench_stations()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+import time
+import socket
+import threading
+import tempfile
+import shutil
+import random
+import sqlite3
+from datetime import datetime,timedelta
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#local imports
+from eqconvert.stationdb import StationTranslator,CWBConnectionPool,EpochIndex,CircuitBreaker,TIMERROR
+from eqconvert.cache import StationCache
+from eqconvert.inventory import StationInventory
+from eqconvert import mloc,stationdb
+from cwbsim import CWBSimulator,InventoryResponder
+
+def respond(req):
+    if req.startswith('-delaz'):
+        return ('Station  dist(deg) azimuth\n'
+                'LDBVD       0.16   193.62\n'
+                'PEPSUB      0.00    22.52\n')
+    if req.startswith('-c c -s PEPSUB'):
+        return ('PE PSUB -- BHZ:40.0 Hz\n'
+                'PE PSUB -- HHZ:100.0 Hz\n')
+    if req == '-c c -s ..PSUB -b all':
+        return 'PE PSUB -- HHZ 39.9274 -75.4514 110 0 -90 100 2010-01-01 00:00 - 2030-01-01 00:00\n'
+    if req.startswith('-c c -s ..PSUB -b '):
+        return ('PE PSUB -- HHZ:100.0 Hz\n'
+                'PE PSUB -- HHE:100.0 Hz\n'
+                'PE PSUB -- BHZ:40.0 Hz\n')
+    return ''
+
+def test_pool():
+    server = CWBSimulator(respond).start()
+    try:
+        print('Testing to see if CWB connections are reused...')
+        st = StationTranslator(host=server.host,port=server.port)
+        for i in range(0,10):
+            assert st.getStationByLocation('PSUB',39.9274+i*0.001,-75.4514) == 'PE.PSUB.HHZ.--'
+        assert len(server.requests) == 20
+        assert server.nconnects == 1
+
+        print('Testing to see if closed connections are replaced...')
+        server.keepalive = False
+        server.nconnects = 0
+        for i in range(0,3):
+            assert st.getStationByLocation('PSUB',38.9274+i*0.001,-75.4514) == 'PE.PSUB.HHZ.--'
+        #the first request is sent on the connection left open by the previous requests
+        assert server.nconnects == 5
+
+        print('Testing to see if the number of connections is limited...')
+        server.keepalive = True
+        pool = CWBConnectionPool(host=server.host,port=server.port,size=2)
+        def request():
+            for i in range(0,20):
+                assert pool.request('-delaz 0.2:39.9274:-75.4514 -c r \n').find('PEPSUB') > -1
+        threads = [threading.Thread(target=request) for i in range(0,6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert pool.nconnects <= 2
+        pool.close()
+        st.pool.close()
+    finally:
+        server.stop()
+
+def test_timeout():
+    def slow(req):
+        time.sleep(1.0)
+        return respond(req)
+    server = CWBSimulator(slow).start()
+    try:
+        print('Testing to see if slow CWB requests time out...')
+        st = StationTranslator(host=server.host,port=server.port,timeout=0.2)
+        t1 = time.time()
+        assert st.callCWBServer('-delaz 0.2:39.9274:-75.4514 -c r \n') == ''
+        assert time.time()-t1 < 0.9
+    finally:
+        server.stop()
+
+    print('Testing to see if an unreachable CWB server returns an empty response...')
+    sock = socket.socket()
+    sock.bind(('127.0.0.1',0))
+    port = sock.getsockname()[1]
+    sock.close()
+    st = StationTranslator(host='127.0.0.1',port=port,timeout=0.2)
+    assert st.getStationByLocation('PSUB',39.9274,-75.4514) == 'PSUB'
+
+def test_cache():
+    tdir = tempfile.mkdtemp()
+    server = CWBSimulator(respond).start()
+    try:
+        dbfile = os.path.join(tdir,'stations.db')
+        phasetime = datetime(2011,8,23,17,51,47)
+        print('Testing to see if station lookups are cached between runs...')
+        st = StationTranslator(host=server.host,port=server.port,cache=StationCache(dbfile))
+        assert st.getNSCL('PSUB','Pn',phasetime) == 'PE.PSUB.HHZ.--'
+        assert st.getNSCL('PSUB','Sn',phasetime) == 'PE.PSUB.HHE.--'
+        assert st.getStationByLocation('PSUB',39.9274,-75.4514) == 'PE.PSUB.HHZ.--'
+        assert st.getStationEpoch('PSUB',phasetime) == datetime(2020,1,1,12)
+        assert len(server.requests) > 0
+        cache = StationCache(dbfile)
+        assert cache.count() == {'nscl':2,'epochs':1,'location':1}
+        server.requests = []
+        st = StationTranslator(host=server.host,port=server.port,cache=cache)
+        assert st.getNSCL('PSUB','Pn',phasetime) == 'PE.PSUB.HHZ.--'
+        assert st.getNSCL('PSUB','Sn',phasetime) == 'PE.PSUB.HHE.--'
+        assert st.getStationByLocation('PSUB',39.9274,-75.4514) == 'PE.PSUB.HHZ.--'
+        assert st.getStationEpoch('PSUB',phasetime) == datetime(2020,1,1,12)
+        assert len(server.requests) == 0
+
+        print('Testing to see if station translations can be saved to a dictionary file...')
+        dictfile = os.path.join(tdir,'stations.txt')
+        st.save(dictfile)
+        assert StationTranslator(dictionaryfile=dictfile).stationdict == st.stationdict
+
+        print('Testing to see if cached lookups expire and can be removed...')
+        cache.ttl = 0
+        time.sleep(0.01)
+        assert StationTranslator(host=server.host,port=server.port,cache=cache).getNSCL('PSUB','Pn',phasetime) == 'PE.PSUB.HHZ.--'
+        assert len(server.requests) > 0
+        cache.ttl = None
+        assert cache.clear(kind='location') == 1
+        assert cache.clear(station='PSUB') == 3
+        assert cache.count() == {}
+    finally:
+        server.stop()
+
+    print('Testing to see if failed lookups are not cached...')
+    try:
+        st = StationTranslator(host=server.host,port=server.port,timeout=0.2,cache=cache)
+        assert st.getNSCL('PSUB','Pn',phasetime) == 'PSUB'
+        assert cache.count() == {}
+        cache.close()
+    finally:
+        shutil.rmtree(tdir)
+
+def test_resolve():
+    def slow(req):
+        time.sleep(0.02)
+        if req.startswith('-delaz'):
+            return 'Station  dist(deg) azimuth\n'
+        if req.find(' -b all') > -1 and req.find('..S') > -1:
+            return respond(req.replace('..S%s' % req.split('..S')[1][0:3],'..PSUB'))
+        if req.startswith('-c c -s ..S'):
+            station = req.split()[3][2:]
+            return respond(req.replace(station,'PSUB')).replace('PSUB',station)
+        return ''
+    server = CWBSimulator(slow).start()
+    try:
+        phasetime = datetime(2011,8,23,17,51,47)
+        requests = []
+        for i in range(0,20):
+            station = 'S%03i' % i
+            requests.append((station,'Pn',phasetime,None,None))
+            requests.append((station,'Sn',phasetime,None,None))
+            requests.append((station,'Pg',phasetime,None,None))
+        requests.append(('PSUB','Pn',phasetime,39.9274,-75.4514))
+        print('Testing to see if stations can be looked up concurrently...')
+        st = StationTranslator(host=server.host,port=server.port,poolsize=16)
+        #requests are read from a generator, as mloc does
+        st.resolveStations((request for request in requests),workers=16)
+        nrequests = len(server.requests)
+        assert server.max_active > 1
+        server.max_active = 0
+        st2 = StationTranslator(host=server.host,port=server.port)
+        for station,phasetype,phasetime,lat,lon in requests:
+            nscl = st.getNSCL(station,phasetype,phasetime)
+            assert nscl == st2.getNSCL(station,phasetype,phasetime)
+        assert server.max_active == 1
+        assert st.getNSCL('S001','Pn',phasetime) == 'PE.S001.HHZ.--'
+        assert st.getStationByLocation('PSUB',39.9274,-75.4514) == 'PSUB'
+        #the serial lookups made the same requests, except for the station location search
+        assert len(server.requests) == nrequests*2-1
+    finally:
+        server.stop()
+
+def test_epochs():
+    print('Testing to see if the epoch index finds the same epochs as a linear search...')
+    random.seed(1)
+    t0 = datetime(2000,1,1)
+    epochs = []
+    for i in range(0,200):
+        t1 = t0 + timedelta(days=random.randint(0,5000))
+        epochs.append((t1,t1+timedelta(days=random.randint(1,1000))))
+    #repeated epochs, and epochs with the same start time, overlap the others
+    epochs += epochs[0:50] + [(t1,t2+timedelta(days=100)) for t1,t2 in epochs[50:100]]
+    random.shuffle(epochs)
+    index = EpochIndex(epochs)
+    assert len(index) == len(set(epochs))
+    error = timedelta(seconds=86400*TIMERROR)
+    for i in range(0,500):
+        phasetime = t0 + timedelta(days=random.uniform(-100,7000))
+        #the first matching epoch in response order, as getStationEpoch() used to search for it
+        match = None
+        for t1,t2 in epochs:
+            if phasetime > t1-error and phasetime < t2+error:
+                match = (t1,t2)
+                break
+        assert index.find(phasetime) == match
+
+    def respond(req):
+        if req == '-c c -s ..PSUB -b all':
+            return ('PE PSUB -- BHZ 39.9274 -75.4514 110 0 -90 40 2005-01-01 00:00 - 2009-12-31 23:59\n'
+                    'PE PSUB -- HHZ 39.9274 -75.4514 110 0 -90 100 2010-01-01 00:00 - 2014-01-01 00:00\n'
+                    'PE PSUB -- HHE 39.9274 -75.4514 110 0 -90 100 2010-01-01 00:00 - 2014-01-01 00:00\n')
+        if req.startswith('-c c -s ..PSUB -b 2007'):
+            return 'PE PSUB -- BHZ:40.0 Hz\n'
+        if req.startswith('-c c -s ..PSUB -b 2012'):
+            return ('PE PSUB -- HHZ:100.0 Hz\n'
+                    'PE PSUB -- HHE:100.0 Hz\n')
+        return ''
+    server = CWBSimulator(respond).start()
+    try:
+        print('Testing to see if stations are translated for each epoch...')
+        st = StationTranslator(host=server.host,port=server.port)
+        assert st.getNSCL('PSUB','Pn',datetime(2008,3,1)) == 'PE.PSUB.BHZ.--'
+        assert st.getNSCL('PSUB','Pn',datetime(2011,8,23)) == 'PE.PSUB.HHZ.--'
+        assert st.getNSCL('PSUB','Pn',datetime(2009,6,1)) == 'PE.PSUB.BHZ.--'
+        assert st.getNSCL('PSUB','Sn',datetime(2012,1,1)) == 'PE.PSUB.HHE.--'
+        assert st.getStationEpoch('PSUB',datetime(2013,1,1)) == datetime(2012,1,1,12)
+        assert st.getStationEpoch('PSUB',datetime(2016,1,1)) is None
+        assert len([req for req in server.requests if req.endswith('-b all')]) == 1
+        assert len(server.requests) == 4
+    finally:
+        server.stop()
+
+def test_failed_nscl():
+    state = {'down':False}
+    def flaky(req):
+        if state['down']:
+            time.sleep(0.5)
+        return respond(req)
+    server = CWBSimulator(flaky).start()
+    try:
+        print('Testing to see if NSCL lookups that failed are made again...')
+        breaker = CircuitBreaker(threshold=100)
+        st = StationTranslator(host=server.host,port=server.port,timeout=0.1,breaker=breaker)
+        phasetime = datetime(2011,8,23,17,51,47)
+        state['down'] = True
+        assert st.getNSCL('PSUB','Pn',phasetime) == 'PSUB'
+        assert st.getStats()['failures'] > 0
+        state['down'] = False
+        assert st.getNSCL('PSUB','Pn',phasetime) == 'PE.PSUB.HHZ.--'
+    finally:
+        server.stop()
+
+    def badstation(req):
+        #the NSCL lookup of SLOW makes three slow requests, and BAD requests time out (twice, as the pool retries)
+        if req == '-c c -s ..SLOW -b all':
+            return 'PE SLOW -- HHZ 39.9274 -75.4514 110 0 -90 100 2010-01-01 00:00 - 2030-01-01 00:00\n'
+        if req.endswith('-b all'):
+            return ''
+        if req.find('BAD') > -1:
+            time.sleep(1.0)
+        else:
+            time.sleep(0.25)
+        return ''
+    server = CWBSimulator(badstation).start()
+    try:
+        print('Testing to see if a failed lookup does not affect concurrent lookups of other stations...')
+        breaker = CircuitBreaker(threshold=100)
+        st = StationTranslator(host=server.host,port=server.port,timeout=0.3,breaker=breaker)
+        #the BAD requests fail while the SLOW lookup is running
+        st.resolveStations([('SLOW','Pn',phasetime,None,None),('BAD','Pn',phasetime,None,None)],workers=4)
+        assert st.getStats()['failures'] > 0
+        assert st.stationdict['SLOW-P-20100101T000000'] == 'SLOW'
+        assert 'BAD-P' not in st.stationdict
+    finally:
+        server.stop()
+
+def test_breaker():
+    state = {'down':False}
+    def flaky(req):
+        if state['down']:
+            time.sleep(0.5)
+        return respond(req)
+    tdir = tempfile.mkdtemp()
+    server = CWBSimulator(flaky).start()
+    try:
+        print('Testing to see if requests stop after repeated failures...')
+        breaker = CircuitBreaker(threshold=3,reset=0.5)
+        st = StationTranslator(host=server.host,port=server.port,timeout=0.1,breaker=breaker)
+        state['down'] = True
+        for i in range(0,10):
+            assert st.getStationByLocation('PSUB',39.9274+i*0.001,-75.4514) == 'PSUB'
+        assert len(server.requests) == 3
+        stats = st.getStats()
+        assert stats['misses'] == 10
+        assert stats['failures'] == 3
+        assert stats['rejected'] == 7
+        assert stats['maxlatency'] < 0.5
+
+        print('Testing to see if requests start again when the server recovers...')
+        state['down'] = False
+        time.sleep(0.6)
+        assert st.getStationByLocation('PSUB',39.9274,-75.4514) == 'PE.PSUB.HHZ.--'
+        assert st.getStationByLocation('PSUB',39.9274,-75.4514) == 'PE.PSUB.HHZ.--'
+        stats = st.getStats()
+        assert stats['hits'] == 1
+        assert stats['failures'] == 3
+        assert st.getReport().startswith('Station lookups: 1 hits, 11 misses. CWB requests: 5 (3 failed, 7 rejected)')
+
+        print('Testing to see if slowly answered requests time out...')
+        pool = CWBConnectionPool(host=server.host,port=server.port,timeout=5,deadline=0.2)
+        state['down'] = True
+        t1 = time.time()
+        try:
+            pool.request('-delaz 0.2:39.9274:-75.4514 -c r \n')
+            assert False
+        except socket.timeout:
+            pass
+        assert time.time()-t1 < 0.45
+        state['down'] = False
+
+        print('Testing to see if lookups that found nothing expire sooner...')
+        dbfile = os.path.join(tdir,'stations.db')
+        cache = StationCache(dbfile,negative_ttl=0)
+        st = StationTranslator(host=server.host,port=server.port,cache=cache)
+        phasetime = datetime(2011,8,23,17,51,47)
+        assert st.getStationByLocation('PSUB',39.9274,-75.4514) == 'PE.PSUB.HHZ.--'
+        assert st.getStationByLocation('XXXX',39.9274,-75.4514) == 'XXXX'
+        assert st.getNSCL('XXXX','Pn',phasetime) == 'XXXX'
+        assert cache.count() == {'location':2,'nscl':1,'epochs':1}
+        time.sleep(0.01)
+        server.requests = []
+        st = StationTranslator(host=server.host,port=server.port,cache=cache)
+        assert st.getStationByLocation('PSUB',39.9274,-75.4514) == 'PE.PSUB.HHZ.--'
+        assert len(server.requests) == 0
+        assert st.getStationByLocation('XXXX',39.9274,-75.4514) == 'XXXX'
+        assert st.getNSCL('XXXX','Pn',phasetime) == 'XXXX'
+        assert len(server.requests) > 0
+        cache.close()
+
+        print('Testing to see if caches without negative results can be read...')
+        dbfile = os.path.join(tdir,'old.db')
+        connection = sqlite3.connect(dbfile)
+        connection.execute('''CREATE TABLE stations (kind TEXT, key TEXT, station TEXT, value TEXT, created REAL,
+                              PRIMARY KEY (kind,key))''')
+        connection.execute('INSERT INTO stations VALUES (?,?,?,?,?)',('nscl','PSUB-P','PSUB','PSUB',time.time()-10))
+        connection.commit()
+        connection.close()
+        cache = StationCache(dbfile,negative_ttl=0)
+        assert cache.get('nscl','PSUB-P') == 'PSUB'
+        cache.close()
+    finally:
+        server.stop()
+        shutil.rmtree(tdir)
+
+def test_simulator():
+    inventory = StationInventory(os.path.join(homedir,'data','stations.txt'))
+    server = CWBSimulator(InventoryResponder(inventory)).start()
+    host,port = stationdb.CWBHOST,stationdb.CWBPORT
+    try:
+        stationdb.CWBHOST,stationdb.CWBPORT = server.host,server.port
+        filename = os.path.join(homedir,'data','mloc.comcat')
+        print('Testing to see if MLOC stations are translated using the CWB simulator...')
+        events = list(mloc._iter_parsed_events(filename,stationworkers=0))
+        stations = [phase['station'] for phase in events[0]['origins'][0]['phases']]
+        assert stations == ['SE.URVA.HHZ.--','US.CBN.BHZ.00','LD.SDMD.HHZ.--','LD.SDMD.HHE.--',
+                            'PE.PSUB.HHZ.--','IR.VWCC..']
+        assert len([req for req in server.requests if req.find(' -a ') > -1]) == 1
+
+        print('Testing to see if the CWB simulator agrees with the station inventory...')
+        assert list(mloc._iter_parsed_events(filename,inventory=inventory)) == events
+    finally:
+        stationdb.CWBHOST,stationdb.CWBPORT = host,port
+        server.stop()
+
+if __name__ == '__main__':
+    test_pool()
+    test_timeout()
+    test_cache()
+    test_resolve()
+    test_epochs()
+    test_failed_nscl()
+    test_breaker()
+    test_simulator()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import sys
+import os.path
+
+#hack the path so that I can debug these functions if I need to
+homedir = os.path.dirname(os.path.abspath(__file__)) #where is this script?
+mapiodir = os.path.abspath(os.path.join(homedir,'..'))
+sys.path.insert(0,mapiodir) #put this at the front of the system path, ignoring any installed mapio stuff
+
+#third party imports
+import numpy as np
+from obspy.imaging.beachball import MomentTensor,mt2plane,mt2axes,aux_plane
+
+#local imports
+from eqconvert.tensor import decompose
+
+def get_angle_error(angle1,angle2):
+    return abs((angle1-angle2+180) % 360 - 180)
+
+def test_decompose():
+    print('Testing to see if nodal planes and principal axes match ObsPy...')
+    tensors = np.random.RandomState(1).normal(size=(500,6))
+    results = decompose(*tensors.T)
+    for i in range(0,len(tensors)):
+        mrr,mtt,mpp,mrt,mrp,mtp = tensors[i]
+        mt = MomentTensor(mrr,mtt,mpp,mrt,mrp,mtp,0)
+        np1 = mt2plane(mt)
+        np2 = aux_plane(np1.strike,np1.dip,np1.rake)
+        planes = [(results['strike1'][i],results['dip1'][i],results['rake1'][i]),
+                  (results['strike2'][i],results['dip2'][i],results['rake2'][i])]
+        if get_angle_error(planes[0][0],np1.strike) > 1e-4:
+            planes = planes[::-1]
+        for plane,(strike,dip,rake) in zip(planes,[(np1.strike,np1.dip,np1.rake),np2]):
+            assert max([get_angle_error(a1,a2) for a1,a2 in zip(plane,(strike,dip,rake))]) < 1e-4
+        for name,axis in zip(['t','n','p'],mt2axes(mt)):
+            np.testing.assert_allclose(results[name+'value'][i],axis.val,rtol=1e-10)
+            np.testing.assert_allclose(results[name+'plunge'][i],axis.dip,atol=1e-6)
+            if axis.dip < 89.9:
+                assert get_angle_error(results[name+'azimuth'][i],axis.strike) < 1e-6
+
+    print('Testing to see if double couple and CLVD fractions are correct...')
+    #pure double couple, pure CLVD, and an explosion plus a double couple
+    results = decompose([0.0,2.0,1.0],[0.0,-1.0,1.0],[0.0,-1.0,1.0],[1.0,0.0,1.0],[0.0,0.0,0.0],[0.0,0.0,0.0])
+    np.testing.assert_allclose(results['doublecouple'],[1.0,0.0,1.0],atol=1e-12)
+    np.testing.assert_allclose(results['clvd'],[0.0,1.0,0.0],atol=1e-12)
+    np.testing.assert_allclose(results['m0'],[1.0,1.5,1.0],atol=1e-12)
+    np.testing.assert_allclose(sorted([results['dip1'][0],results['dip2'][0]]),[0.0,90.0],atol=1e-5)
+
+if __name__ == '__main__':
+    test_decompose()